@@ -39,6 +39,7 @@ setup(
         #   4 - Beta
         #   5 - Production/Stable
         "Development Status :: 5 - Production/Stable",
+        "Framework :: Pytest",
         "Intended Audience :: Developers",
         "License :: OSI Approved :: MIT License",
         "Operating System :: Unix",
@@ -69,6 +70,7 @@ setup(
     long_description=long_description,
     packages=find_packages("src"),
     package_dir={"": "src"},
+
     py_modules=[os.path.splitext(os.path.basename(path))[0]
                                     for path in glob.glob("src/*.py")],
 )
@@ -1,4 +1,6 @@
 
+import sys
+
 __all__ = [
           "script_run",
           "sys_path",
@@ -6,11 +8,23 @@ __all__ = [
           "init",
           "locals_to_globals",
           "clear_locals_from_globals",
+          "globals_scope",
+          "globals_scope_fixture",
+          "evict_tracked_globals",
+          "retained_globals_report",
           "autoimport",
           "auto_import",
           "PytestHelperException",
           "LocalsToGlobalsError",
           "unindent",
+          "unindent_lines",
+          "assert_text_equal",
+          "read_results_files",
+          "merge_results_files",
+          "merge_shard_results",
+          "update_perf_baseline",
+          "analyze_sys_path",
+          "count_import_misses",
           ]
 
 from pytest_helper.pytest_helper_main import (
@@ -20,12 +34,31 @@ from pytest_helper.pytest_helper_main import (
         init,
         locals_to_globals,
         clear_locals_from_globals,
+        globals_scope,
+        globals_scope_fixture,
+        evict_tracked_globals,
+        retained_globals_report,
         unindent,
+        unindent_lines,
+        assert_text_equal,
         autoimport,
         )
 
+from pytest_helper.result_reporter import (
+        read_results_files,
+        merge_results_files,
+        )
+
+from pytest_helper.sharding import merge_shard_results
+from pytest_helper.perf_gate import update_perf_baseline
+from pytest_helper.sys_path_tools import analyze_sys_path, count_import_misses
+
 auto_import = autoimport # Allow this alias for autoimport.
 
+if sys.version_info >= (3, 6): # The async version needs async generators.
+    from pytest_helper.async_runner import script_run_async
+    __all__.append("script_run_async")
+
 from pytest_helper.global_settings import (
         PytestHelperException,
         LocalsToGlobalsError,
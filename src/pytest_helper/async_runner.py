@@ -0,0 +1,104 @@
+# -*- coding: utf-8 -*-
+"""
+Description
+-----------
+
+This module contains the asyncio version of `script_run`, which runs pytest in
+a subprocess so that the event loop is not blocked while the tests run.  It
+requires Python 3.6 or later and is only imported by the package on those
+versions.
+
+..  Copyright (c) 2015 by Allen Barker.
+    License: MIT, see LICENSE for more details.
+
+.. default-role:: code
+
+"""
+
+import sys
+import asyncio
+
+from pytest_helper.pytest_helper_main import (get_calling_module_info,
+                                              process_script_run_args)
+from pytest_helper.result_reporter import subprocess_env, parse_record_line
+
+# The maximum length of a line of pytest output read from the subprocess.
+SUBPROCESS_LINE_LIMIT = 2**20
+
+def script_run_async(testfile_paths=None, self_test=False, pytest_args=None,
+                     pyargs=False, calling_mod_name=None, calling_mod_path=None,
+                     python_executable=None, level=2):
+    """Run pytest on the specified test files in a subprocess, without blocking
+    the asyncio event loop.  The arguments `testfile_paths`, `self_test`,
+    `pytest_args`, `pyargs`, `calling_mod_name`, `calling_mod_path`, and
+    `level` are processed exactly as in `script_run`, including the overrides
+    from config files.  Unlike `script_run`, the tests are always run (not
+    only from a script) and `sys.exit` is never called.
+
+    The returned object can be awaited to run the tests to completion, giving
+    pytest's exit code::
+
+       exit_code = await pytest_helper.script_run_async("test")
+
+    It can also be used as an async iterator, which yields the result record
+    of each test as soon as that test finishes::
+
+       async for record in pytest_helper.script_run_async("test"):
+           print(record["nodeid"], record["outcome"])
+
+    Each record is a dict with the keys `nodeid`, `when`, `outcome`,
+    `duration`, and `module` (the name of the calling module).  After the
+    iteration finishes the exit code is available as the `returncode`
+    attribute.  The regular terminal output of pytest is discarded.
+
+    The `python_executable` argument is the Python interpreter to run pytest
+    with.  The default is the current interpreter, `sys.executable`."""
+    mod_info = get_calling_module_info(module_name=calling_mod_name,
+                                       module_path=calling_mod_path, level=level)
+    calling_mod_name, calling_mod, calling_mod_path, calling_mod_dir, in_pkg = mod_info
+
+    pytest_arglist, testfile_paths = process_script_run_args(testfile_paths,
+                                  self_test, pytest_args, pyargs, calling_mod,
+                                  calling_mod_path, calling_mod_dir)
+
+    cmd = [python_executable or sys.executable, "-m", "pytest",
+           "-p", "pytest_helper_reporter", "--pytest-helper-stream",
+           "--pytest-helper-module", calling_mod_name]
+    return AsyncScriptRun(cmd + pytest_arglist + testfile_paths)
+
+class AsyncScriptRun(object):
+    """The awaitable and async-iterable object returned by `script_run_async`.
+    The subprocess is started when it is first awaited or iterated over."""
+
+    def __init__(self, cmd):
+        self.cmd = cmd
+        self.returncode = None
+
+    async def iter_records(self):
+        """Run pytest in a subprocess and yield each result record."""
+        proc = await asyncio.create_subprocess_exec(*self.cmd,
+                                 stdout=asyncio.subprocess.PIPE,
+                                 env=subprocess_env(), limit=SUBPROCESS_LINE_LIMIT)
+        try:
+            async for line in proc.stdout:
+                record = parse_record_line(line.decode("utf-8", "replace"))
+                if record is not None:
+                    yield record
+            self.returncode = await proc.wait()
+        finally:
+            if proc.returncode is None: # Iteration was abandoned or cancelled.
+                proc.kill()
+                await proc.wait()
+
+    def __aiter__(self):
+        return self.iter_records()
+
+    async def run(self):
+        """Run pytest to completion and return its exit code."""
+        async for record in self.iter_records():
+            pass
+        return self.returncode
+
+    def __await__(self):
+        return self.run().__await__()
+
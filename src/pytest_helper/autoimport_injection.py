@@ -0,0 +1,145 @@
+# -*- coding: utf-8 -*-
+"""
+Description
+-----------
+
+This module contains the code used by the plugin `pytest_helper.plugin` to
+inject the `autoimport` names into the test modules as they are collected,
+when `autoimport_at_collection = True` is set in a config file.  The names
+(the `autoimport` defaults, less any `autoimport_skip` names from the config
+files) are resolved once for each directory, into a dict called the bundle.
+While pytest imports a test module, a finder at the front of `sys.meta_path`
+wraps the loader of the module, and the bundle is put in the module's
+namespace with one `dict.update` just before the module is executed.
+
+The module's namespace is empty at that point, so nothing is clobbered, and
+any definitions of the same names made by the module replace the injected
+values.  Calls to `autoimport` from an injected module then return at once
+(except for removing any names in their `skip` argument).
+
+..  Copyright (c) 2015 by Allen Barker.
+    License: MIT, see LICENSE for more details.
+
+.. default-role:: code
+
+"""
+
+from __future__ import print_function, division, absolute_import
+import sys
+import os
+
+from pytest_helper.global_settings import NAME_OF_PYTEST_HELPER_PER_MODULE_INFO_DICT
+
+# The key of the injected bundle in the per-module info dict.
+AUTOIMPORTED_KEY = "autoimported"
+
+# The bundles, keyed on the directories, saved with the effective configs
+# they were made from so that they are remade when the config changes.
+bundle_cache = {}
+
+def get_autoimport_bundle(dirname, effective_config, defaults):
+    """Return the dict of names to inject into the modules in `dirname`, for
+    the `EffectiveConfig` of the directory.  These are the `(name, value)`
+    pairs in `defaults` without the names in the `autoimport_skip` setting."""
+    cached = bundle_cache.get(dirname)
+    if cached is not None and cached[0] is effective_config:
+        return cached[1]
+    skip = effective_config.get("autoimport_skip", None) or ()
+    bundle = dict((name, value) for name, value in defaults if name not in skip)
+    bundle_cache[dirname] = (effective_config, bundle)
+    return bundle
+
+def inject_bundle(module_dict, bundle):
+    """Put the names in `bundle` into the module namespace `module_dict`, and
+    save the bundle in the module's per-module info dict."""
+    module_dict.update(bundle)
+    module_dict.setdefault(NAME_OF_PYTEST_HELPER_PER_MODULE_INFO_DICT,
+                           {})[AUTOIMPORTED_KEY] = bundle
+
+def get_injected_bundle(module_dict):
+    """Return the bundle injected into the module namespace `module_dict`, or
+    `None` if nothing was injected."""
+    module_info_dict = module_dict.get(NAME_OF_PYTEST_HELPER_PER_MODULE_INFO_DICT)
+    return module_info_dict.get(AUTOIMPORTED_KEY) if module_info_dict else None
+
+class InjectingLoader(object):
+    """A wrapper around the loader of a module spec which injects `bundle`
+    into the module just before it is executed.  Other attributes are
+    delegated to the wrapped loader, which is put back on the module after it
+    is executed."""
+
+    def __init__(self, loader, bundle):
+        self.loader = loader
+        self.bundle = bundle
+
+    def __getattr__(self, name):
+        return getattr(self.loader, name)
+
+    def create_module(self, spec):
+        create_module = getattr(self.loader, "create_module", None)
+        return create_module(spec) if create_module else None
+
+    def exec_module(self, module):
+        inject_bundle(vars(module), self.bundle)
+        try:
+            self.loader.exec_module(module)
+        finally:
+            spec = getattr(module, "__spec__", None)
+            if spec is not None and spec.loader is self:
+                spec.loader = self.loader
+            if getattr(module, "__loader__", None) is self:
+                module.__loader__ = self.loader
+
+class AutoimportInjector(object):
+    """A meta path finder which finds modules with the finders after it on
+    `sys.meta_path`, and wraps the loader of the module whose file is
+    `target_path` to inject `bundle` into it.  The finder is only on
+    `sys.meta_path` while a test module is being collected (see `inject`)."""
+
+    def __init__(self):
+        self.target_path = None
+        self.bundle = None
+        self.finding = False
+
+    def find_spec(self, fullname, path=None, target=None):
+        if self.target_path is None or self.finding:
+            return None
+        self.finding = True
+        try:
+            for finder in sys.meta_path:
+                if finder is self or not hasattr(finder, "find_spec"):
+                    continue
+                if target is None:
+                    spec = finder.find_spec(fullname, path)
+                else:
+                    spec = finder.find_spec(fullname, path, target)
+                if spec is not None:
+                    break
+            else:
+                return None
+        finally:
+            self.finding = False
+        origin = getattr(spec, "origin", None)
+        if (spec.loader is None or not hasattr(spec.loader, "exec_module")
+                or not origin or os.path.realpath(origin) != self.target_path):
+            return spec
+        spec.loader = InjectingLoader(spec.loader, self.bundle)
+        self.target_path = None # Done; the later imports are not looked at.
+        return spec
+
+    def inject(self, target_path, bundle):
+        """Get ready to inject `bundle` into the module with the file
+        `target_path` when it is imported, by putting this finder at the front
+        of `sys.meta_path`.  Call `finish` after the import."""
+        self.target_path = os.path.realpath(target_path)
+        self.bundle = bundle
+        if self not in sys.meta_path:
+            sys.meta_path.insert(0, self)
+
+    def finish(self):
+        """Remove this finder from `sys.meta_path`."""
+        self.target_path = self.bundle = None
+        if self in sys.meta_path:
+            sys.meta_path.remove(self)
+
+autoimport_injector = AutoimportInjector()
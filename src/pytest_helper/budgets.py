@@ -0,0 +1,157 @@
+# -*- coding: utf-8 -*-
+"""
+Description
+-----------
+
+This module contains the code for running test files with wall-clock time and
+memory (RSS) budgets, used by the `time_budget` and `rss_budget` options of
+`script_run`.  Each test file is run by pytest in its own subprocess, which
+is watched by the parent process.  If a file goes over a budget, the stacks
+of all the threads of the subprocess are dumped with `faulthandler` (on POSIX
+systems), the subprocess is killed, the file is recorded as over budget, and
+the run continues with the next file.
+
+The test results of the subprocesses are streamed back to the parent with
+the plugin `pytest_helper_reporter`, so they can be passed to the `on_result`
+function and saved in the results file as usual.  The memory use is read
+from `/proc`, so the RSS budget is only enforced on Linux.
+
+..  Copyright (c) 2015 by Allen Barker.
+    License: MIT, see LICENSE for more details.
+
+.. default-role:: code
+
+"""
+
+from __future__ import print_function, division, absolute_import
+import sys
+import os
+import time
+import signal
+import fnmatch
+import threading
+import subprocess
+
+from pytest_helper.result_reporter import subprocess_env, parse_record_line
+
+# The time between the checks of the subprocess, in seconds.
+BUDGET_POLL_INTERVAL = 0.05
+
+# The time to wait for the stack dump before the subprocess is killed outright.
+STACK_DUMP_WAIT = 5.0
+
+# The time to wait for the rest of the output after the subprocess exits,
+# before any processes it started which still hold its stdout are killed.
+OUTPUT_DRAIN_WAIT = 5.0
+
+def get_file_budget(budget, path):
+    """Return the budget for the test file `path` out of `budget`, which is
+    either a single number for all files, or a dict mapping glob patterns to
+    numbers.  The first pattern (in the order of the dict) which matches the
+    file's basename or full path is used.  Returns `None` for no budget."""
+    if not isinstance(budget, dict):
+        return budget
+    for pattern, value in budget.items():
+        if fnmatch.fnmatch(os.path.basename(path), pattern) or fnmatch.fnmatch(path, pattern):
+            return value
+    return None
+
+def get_rss_megabytes(pid):
+    """Return the resident set size of process `pid` in megabytes, or `None`
+    if it cannot be read (on systems without `/proc`, or after it exits)."""
+    try:
+        with open("/proc/{0}/status".format(pid)) as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) / 1024 # The value is in kB.
+    except (IOError, OSError, ValueError):
+        pass
+    return None
+
+def kill_process_group(proc):
+    """Kill the process group of the subprocess `proc` (started in a new
+    session), which holds any processes started by the tests.  On systems
+    without process groups only `proc` itself is killed."""
+    if os.name == "posix":
+        try:
+            os.killpg(proc.pid, signal.SIGKILL)
+        except OSError:
+            pass # The group is already gone.
+    elif proc.poll() is None:
+        proc.kill()
+
+def dump_stacks_and_kill(proc):
+    """Make the subprocess `proc` (started with `-X faulthandler`) dump the
+    stacks of its threads to stderr, by sending it `SIGABRT`, and then kill
+    it along with any processes it started."""
+    if hasattr(signal, "SIGABRT") and os.name == "posix":
+        try:
+            os.kill(proc.pid, signal.SIGABRT)
+            proc.wait(timeout=STACK_DUMP_WAIT)
+        except (OSError, subprocess.TimeoutExpired):
+            pass
+    kill_process_group(proc)
+    proc.wait()
+
+def run_file_with_budgets(cmd, time_budget=None, rss_budget=None, handle_record=None,
+                          output=None, env=None):
+    """Run the pytest command `cmd` (a list, which should load the result
+    reporter plugin with `--pytest-helper-stream`) in a subprocess, enforcing
+    `time_budget` (in seconds) and `rss_budget` (in megabytes).  Each result
+    record is passed to `handle_record`, and the other lines of output are
+    written to the stream `output` (by default `sys.stdout`).  Returns the
+    tuple `(exit_code, overrun)`, where `overrun` is `None` or a message
+    saying which budget was exceeded.  The environment of the subprocess is
+    `env`, by default that of `result_reporter.subprocess_env`.
+
+    The subprocess is started in a new session, so that the processes started
+    by the tests can be killed along with it.  Any of them still holding its
+    stdout a little while after it exits are killed, so they cannot keep the
+    run waiting."""
+    output = output or sys.stdout
+    proc = subprocess.Popen(cmd, stdout=subprocess.PIPE, env=env or subprocess_env(),
+                            start_new_session=(os.name == "posix"))
+
+    def read_output():
+        for line in iter(proc.stdout.readline, b""):
+            line = line.decode("utf-8", "replace")
+            record = parse_record_line(line)
+            if record is None:
+                output.write(line)
+            elif handle_record:
+                handle_record(record)
+        proc.stdout.close()
+
+    reader = threading.Thread(target=read_output, name="pytest_helper_budget_reader")
+    reader.daemon = True
+    reader.start()
+
+    start_time = time.time()
+    overrun = None
+    while proc.poll() is None:
+        elapsed = time.time() - start_time
+        if time_budget is not None and elapsed > time_budget:
+            overrun = "wall-clock budget of {0}s exceeded".format(time_budget)
+        elif rss_budget is not None:
+            rss = get_rss_megabytes(proc.pid)
+            if rss is not None and rss > rss_budget:
+                overrun = "RSS budget of {0} MB exceeded ({1:.0f} MB)".format(
+                                                                 rss_budget, rss)
+        if overrun:
+            dump_stacks_and_kill(proc)
+            break
+        time.sleep(BUDGET_POLL_INTERVAL)
+    reader.join(OUTPUT_DRAIN_WAIT)
+    if reader.is_alive(): # Processes started by the tests hold the pipe.
+        kill_process_group(proc)
+        reader.join(OUTPUT_DRAIN_WAIT)
+    return proc.wait(), overrun
+
+def overrun_record(testfile, overrun, duration, calling_mod_name=None):
+    """Return the result record for a test file which went over its budget."""
+    return {"nodeid": testfile,
+            "when": "budget",
+            "outcome": "failed",
+            "duration": duration,
+            "module": calling_mod_name,
+            "message": overrun}
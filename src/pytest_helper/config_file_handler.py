@@ -33,6 +33,8 @@ import inspect
 import sys
 import os
 import ast
+import threading
+import time
 try:
     from configparser import ConfigParser
 except ImportError: # Must be Python 2; use old names.
@@ -44,6 +46,9 @@ from pytest_helper.global_settings import (
         FAIL_ON_MISSING_CONFIG, # Raise exception if config enabled but not found.
         CONFIG_SECTION_STRING, # Label for active section of the config file.
         NAME_OF_PYTEST_HELPER_PER_MODULE_INFO_DICT)
+from pytest_helper import global_settings # For settings which can change at runtime.
+
+monotonic_time = getattr(time, "monotonic", time.time) # No monotonic in Python 2.
 
 #
 # Config file locating and reading functions.
@@ -56,36 +61,6 @@ def get_importing_module_filename(level=2):
                       inspect.getouterframes(inspect.currentframe())[level][0])[0]
     return os.path.abspath(module_filename)
 
-def get_config_file_pathname(calling_mod_dir):
-    """Get the full pathname of the configuration file, returning `None` if
-    nothing was found.  Go up the directory tree starting at
-    `calling_mod_dir`, taking the first file found with an allowed name.  If
-    no package are encountered by the top-level root directory, return
-    `None`."""
-    stop_at_package_top = False # Whether to stop search after package top.
-
-    dirname = calling_mod_dir # Start looking in calling module's dir.
-
-    # Go up the directory tree.
-    in_package = False
-    while True:
-        if os.path.exists(os.path.join(dirname, "__init__.py")):
-            in_package = True
-
-        for config_name in CONFIG_FILE_NAMES:
-            config_path = os.path.join(dirname, config_name)
-            if os.path.exists(config_path):
-                return config_path
-
-        dirname, name = os.path.split(dirname) # Go up one dir.
-
-        if not name: # If no subdir name then we were at root dir.
-            return None
-        if stop_at_package_top and in_package and not os.path.exists(
-                                   os.path.join(dirname, "__init__.py")):
-            return None # Past the top of a package, nothing found.
-
-
 def read_and_eval_config_file(filename):
     """Return a dict of dicts containing a dict of parameter arguments for each
     section of the config file, with the evaluated value."""
@@ -115,74 +90,201 @@ def read_and_eval_config_file(filename):
     return config_dict
 
 
-# Note the below cache precludes dynamically changing the config file, which
-# seems like a bad idea to allow anyway but might have uses.
-config_dict_cache = {} # Cache config dicts by their full filenames (save space and time).
+# Cache config dicts by their full filenames (save space and time).  The values
+# are (mtime, config_dict) tuples, and a file is re-read if its mtime changes.
+config_dict_cache = {}
+
+# Lock for the check-then-read of config_dict_cache, so that concurrent threads
+# never read the same file twice or end up with different dicts for one file.
+config_dict_cache_lock = threading.Lock()
+
+def get_cached_config_dict(config_file_path, mtime=None):
+    """Return the evaluated config dict for the file `config_file_path`, reading
+    the file only if it is not already in `config_dict_cache` with the same
+    modification time `mtime`.  Safe to call from multiple threads."""
+    with config_dict_cache_lock:
+        cached = config_dict_cache.get(config_file_path)
+        if cached is None or cached[0] != mtime:
+            cached = (mtime, read_and_eval_config_file(config_file_path))
+            config_dict_cache[config_file_path] = cached
+        return cached[1]
+
+def get_mtime(path):
+    """Return the modification time of the file `path`, or `None` if it does
+    not exist."""
+    try:
+        return os.stat(path).st_mtime
+    except OSError:
+        return None
+
+def invalidate_config_caches():
+    """Clear all the cached config files and effective configs, including the
+    ones saved for each module, so the config files are searched for and read
+    again on the next lookup.  This is not needed unless the automatic checks
+    are turned off by setting `CONFIG_RECHECK_INTERVAL` to `None` in the
+    `global_settings` module."""
+    with config_dict_cache_lock:
+        config_dict_cache.clear()
+        effective_config_cache.clear()
+        config_cache_generation[0] += 1
 
-def get_config(calling_mod, calling_mod_dir, disable=False):
-    """Return the configuration corresponding to the module `calling_mod`.
-    Return an empty dict if no config is found.  Caches its values in the
-    namespace of the modules (in the pytest-helper data dict).  Also caches
-    config files based on their pathnames.  If nothing is found in the cache,
-    it looks for the file and reads it in if possible.  If `disable` is set for
-    a module then `get_config` will always return an empty config dict for the
-    given module and skip searching for the file."""
-
-    # TODO, maybe: Could speed up even more by using a cache on each pathname
-    # up to the config file.  A bit more space but faster.
-
-    if not hasattr(calling_mod, NAME_OF_PYTEST_HELPER_PER_MODULE_INFO_DICT):
-        setattr(calling_mod, NAME_OF_PYTEST_HELPER_PER_MODULE_INFO_DICT, {})
-    module_info_dict = getattr(calling_mod, NAME_OF_PYTEST_HELPER_PER_MODULE_INFO_DICT)
-
-    if "config_data_dict" not in module_info_dict:
-        # Search for a file if the key is not set.
-        config_file_path = get_config_file_pathname(calling_mod_dir)
-
-        if config_file_path in config_dict_cache: # Look in the config dict cache.
-            config_data_dict = config_dict_cache[config_file_path]
-
-        elif config_file_path: # Some path was set.
-            config_data_dict = read_and_eval_config_file(config_file_path)
-            config_dict_cache[config_file_path] = config_data_dict
-        else: # Returned None from config_file_path.
-            if FAIL_ON_MISSING_CONFIG:
-                raise PytestHelperException("Config file specified but"
-                        " not found in the directory tree.  At least an"
-                        " empty file must be present.")
-            else:
-                config_data_dict = {} # Assume it is empty if not found and no fail.
-        module_info_dict["config_data_dict"] = config_data_dict
+#
+# Effective configs, merged from all the config files up the directory tree.
+#
+
+class EffectiveConfig(object):
+    """The immutable, merged configuration which applies in a directory.  The
+    `sections` attribute is a dict of dicts with the merged settings of each
+    section of the config files.  The settings of the active pytest-helper
+    section can be read directly as attributes (raising `AttributeError` if
+    not set), or with the `get` method, which takes a default.  The
+    `config_files` attribute is the tuple of config files that were merged,
+    from the top directory down."""
+    __slots__ = ("sections", "settings", "config_files")
+
+    def __init__(self, sections, config_files):
+        object.__setattr__(self, "sections", sections)
+        object.__setattr__(self, "settings", sections.get(CONFIG_SECTION_STRING, {}))
+        object.__setattr__(self, "config_files", tuple(config_files))
+
+    def __getattr__(self, name):
+        # Only called for names which are not slots.
+        try:
+            return self.settings[name]
+        except KeyError:
+            raise AttributeError("No config setting named '{0}'.".format(name))
+
+    def __setattr__(self, name, value):
+        raise AttributeError("EffectiveConfig objects are immutable.")
+
+    def get(self, config_key, default=None):
+        """Return the setting `config_key`, or `default` if it is not set."""
+        return self.settings.get(config_key, default)
+
+    def merged_with(self, config_dict, config_file):
+        """Return a new `EffectiveConfig` with the sections of `config_dict`
+        (read from `config_file`) overriding the settings in this one."""
+        sections = dict((section, dict(subdict))
+                        for section, subdict in self.sections.items())
+        for section, subdict in config_dict.items():
+            sections.setdefault(section, {}).update(subdict)
+        return EffectiveConfig(sections, self.config_files + (config_file,))
+
+EMPTY_EFFECTIVE_CONFIG = EffectiveConfig({}, ())
+
+# Cache the effective config of each directory.  The values are tuples
+#    (effective_config, config_file_mtimes, parent_config, check_time)
+# where config_file_mtimes has the mtimes (or None) of the possible config
+# files in the directory itself and parent_config is the effective config of
+# the parent directory which was merged in.
+effective_config_cache = {}
+
+# Incremented by invalidate_config_caches, to invalidate the per-module caches.
+config_cache_generation = [0]
+
+def get_dir_effective_config(dirname):
+    """Return the `EffectiveConfig` for the directory `dirname`.  This merges
+    all the config files from the root directory down to `dirname`, with files
+    lower in the tree overriding the settings of files higher up.  A config
+    file which sets `config_root = True` in its pytest-helper section stops
+    the search, so files above it are ignored.  The result is cached for each
+    directory, so every directory in the tree is only examined once.
+
+    If `CONFIG_RECHECK_INTERVAL` in the `global_settings` module is not `None`
+    then the cached config of a directory is rechecked once that many seconds
+    have passed since the last check.  The config files in the directory are
+    checked with `stat` (so each file is checked at most once per interval)
+    and the parent directory is rechecked in the same way.  The config is only
+    re-merged, and a file only re-read, if something changed."""
+    recheck_interval = global_settings.CONFIG_RECHECK_INTERVAL
+    now = monotonic_time()
+    cached = effective_config_cache.get(dirname)
+    if cached is not None and (recheck_interval is None
+                               or now - cached[3] < recheck_interval):
+        return cached[0]
+
+    config_file_paths = [os.path.join(dirname, config_name)
+                         for config_name in CONFIG_FILE_NAMES]
+    config_file_mtimes = tuple(get_mtime(path) for path in config_file_paths)
+
+    # Use the first config file which exists, in the order of CONFIG_FILE_NAMES.
+    config_file_path, config_dict = None, {}
+    for path, mtime in zip(config_file_paths, config_file_mtimes):
+        if mtime is not None:
+            config_file_path = path
+            config_dict = get_cached_config_dict(path, mtime)
+            break
+
+    parent_dir, name = os.path.split(dirname)
+    if not name or config_dict.get(CONFIG_SECTION_STRING, {}).get("config_root"):
+        parent_config = EMPTY_EFFECTIVE_CONFIG # At the root dir, or stopped.
+    else:
+        parent_config = get_dir_effective_config(parent_dir)
+
+    if (cached is not None and cached[1] == config_file_mtimes
+                           and cached[2] is parent_config):
+        effective_config = cached[0] # Nothing changed, keep the same object.
+    elif config_file_path:
+        effective_config = parent_config.merged_with(config_dict, config_file_path)
     else:
-        config_data_dict = module_info_dict["config_data_dict"]
+        effective_config = parent_config # Nothing new, so share the parent's object.
 
-    if "config_disabled" not in config_data_dict:
-        config_data_dict["config_disabled"] = False
+    cache_entry = (effective_config, config_file_mtimes, parent_config, now)
+    if cached is None:
+        # Uses setdefault for an atomic insert-if-absent, in case of threads.
+        cache_entry = effective_config_cache.setdefault(dirname, cache_entry)
+    else:
+        effective_config_cache[dirname] = cache_entry
+    return cache_entry[0]
+
+def get_effective_config(calling_mod, calling_mod_dir, disable=False):
+    """Return the `EffectiveConfig` corresponding to the module `calling_mod`.
+    It is cached in the namespace of the module (in the pytest-helper data
+    dict).  When config files are rechecked (see `get_dir_effective_config`)
+    the saved config is used until the recheck of the module's directory is
+    due, and the directory is looked up again after that.  If `disable` is set
+    for a module then this function will always return an empty config for
+    the given module, and no files are searched for."""
+    # Uses setdefault for an atomic insert-if-absent, in case of threads.
+    module_info_dict = vars(calling_mod).setdefault(
+                                 NAME_OF_PYTEST_HELPER_PER_MODULE_INFO_DICT, {})
 
     # Disable config files for the module if that flag is set.
     if disable:
-        config_data_dict["config_disabled"] = True
-
-    # If module not enabled (by current or prev call with enable=True) return empty.
-    if config_data_dict["config_disabled"]:
-        return {}
+        module_info_dict["config_disabled"] = True
+    if module_info_dict.get("config_disabled"):
+        return EMPTY_EFFECTIVE_CONFIG
+
+    # The saved value is a tuple (config_cache_generation, effective_config,
+    # check_time), where check_time is that of the directory's cached config.
+    saved = module_info_dict.get("effective_config")
+    recheck_interval = global_settings.CONFIG_RECHECK_INTERVAL
+    if (saved is not None and saved[0] == config_cache_generation[0]
+            and (recheck_interval is None
+                 or monotonic_time() - saved[2] < recheck_interval)):
+        return saved[1]
+
+    generation = config_cache_generation[0]
+    effective_config = get_dir_effective_config(calling_mod_dir)
+    if not effective_config.config_files and FAIL_ON_MISSING_CONFIG:
+        raise PytestHelperException("Config file specified but"
+                " not found in the directory tree.  At least an"
+                " empty file must be present.")
+    cached = effective_config_cache.get(calling_mod_dir)
+    check_time = cached[3] if cached is not None else monotonic_time()
+    module_info_dict["effective_config"] = (generation, effective_config, check_time)
+    return effective_config
 
-    return config_data_dict
+def get_config(calling_mod, calling_mod_dir, disable=False):
+    """Return the configuration corresponding to the module `calling_mod`, as
+    a dict of dicts with the merged settings of each section of the config
+    files.  Return an empty dict if no config is found.  See
+    `get_effective_config`, which this function calls."""
+    return get_effective_config(calling_mod, calling_mod_dir, disable).sections
 
 def get_config_value(config_key, default, calling_mod, calling_mod_dir):
     """Return the config value from the config file corresponding to the key
     `config_key`.  Return the value `default` if no config value is set.
     This is called in the main functions to get defaults."""
-    config_dict = get_config(calling_mod, calling_mod_dir)
-
-    if CONFIG_SECTION_STRING in config_dict:
-        config_dict = config_dict[CONFIG_SECTION_STRING]
-    else:
-        return default
-
-    if config_key in config_dict:
-        return config_dict[config_key]
-    else:
-        return default
-
+    return get_effective_config(calling_mod, calling_mod_dir).get(config_key, default)
 
@@ -18,6 +18,12 @@ CONFIG_FILE_NAMES = ["pytest_helper.ini"] # List of filenames, searched for in o
 FAIL_ON_MISSING_CONFIG = False # Raise exception if config file enabled but not found.
 CONFIG_SECTION_STRING = "pytest_helper" # Label for active section of the config file.
 
+# Seconds between checks of the modification times of the config files, so
+# changed, new, or deleted config files are noticed by long-running processes.
+# Each config file path is checked at most once per interval.  Setting it to
+# None turns off the checks; the config files are then only read once.
+CONFIG_RECHECK_INTERVAL = 1.0
+
 # Pytest-helper saves module-specific information in a dict as a special
 # attribute of the modules themselves.  This is the name that is used, saved in
 # the modules' namespaces.  Currently not forced to be unique, but maybe should be.
@@ -0,0 +1,392 @@
+# -*- coding: utf-8 -*-
+"""
+Description
+-----------
+
+This module contains the code for recording which source lines each test
+executes (an impact map), and for using that map to select only the tests
+which are affected by the changes in a git working tree.  It is used by the
+`record_impact` and `select` options of `script_run`.
+
+The lines are recorded with `sys.monitoring` on Python 3.12 and later, and
+with `sys.settrace` on earlier versions.  With `sys.monitoring` only the code
+under the recorded directory gets line events, and each of its lines only
+triggers a callback the first time it runs in each test.  Other code costs a
+single callback in total.  The map is stored in a SQLite
+database, with one row per test and source file holding the executed lines as
+a compact string of line ranges (like "1-5,8,10-12").
+
+..  Copyright (c) 2015 by Allen Barker.
+    License: MIT, see LICENSE for more details.
+
+.. default-role:: code
+
+"""
+
+from __future__ import print_function, division, absolute_import
+import sys
+import os
+import re
+import time
+import sqlite3
+import threading
+import weakref
+import subprocess
+
+from pytest_helper.global_settings import PytestHelperException
+from pytest_helper import sharding
+
+try:
+    import pytest
+except ImportError:
+    import py.test as pytest # Old pytest versions, before 3.0.
+
+DEFAULT_IMPACT_DB_NAME = ".pytest_helper_impact.db"
+
+#
+# Line ranges.
+#
+
+def lines_to_ranges_string(line_numbers):
+    """Convert an iterable of line numbers to a compact string of sorted line
+    ranges, such as "1-5,8,10-12"."""
+    ranges = []
+    for line in sorted(line_numbers):
+        if ranges and line == ranges[-1][1] + 1:
+            ranges[-1][1] = line
+        else:
+            ranges.append([line, line])
+    return ",".join(str(start) if start == end else "{0}-{1}".format(start, end)
+                    for start, end in ranges)
+
+def ranges_string_to_ranges(ranges_string):
+    """Convert a string of line ranges back to a list of `(start, end)` tuples."""
+    ranges = []
+    for item in ranges_string.split(","):
+        if not item:
+            continue
+        start, _, end = item.partition("-")
+        ranges.append((int(start), int(end or start)))
+    return ranges
+
+def ranges_intersect(ranges, line_numbers):
+    """Return true if any of the line numbers is inside one of the ranges."""
+    for start, end in ranges:
+        for line in line_numbers:
+            if start <= line <= end:
+                return True
+    return False
+
+#
+# Recording the executed lines.
+#
+
+class LineRecorder(object):
+    """Record the lines executed in the source files under the directory
+    `root_dir`, between calls to `start` and `stop`.  Uses `sys.monitoring`
+    if it is available and otherwise `sys.settrace`."""
+
+    def __init__(self, root_dir):
+        self.root_dir = os.path.join(os.path.realpath(root_dir), "")
+        self.use_monitoring = hasattr(sys, "monitoring")
+        self.filename_cache = {} # Code filename to real path, or None if not recorded.
+        self.lines = set()
+        self.tool_id = None
+        self.recording = False
+        self.instrumented_codes = weakref.WeakSet() # Code with local line events.
+        self.disabled_codes = set() # Code with lines disabled since the last start.
+
+    def recorded_filename(self, filename):
+        """Return the canonical path of `filename` if it should be recorded,
+        and otherwise `None`."""
+        try:
+            return self.filename_cache[filename]
+        except KeyError:
+            pass
+        path = os.path.realpath(filename)
+        if not path.startswith(self.root_dir) or not os.path.exists(path):
+            path = None
+        self.filename_cache[filename] = path
+        return path
+
+    def start(self):
+        """Start recording, with an empty set of lines."""
+        self.lines = set()
+        if self.use_monitoring:
+            if self.tool_id is None:
+                self.register_monitoring_tool()
+            self.rearm_lines()
+            self.recording = True
+            sys.monitoring.set_events(self.tool_id, sys.monitoring.events.PY_START)
+        else:
+            threading.settrace(self.global_trace)
+            sys.settrace(self.global_trace)
+
+    def stop(self):
+        """Stop recording and return the dict of the recorded line numbers,
+        keyed on filenames."""
+        if self.use_monitoring:
+            self.recording = False
+            sys.monitoring.set_events(self.tool_id, 0)
+        else:
+            sys.settrace(None)
+            threading.settrace(None)
+        lines_by_file = {}
+        for filename, line in self.lines:
+            lines_by_file.setdefault(filename, set()).add(line)
+        return lines_by_file
+
+    def close(self):
+        """Release the `sys.monitoring` tool ID, if one was taken."""
+        if self.tool_id is not None:
+            monitoring = sys.monitoring
+            monitoring.set_events(self.tool_id, 0)
+            for code in list(self.instrumented_codes):
+                monitoring.set_local_events(self.tool_id, code, 0)
+            self.instrumented_codes.clear()
+            self.disabled_codes.clear()
+            for event in (monitoring.events.PY_START, monitoring.events.LINE):
+                monitoring.register_callback(self.tool_id, event, None)
+            monitoring.free_tool_id(self.tool_id)
+            self.tool_id = None
+
+    def register_monitoring_tool(self):
+        """Take a free `sys.monitoring` tool ID, preferring the coverage ID."""
+        monitoring = sys.monitoring
+        for tool_id in (monitoring.COVERAGE_ID, 3, 4):
+            try:
+                monitoring.use_tool_id(tool_id, "pytest_helper")
+            except ValueError: # Already in use, maybe by coverage.py.
+                continue
+            self.tool_id = tool_id
+            monitoring.register_callback(tool_id, monitoring.events.PY_START,
+                                         self.monitoring_start_callback)
+            monitoring.register_callback(tool_id, monitoring.events.LINE,
+                                         self.monitoring_line_callback)
+            return
+        raise PytestHelperException("No free sys.monitoring tool ID to record"
+                                    " the impact map.")
+
+    def rearm_lines(self):
+        """Re-enable the line events of this tool which were disabled since
+        the last call, by turning the local events of their code off and on.
+        Unlike `sys.monitoring.restart_events` this leaves the events of the
+        other tools (such as coverage.py) and of the other code alone."""
+        monitoring = sys.monitoring
+        for code in self.disabled_codes:
+            monitoring.set_local_events(self.tool_id, code, 0)
+            monitoring.set_local_events(self.tool_id, code, monitoring.events.LINE)
+        self.disabled_codes.clear()
+
+    def monitoring_start_callback(self, code, instruction_offset):
+        # Turn on line events for recorded code the first time it runs.  The
+        # start event is disabled for good either way, so code in other files
+        # costs one callback in total.
+        if (code not in self.instrumented_codes
+                and self.recorded_filename(code.co_filename)):
+            sys.monitoring.set_local_events(self.tool_id, code,
+                                            sys.monitoring.events.LINE)
+            self.instrumented_codes.add(code)
+        return sys.monitoring.DISABLE
+
+    def monitoring_line_callback(self, code, line_number):
+        if self.recording:
+            self.lines.add((self.recorded_filename(code.co_filename), line_number))
+        # Disable this line until the next start, so each line costs one
+        # callback per test.
+        self.disabled_codes.add(code)
+        return sys.monitoring.DISABLE
+
+    def global_trace(self, frame, event, arg):
+        if self.recorded_filename(frame.f_code.co_filename):
+            return self.local_trace
+        return None # Do not trace lines in other files.
+
+    def local_trace(self, frame, event, arg):
+        if event == "line":
+            self.lines.add((self.recorded_filename(frame.f_code.co_filename),
+                            frame.f_lineno))
+        return self.local_trace
+
+#
+# The database.
+#
+
+class ImpactMapDB(object):
+    """The SQLite database holding the impact map, at the path `db_path`."""
+
+    def __init__(self, db_path):
+        self.db_path = db_path
+        self.connection = sqlite3.connect(db_path)
+        self.connection.execute("CREATE TABLE IF NOT EXISTS impact"
+                                " (nodeid TEXT, filename TEXT, ranges TEXT,"
+                                " PRIMARY KEY (nodeid, filename))")
+
+    def store(self, nodeid, lines_by_file):
+        """Replace the recorded lines of test `nodeid` with `lines_by_file`."""
+        with self.connection:
+            self.connection.execute("DELETE FROM impact WHERE nodeid = ?", (nodeid,))
+            self.connection.executemany("INSERT INTO impact VALUES (?, ?, ?)",
+                    [(nodeid, filename, lines_to_ranges_string(lines))
+                     for filename, lines in lines_by_file.items()])
+
+    def impacted_nodeids(self, changed_lines_by_file):
+        """Return the sorted list of the node IDs of the tests which executed
+        any of the changed lines, given as a dict of line-number sets keyed
+        on filenames."""
+        nodeids = set()
+        for filename, changed_lines in changed_lines_by_file.items():
+            rows = self.connection.execute("SELECT nodeid, ranges FROM impact"
+                                           " WHERE filename = ?", (filename,))
+            for nodeid, ranges_string in rows:
+                if nodeid not in nodeids and ranges_intersect(
+                              ranges_string_to_ranges(ranges_string), changed_lines):
+                    nodeids.add(nodeid)
+        return sorted(nodeids)
+
+    def close(self):
+        self.connection.close()
+
+#
+# The pytest plugin for recording.
+#
+
+def absolute_nodeid(item):
+    """Return the node ID of the test `item` with its file part as an absolute
+    path, so it can be passed to pytest from any directory."""
+    nodeid = item.nodeid
+    path = os.path.realpath(str(item.fspath))
+    separator_index = nodeid.find("::")
+    return path + nodeid[separator_index:] if separator_index >= 0 else path
+
+class ImpactRecorderPlugin(object):
+    """A pytest plugin which records the lines executed by each test (during
+    its setup, call, and teardown) under `root_dir`, and stores them in the
+    impact map database at `db_path`.  The time spent running the tests
+    while recording is saved, and reported at the end of the session."""
+
+    def __init__(self, db_path, root_dir):
+        self.db_path = db_path
+        self.recorder = LineRecorder(root_dir)
+        self.db = None
+        self.num_tests = 0
+        self.recording_time = 0.0
+
+    @pytest.hookimpl(hookwrapper=True)
+    def pytest_runtest_protocol(self, item, nextitem):
+        if self.db is None:
+            self.db = ImpactMapDB(self.db_path)
+        start_time = time.time()
+        self.recorder.start()
+        try:
+            yield
+        finally:
+            lines_by_file = self.recorder.stop()
+            self.recording_time += time.time() - start_time
+        self.db.store(absolute_nodeid(item), lines_by_file)
+        self.num_tests += 1
+
+    def pytest_sessionfinish(self, session):
+        self.recorder.close()
+        if self.db is not None:
+            self.db.close()
+            self.db = None
+
+    def pytest_terminal_summary(self, terminalreporter):
+        method = ("sys.monitoring" if self.recorder.use_monitoring
+                  else "sys.settrace")
+        terminalreporter.write_line("pytest_helper: recorded the impact map of {0}"
+                " tests with {1} in {2:.2f}s of test time (database {3})."
+                .format(self.num_tests, method, self.recording_time, self.db_path))
+
+#
+# Selecting the impacted tests.
+#
+
+def get_git_root(dirname):
+    """Return the top directory of the git working tree containing `dirname`,
+    or `None` if it is not in one (or git is not available)."""
+    try:
+        output = subprocess.check_output(["git", "rev-parse", "--show-toplevel"],
+                                         cwd=dirname, stderr=subprocess.STDOUT)
+    except (OSError, subprocess.CalledProcessError):
+        return None
+    return os.path.realpath(output.decode("utf-8").strip())
+
+hunk_header_regex = re.compile(r"^@@ -(\d+)(?:,(\d+))? \+\d+(?:,\d+)? @@", re.MULTILINE)
+
+def get_changed_lines(git_root):
+    """Return a dict of the changed line numbers, keyed on absolute filenames,
+    for the changes in the working tree of the git repository at `git_root`
+    relative to `HEAD`.  The line numbers are those in the `HEAD` version,
+    which is what the impact map was most likely recorded with.  For inserted
+    lines the lines on both sides of the insertion are used.  New files
+    (staged or untracked) and the new names of renamed files are included
+    with no changed lines."""
+    diff = subprocess.check_output(["git", "diff", "-U0", "--no-color",
+                                    "--no-ext-diff", "HEAD"], cwd=git_root)
+    changed_lines_by_file = {}
+    filename = None
+    for line in diff.decode("utf-8", "replace").splitlines():
+        if line.startswith("--- "):
+            old_name = line[4:]
+            filename = (None if old_name == "/dev/null" else
+                        os.path.join(git_root, old_name[2:])) # Strip the "a/".
+            if filename:
+                changed_lines_by_file.setdefault(filename, set())
+            continue
+        if line.startswith("+++ "):
+            new_name = line[4:]
+            if new_name != "/dev/null": # Not a deleted file.
+                changed_lines_by_file.setdefault(
+                        os.path.join(git_root, new_name[2:]), set()) # Strip the "b/".
+            continue
+        match = hunk_header_regex.match(line)
+        if match and filename:
+            start = int(match.group(1))
+            count = 1 if match.group(2) is None else int(match.group(2))
+            if count == 0: # Pure insertion after line start.
+                changed = [start, start + 1]
+            else:
+                changed = range(start, start + count)
+            changed_lines_by_file[filename].update(changed)
+
+    untracked = subprocess.check_output(["git", "ls-files", "--others",
+                                         "--exclude-standard"], cwd=git_root)
+    for name in untracked.decode("utf-8", "replace").splitlines():
+        changed_lines_by_file.setdefault(os.path.join(git_root, name), set())
+    return dict((os.path.realpath(filename), lines)
+                for filename, lines in changed_lines_by_file.items())
+
+def select_impacted_tests(db_path, testfile_paths, git_root, pytest_arglist=()):
+    """Return the list of tests to run, out of those in `testfile_paths`,
+    which are affected by the changes in the git working tree at `git_root`.
+    Changed test files are run in full, since they may contain new tests.
+    Otherwise the node IDs are selected of the recorded tests which executed
+    a changed line.  The test files in the directories in `testfile_paths`
+    are those pytest collects with the arguments `pytest_arglist` (see
+    `sharding.collect_test_files`), so its `python_files` setting applies."""
+    changed_lines_by_file = get_changed_lines(git_root)
+    db = ImpactMapDB(db_path)
+    try:
+        impacted_nodeids = db.impacted_nodeids(changed_lines_by_file)
+    finally:
+        db.close()
+
+    dirnames = [path for path in testfile_paths if os.path.isdir(path)]
+    test_files = set(os.path.realpath(path) for path in testfile_paths
+                     if path not in dirnames)
+    if dirnames:
+        test_files.update(sharding.collect_test_files(dirnames, pytest_arglist))
+
+    def is_test_file(path):
+        """Whether pytest would run the file `path` for the `testfile_paths`."""
+        return os.path.realpath(path) in test_files
+
+    changed_test_files = sorted(filename for filename in changed_lines_by_file
+                                if filename.endswith(".py") and is_test_file(filename))
+    selected_nodeids = [nodeid for nodeid in impacted_nodeids
+                        if is_test_file(nodeid.partition("::")[0])
+                           and nodeid.partition("::")[0] not in changed_test_files]
+    return changed_test_files + selected_nodeids
+
@@ -0,0 +1,233 @@
+# -*- coding: utf-8 -*-
+"""
+Description
+-----------
+
+This module contains the import profiler used by the `import_profile` option
+of `script_run`.  A finder placed at the front of `sys.meta_path` times each
+import (finding the module, creating it, and executing it), and records the
+imports as a tree so that the time of each import can be split into its
+cumulative time and its self time (the cumulative time minus the time of the
+imports nested inside it).  A pytest plugin attributes each top-level import
+to the test file being collected or run when it happened, and reports the
+slowest imports of each test file at the end of the session.
+
+Only the imports which actually happen during the pytest run are seen.
+Modules which were already imported before (for example by the script which
+calls `script_run`) are found in `sys.modules` without any import.  This
+requires Python 3.4 or later.
+
+..  Copyright (c) 2015 by Allen Barker.
+    License: MIT, see LICENSE for more details.
+
+.. default-role:: code
+
+"""
+
+from __future__ import print_function, division, absolute_import
+import sys
+import os
+import threading
+import timeit
+
+try:
+    import pytest
+except ImportError:
+    import py.test as pytest # Old pytest versions, before 3.0.
+
+timer = timeit.default_timer
+
+# The number of imports shown for each test file, by default.
+DEFAULT_IMPORT_PROFILE_LINES = 10
+
+# The name the imports are attributed to when no test file is active.
+OUTSIDE_TEST_FILES = "(outside any test file)"
+
+class ImportRecord(object):
+    """The timing of one import, with the imports nested inside it."""
+    __slots__ = ("name", "children", "cumulative", "self_time")
+
+    def __init__(self, name, find_time):
+        self.name = name
+        self.children = []
+        self.cumulative = find_time # Added to when the module is executed.
+        self.self_time = find_time
+
+    def finish(self, elapsed):
+        self.cumulative += elapsed
+        self.self_time = self.cumulative - sum(c.cumulative for c in self.children)
+
+    def walk(self, depth=0):
+        """Iterate over `(depth, record)` for this record and the records below
+        it, in tree order."""
+        yield depth, self
+        for child in self.children:
+            for item in child.walk(depth+1):
+                yield item
+
+class TimingLoader(object):
+    """A wrapper around the loader of a module spec which times the creation
+    and execution of the module.  Other attributes are delegated to the
+    wrapped loader.  The original loader is put back on the module after it
+    is executed."""
+
+    def __init__(self, loader, finder, record):
+        self.loader = loader
+        self.finder = finder
+        self.record = record
+        self.start_time = None
+
+    def __getattr__(self, name):
+        return getattr(self.loader, name)
+
+    def create_module(self, spec):
+        self.start_time = timer()
+        self.finder.push(self.record)
+        create_module = getattr(self.loader, "create_module", None)
+        try:
+            return create_module(spec) if create_module else None
+        except BaseException:
+            self.finder.pop(self.record, timer() - self.start_time)
+            raise
+
+    def exec_module(self, module):
+        if self.start_time is None: # Reloads do not create a module first.
+            self.start_time = timer()
+            self.finder.push(self.record)
+        try:
+            self.loader.exec_module(module)
+        finally:
+            self.finder.pop(self.record, timer() - self.start_time)
+            spec = getattr(module, "__spec__", None)
+            if spec is not None and spec.loader is self:
+                spec.loader = self.loader
+            if getattr(module, "__loader__", None) is self:
+                module.__loader__ = self.loader
+
+class ImportTimingFinder(object):
+    """A meta path finder which finds modules with the finders after it on
+    `sys.meta_path` and wraps their loaders to time the imports.  The
+    top-level imports are saved in `roots`, as `(attributed_to, record)`
+    tuples, where `attributed_to` is the value of `current_file` at the time."""
+
+    def __init__(self):
+        self.roots = []
+        self.current_file = None
+        self.local = threading.local() # Each thread has its own import stack.
+
+    def stack(self):
+        try:
+            return self.local.stack
+        except AttributeError:
+            self.local.stack = []
+            self.local.finding = False
+            return self.local.stack
+
+    def push(self, record):
+        stack = self.stack()
+        if stack:
+            stack[-1].children.append(record)
+        else:
+            self.roots.append((self.current_file, record))
+        stack.append(record)
+
+    def pop(self, record, elapsed):
+        stack = self.stack()
+        if stack and stack[-1] is record:
+            stack.pop()
+        record.finish(elapsed)
+
+    def find_spec(self, fullname, path=None, target=None):
+        self.stack()
+        if self.local.finding:
+            return None # A finder below is importing something; do not time it.
+        self.local.finding = True
+        start_time = timer()
+        try:
+            for finder in sys.meta_path:
+                if finder is self or not hasattr(finder, "find_spec"):
+                    continue
+                if target is None:
+                    spec = finder.find_spec(fullname, path)
+                else:
+                    spec = finder.find_spec(fullname, path, target)
+                if spec is not None:
+                    break
+            else:
+                return None
+        finally:
+            self.local.finding = False
+        if spec.loader is None or not hasattr(spec.loader, "exec_module"):
+            return spec # Namespace packages and legacy loaders are not timed.
+        record = ImportRecord(fullname, timer() - start_time)
+        spec.loader = TimingLoader(spec.loader, self, record)
+        return spec
+
+class ImportProfilerPlugin(object):
+    """A pytest plugin which installs an `ImportTimingFinder` for the session
+    and attributes the imports to the test files being collected or run.  At
+    the end of the session the `num_lines` slowest imports of each test file
+    are reported, in tree order, with their cumulative and self times."""
+
+    def __init__(self, num_lines=DEFAULT_IMPORT_PROFILE_LINES):
+        self.num_lines = num_lines
+        self.finder = ImportTimingFinder()
+
+    def pytest_sessionstart(self, session):
+        del self.finder.roots[:] # Each session reports only its own imports.
+        if self.finder not in sys.meta_path:
+            sys.meta_path.insert(0, self.finder)
+
+    def pytest_unconfigure(self, config):
+        if self.finder in sys.meta_path:
+            sys.meta_path.remove(self.finder)
+
+    @pytest.hookimpl(hookwrapper=True)
+    def pytest_make_collect_report(self, collector):
+        if not isinstance(collector, pytest.File):
+            yield
+            return
+        self.finder.current_file = str(collector.fspath)
+        try:
+            yield
+        finally:
+            self.finder.current_file = None
+
+    @pytest.hookimpl(hookwrapper=True)
+    def pytest_runtest_protocol(self, item, nextitem):
+        self.finder.current_file = str(item.fspath)
+        try:
+            yield
+        finally:
+            self.finder.current_file = None
+
+    def profile_by_file(self):
+        """Return a dict mapping the test filenames to lists of their
+        top-level import records."""
+        by_file = {}
+        for filename, record in self.finder.roots:
+            by_file.setdefault(filename or OUTSIDE_TEST_FILES, []).append(record)
+        return by_file
+
+    def pytest_terminal_summary(self, terminalreporter):
+        write_line = terminalreporter.write_line
+        by_file = self.profile_by_file()
+        if not by_file:
+            write_line("pytest_helper: import profile, no imports were made.")
+            return
+        write_line("pytest_helper: import profile, the slowest imports of each"
+                   " test file (cumulative and self time in seconds):")
+        totals = dict((f, sum(r.cumulative for r in records))
+                      for f, records in by_file.items())
+        for filename in sorted(by_file, key=lambda f: -totals[f]):
+            write_line("{0}: {1:.4f} total".format(
+                       os.path.relpath(filename) if filename != OUTSIDE_TEST_FILES
+                       else filename, totals[filename]))
+            items = [(depth, record) for root in by_file[filename]
+                                     for depth, record in root.walk()]
+            slowest = set(id(record) for depth, record in
+                          sorted(items, key=lambda i: -i[1].cumulative)[:self.num_lines])
+            for depth, record in items: # Show the slowest in tree order.
+                if id(record) in slowest:
+                    write_line("   {0:8.4f} {1:8.4f}  {2}{3}".format(record.cumulative,
+                               record.self_time, "  " * depth, record.name))
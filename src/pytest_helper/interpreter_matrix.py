@@ -0,0 +1,189 @@
+# -*- coding: utf-8 -*-
+"""
+Description
+-----------
+
+This module contains the code for running the same tests under several
+Python interpreters at once, used by the `interpreters` option of
+`script_run`.  Each interpreter runs pytest in its own subprocess, and all the
+subprocesses run concurrently.  The test results of the subprocesses are
+streamed back to the parent with the plugin `pytest_helper_reporter`, labelled
+with the interpreter, and passed to the `on_result` function and the results
+file as usual.  The regular output of each subprocess is held until it
+finishes, so the outputs of the interpreters are not mixed together.
+
+At the end a matrix of the outcome of each test under each interpreter is
+shown.  Only the tests which did not pass under every interpreter are listed
+in it, since those are the interesting ones.
+
+The interpreters must each have pytest installed.  The plugin is a top-level
+module which imports nothing but pytest, and a private directory holding
+only a copy of it is put on their `PYTHONPATH`, so neither `pytest_helper`
+nor its dependencies need to be installed in them, and the packages of the
+interpreter running `script_run` are not put on their path.  (Test files which themselves import `pytest_helper` still
+need those dependencies.)
+
+..  Copyright (c) 2015 by Allen Barker.
+    License: MIT, see LICENSE for more details.
+
+.. default-role:: code
+
+"""
+
+from __future__ import print_function, division, absolute_import
+import sys
+import os
+import io
+import time
+import shutil
+import threading
+
+from pytest_helper.global_settings import PytestHelperException
+from pytest_helper import budgets
+from pytest_helper import sharding
+from pytest_helper.result_reporter import subprocess_env
+
+# The outcomes shown in the matrix, from the least to the most serious.  A
+# test with several records (such as a failed call and a teardown error) is
+# shown with the most serious one.
+MATRIX_OUTCOMES = ["passed", "skipped", "failed", "error"]
+
+# The exit code of a run whose interpreter could not be started (the pytest
+# exit code for an internal error).
+RUN_ERROR_EXIT_CODE = 3
+
+def find_interpreter(interpreter):
+    """Return the full path of the Python executable `interpreter`, which is
+    either a path or a command name looked up on `PATH`."""
+    path = shutil.which(interpreter)
+    if path is None:
+        raise PytestHelperException("The interpreter {0!r} passed to script_run"
+                                    " was not found.".format(interpreter))
+    return path
+
+def record_outcome(record):
+    """Return the outcome of the result record `record` for the matrix.  A
+    failure outside the call of the test function is an error."""
+    if record["outcome"] == "failed" and record["when"] != "call":
+        return "error"
+    return record["outcome"]
+
+class InterpreterMatrix(object):
+    """The outcomes of the tests under each of the interpreters, and the exit
+    code and running time of each interpreter's run.  The outcomes are in the
+    dict `outcomes`, keyed on the node IDs, with dicts keyed on the
+    interpreters as values."""
+
+    def __init__(self, interpreters):
+        self.interpreters = list(interpreters)
+        self.outcomes = {}
+        self.exit_codes = {}
+        self.run_times = {}
+        self.lock = threading.Lock()
+
+    def add_record(self, interpreter, record):
+        """Add the result record `record` from the run of `interpreter`."""
+        outcome = record_outcome(record)
+        with self.lock:
+            test_outcomes = self.outcomes.setdefault(record["nodeid"], {})
+            old_outcome = test_outcomes.get(interpreter, outcome)
+            test_outcomes[interpreter] = max(old_outcome, outcome,
+                                             key=MATRIX_OUTCOMES.index)
+
+    def counts(self, interpreter):
+        """Return a dict of the number of tests with each outcome under
+        `interpreter`."""
+        counts = dict((outcome, 0) for outcome in MATRIX_OUTCOMES)
+        for test_outcomes in self.outcomes.values():
+            if interpreter in test_outcomes:
+                counts[test_outcomes[interpreter]] += 1
+        return counts
+
+    def summary_lines(self):
+        """Return the lines of the matrix summary, as a list of strings."""
+        lines = ["pytest_helper: results under each interpreter:"]
+        for interpreter in self.interpreters:
+            counts = self.counts(interpreter)
+            lines.append("   {0}: {1}, exit code {2}, {3:.2f}s".format(interpreter,
+                         ", ".join("{0} {1}".format(counts[o], o) for o in MATRIX_OUTCOMES),
+                         self.exit_codes.get(interpreter),
+                         self.run_times.get(interpreter, 0.0)))
+        not_passed = sorted(nodeid for nodeid, test_outcomes in self.outcomes.items()
+                            if any(test_outcomes.get(i) != "passed"
+                                   for i in self.interpreters))
+        if not not_passed:
+            lines.append("pytest_helper: all {0} tests passed under every interpreter."
+                         .format(len(self.outcomes)))
+            return lines
+        lines.append("pytest_helper: tests which did not pass under every interpreter"
+                     " ({0} of {1}):".format(len(not_passed), len(self.outcomes)))
+        width = max(len(i) for i in self.interpreters)
+        width = max(width, max(len(o) for o in MATRIX_OUTCOMES), len("missing"))
+        lines.append("   " + " ".join(i.rjust(width) for i in self.interpreters))
+        for nodeid in not_passed:
+            test_outcomes = self.outcomes[nodeid]
+            lines.append("   " + " ".join(test_outcomes.get(i, "missing").rjust(width)
+                                          for i in self.interpreters) + "  " + nodeid)
+        return lines
+
+def run_interpreter_matrix(interpreters, testfile_paths, pytest_arglist,
+                           handle_record=None, calling_mod_name=None,
+                           max_failures=None, output=None):
+    """Run pytest on `testfile_paths` with the arguments `pytest_arglist` under
+    each of the Python executables in `interpreters`, concurrently, in
+    subprocesses.  Each result record is labelled with the interpreter under
+    the key "interpreter" and passed to `handle_record`, and the output of each
+    run is written to the stream `output` (by default `sys.stdout`) when the
+    run finishes.  The `max_failures` limit applies to each run separately.
+    Returns the tuple `(exit_code, matrix)`, where `exit_code` is the merged
+    exit code of the runs and `matrix` is the `InterpreterMatrix`."""
+    output = output or sys.stdout
+    if len(set(interpreters)) != len(interpreters):
+        raise PytestHelperException("The interpreters passed to script_run must"
+                                    " all be different.")
+    paths = [find_interpreter(interpreter) for interpreter in interpreters]
+    pytest_options = ["-p", "pytest_helper_reporter", "--pytest-helper-stream"]
+    if calling_mod_name:
+        pytest_options += ["--pytest-helper-module", calling_mod_name]
+    if max_failures:
+        pytest_options.append("--maxfail={0}".format(max_failures))
+    matrix = InterpreterMatrix(interpreters)
+    handler_lock = threading.Lock()
+    output_lock = threading.Lock()
+
+    def run_interpreter(interpreter, path):
+        def handle_interpreter_record(record):
+            record["interpreter"] = interpreter
+            matrix.add_record(interpreter, record)
+            if handle_record:
+                with handler_lock:
+                    handle_record(record)
+        run_output = io.StringIO()
+        start_time = time.time()
+        same_interpreter = os.path.abspath(path) == os.path.abspath(sys.executable)
+        try:
+            exit_code, _ = budgets.run_file_with_budgets(
+                    [path, "-m", "pytest"] + pytest_options + pytest_arglist
+                    + testfile_paths, handle_record=handle_interpreter_record,
+                    output=run_output, env=subprocess_env(same_interpreter))
+        except OSError as e:
+            run_output.write("Could not run the interpreter: {0}\n".format(e))
+            exit_code = RUN_ERROR_EXIT_CODE
+        matrix.exit_codes[interpreter] = exit_code
+        matrix.run_times[interpreter] = time.time() - start_time
+        with output_lock:
+            output.write("\npytest_helper: output of the run under {0}:\n".format(interpreter))
+            output.write(run_output.getvalue())
+            output.flush()
+
+    threads = [threading.Thread(target=run_interpreter, args=(interpreter, path),
+                                name="pytest_helper_interpreter_run")
+               for interpreter, path in zip(interpreters, paths)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    output.write("\n" + "\n".join(matrix.summary_lines()) + "\n")
+    output.flush()
+    return sharding.merge_exit_codes(matrix.exit_codes.values()), matrix
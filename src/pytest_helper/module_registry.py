@@ -0,0 +1,150 @@
+# -*- coding: utf-8 -*-
+"""
+Description
+-----------
+
+This module contains the registry of the module info looked up by
+`get_calling_module_info`.  The info of each module is saved in a compact
+`ModuleInfo` record, keyed weakly on the module object itself, so the
+registry never keeps a module alive.  When a module is garbage collected
+(for example after it is removed from `sys.modules` and dropped) its entry
+is evicted.  A secondary index maps the module names to the records of the
+live modules.
+
+Since the records are keyed on the module objects, a module which replaces
+another one under the same name gets its own, new info.  A record is also
+ignored if the `__file__` attribute of its module has changed since it was
+saved (such as after a reload from a different file).
+
+..  Copyright (c) 2015 by Allen Barker.
+    License: MIT, see LICENSE for more details.
+
+.. default-role:: code
+
+"""
+
+from __future__ import print_function, division, absolute_import
+import threading
+import weakref
+
+class ModuleInfo(object):
+    """The info on a module, as returned by `get_calling_module_info`.  It can
+    be unpacked and indexed like the tuple::
+
+       (calling_module_name,
+        calling_module,
+        calling_module_path,
+        calling_module_dir,
+        in_pkg)
+
+    Only a weak reference to the module is kept, so the module is `None` after
+    it has been garbage collected."""
+    __slots__ = ("name", "module_ref", "path", "dir", "in_pkg", "file")
+
+    def __init__(self, module, name, path, dirname, in_pkg, module_ref=None):
+        self.name = name
+        self.module_ref = module_ref if module_ref is not None else weakref.ref(module)
+        self.path = path
+        self.dir = dirname
+        self.in_pkg = in_pkg
+        self.file = getattr(module, "__file__", None)
+
+    @property
+    def module(self):
+        return self.module_ref()
+
+    def __iter__(self):
+        return iter((self.name, self.module_ref(), self.path, self.dir, self.in_pkg))
+
+    def __len__(self):
+        return 5
+
+    def __getitem__(self, index):
+        return tuple(self)[index]
+
+    def __repr__(self):
+        return "ModuleInfo{0!r}".format(tuple(self))
+
+class ModuleInfoRegistry(object):
+    """A registry of `ModuleInfo` records, keyed weakly on the module objects,
+    with a secondary index on the module names.  Entries are written under a
+    lock with `setdefault`, so concurrent threads always get the first record
+    saved for a module."""
+
+    def __init__(self):
+        self.by_module = weakref.WeakKeyDictionary()
+        self.by_name = {}
+        # Reentrant, since the callbacks of the weak references can run during
+        # a garbage collection triggered while the lock is held.
+        self.lock = threading.RLock()
+
+    def __len__(self):
+        return len(self.by_module)
+
+    def new_record(self, module, name, path, dirname, in_pkg):
+        """Return a new record for `module`, whose weak reference to the module
+        removes the record from the name index when the module is collected."""
+        module_ref = weakref.KeyedRef(module, self._remove_name, name)
+        return ModuleInfo(module, name, path, dirname, in_pkg, module_ref)
+
+    def _remove_name(self, module_ref):
+        # The callback of the weak references to the modules.  The module may
+        # have been replaced under its name, so only its own record is removed.
+        with self.lock:
+            record = self.by_name.get(module_ref.key)
+            if record is not None and record.module_ref is module_ref:
+                del self.by_name[module_ref.key]
+
+    def get(self, module):
+        """Return the record of `module`, or `None` if it has none or if the
+        module's `__file__` has changed since the record was saved."""
+        try:
+            record = self.by_module.get(module)
+        except TypeError: # Not weakly referenceable.
+            return None
+        if record is None or record.file != getattr(module, "__file__", None):
+            return None
+        return record
+
+    def get_by_name(self, name):
+        """Return the record of the live module last registered as `name`, or
+        `None`."""
+        return self.by_name.get(name)
+
+    def find_module(self, name):
+        """Return the live module last registered as `name`, or `None`.  This
+        also finds modules which are no longer in `sys.modules`."""
+        record = self.by_name.get(name)
+        return record.module_ref() if record is not None else None
+
+    def set(self, module, record):
+        """Save `record` as the info of `module`, replacing any earlier one."""
+        with self.lock:
+            self.by_module[module] = record
+            self.by_name[record.name] = record
+        return record
+
+    def setdefault(self, module, record):
+        """Save `record` as the info of `module` unless it already has a valid
+        record.  Returns the record which is saved."""
+        with self.lock:
+            existing = self.get(module)
+            if existing is not None:
+                return existing
+            self.by_module[module] = record
+            self.by_name[record.name] = record
+        return record
+
+    def discard(self, module):
+        """Remove the record of `module`, if any."""
+        with self.lock:
+            record = self.by_module.pop(module, None)
+            if record is not None and self.by_name.get(record.name) is record:
+                del self.by_name[record.name]
+
+    def clear(self):
+        with self.lock:
+            self.by_module.clear()
+            self.by_name.clear()
+
+module_info_registry = ModuleInfoRegistry()
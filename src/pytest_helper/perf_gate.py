@@ -0,0 +1,168 @@
+# -*- coding: utf-8 -*-
+"""
+Description
+-----------
+
+This module contains the performance regression gate used by the
+`perf_baseline` option of `script_run`.  The tests are run several times
+each (with the `repeat` option), and the median duration of each test is
+compared with the median stored for it in a baseline file.  A test whose
+median is more than `ratio` times its baseline median, by a margin larger
+than the run-to-run noise of the two measurements, is a regression.  The
+regressions either fail their tests or are only marked and reported.
+
+The baseline file is in the results-file format (one JSON record per line),
+holding the call records of the tests with their `repeat_stats`.  It is
+written by `update_perf_baseline`, or by `script_run` with the option
+`update_perf_baseline` set.  The node IDs are relative to pytest's root
+directory, so the baseline should be used from the same directory tree.
+
+..  Copyright (c) 2015 by Allen Barker.
+    License: MIT, see LICENSE for more details.
+
+.. default-role:: code
+
+"""
+
+from __future__ import print_function, division, absolute_import
+import os
+import math
+
+try:
+    import pytest
+except ImportError:
+    import py.test as pytest # Old pytest versions, before 3.0.
+
+from pytest_helper.result_reporter import read_results_files, write_record_line
+
+# The default slowdown ratio which counts as a regression.
+DEFAULT_PERF_RATIO = 2.0
+
+# The default number of timed and warmup runs of each test when comparing
+# with a baseline and `repeat` is not set.
+DEFAULT_PERF_REPEAT = 5
+DEFAULT_PERF_WARMUP = 1
+
+# The slowdown must exceed the ratio by this many standard deviations of the
+# combined noise of the baseline and the current runs to count.
+NOISE_SIGMAS = 2.0
+
+def read_perf_baseline(filename):
+    """Return a dict mapping the node IDs in the baseline file `filename` to
+    their `repeat_stats`.  A missing file gives an empty dict."""
+    if not os.path.exists(filename):
+        return {}
+    return dict((r["nodeid"], r["repeat_stats"])
+                for r in read_results_files([filename]) if r.get("repeat_stats"))
+
+def update_perf_baseline(baseline_file, results_files):
+    """Update the baseline file `baseline_file` with the timings in the results
+    files `results_files` (written by `script_run` with the `repeat` option).
+    The last passing call record of each test replaces its baseline, and the
+    baselines of tests which are not in the results files are kept.  Returns
+    the number of baselines updated."""
+    new_records = [r for r in read_results_files(results_files)
+                   if r.get("repeat_stats") and r.get("outcome") == "passed"]
+    merge_into_perf_baseline(baseline_file, new_records)
+    return len(set(r["nodeid"] for r in new_records))
+
+def merge_into_perf_baseline(baseline_file, new_records):
+    """Write the call records `new_records` to the baseline file
+    `baseline_file`, replacing the records with the same node IDs.  The
+    records are written sorted by node ID."""
+    records = {}
+    if os.path.exists(baseline_file):
+        for record in read_results_files([baseline_file]):
+            records[record["nodeid"]] = record
+    for record in new_records:
+        records[record["nodeid"]] = record
+    with open(baseline_file, "w") as f:
+        for nodeid in sorted(records):
+            write_record_line(f, records[nodeid])
+
+def slowdown(baseline_stats, current_stats, ratio=DEFAULT_PERF_RATIO):
+    """Return the ratio of the current median to the baseline median if it is
+    a regression, or `None`.  It is a regression if the current median is
+    above `ratio` times the baseline median by more than `NOISE_SIGMAS`
+    standard deviations of the combined noise of both sets of runs."""
+    base_median = baseline_stats["median"]
+    current_median = current_stats["median"]
+    noise = math.sqrt(baseline_stats.get("variance", 0.0)
+                      + current_stats.get("variance", 0.0))
+    if current_median - ratio * base_median <= NOISE_SIGMAS * noise:
+        return None
+    return current_median / base_median if base_median > 0 else float("inf")
+
+class PerfGatePlugin(object):
+    """A pytest plugin which compares the repeat-run timings of the tests
+    (from `RepeatRunPlugin`) with the baselines in the file `baseline_file`.
+    With `fail` true the regressions fail their tests, otherwise they are
+    only reported.  With `update` true nothing is compared, and the baseline
+    file is updated with the timings of the passing tests at the end of the
+    session."""
+
+    def __init__(self, baseline_file, ratio=DEFAULT_PERF_RATIO, fail=True, update=False):
+        self.baseline_file = baseline_file
+        self.ratio = ratio
+        self.fail = fail
+        self.update = update
+        self.baseline = {} if update else read_perf_baseline(baseline_file)
+        self.regressions = {} # The slowdowns, keyed on the node IDs.
+        self.num_compared = 0
+        self.num_missing = 0
+        self.new_records = []
+
+    @pytest.hookimpl(hookwrapper=True) # Before the report is counted and shown.
+    def pytest_runtest_logreport(self, report):
+        self.check_report(report)
+        yield
+
+    def check_report(self, report):
+        """Compare the timings of the report `report` with the baseline, and
+        fail it if it is a regression and `fail` is set."""
+        stats = getattr(report, "repeat_stats", None)
+        if report.when != "call" or not stats or not report.passed:
+            return
+        if self.update:
+            self.new_records.append({"nodeid": report.nodeid, "when": "call",
+                                     "outcome": "passed", "duration": stats["median"],
+                                     "repeat_stats": stats})
+            return
+        baseline_stats = self.baseline.get(report.nodeid)
+        if baseline_stats is None:
+            self.num_missing += 1
+            return
+        self.num_compared += 1
+        ratio = slowdown(baseline_stats, stats, self.ratio)
+        if ratio is None:
+            return
+        self.regressions[report.nodeid] = (ratio, stats["median"], baseline_stats["median"])
+        report.perf_slowdown = ratio
+        if self.fail:
+            report.outcome = "failed"
+            report.longrepr = ("pytest_helper: performance regression, the median"
+                    " duration {0:.6f}s is {1:.2f} times the baseline {2:.6f}s"
+                    " (the limit is {3})".format(stats["median"], ratio,
+                                                 baseline_stats["median"], self.ratio))
+
+    def pytest_sessionfinish(self, session):
+        if self.update and self.new_records:
+            merge_into_perf_baseline(self.baseline_file, self.new_records)
+
+    def pytest_terminal_summary(self, terminalreporter):
+        write_line = terminalreporter.write_line
+        if self.update:
+            write_line("pytest_helper: updated {0} performance baselines in {1}."
+                       .format(len(self.new_records), self.baseline_file))
+            return
+        write_line("pytest_helper: compared {0} tests with their performance"
+                   " baselines ({1} have no baseline), {2} regressions."
+                   .format(self.num_compared, self.num_missing, len(self.regressions)))
+        if not self.regressions:
+            return
+        write_line("pytest_helper: tests slower than {0} times their baselines"
+                   " (slowdown, median, baseline median):".format(self.ratio))
+        for nodeid in sorted(self.regressions, key=lambda n: -self.regressions[n][0]):
+            ratio, current, base = self.regressions[nodeid]
+            write_line("   {0:6.2f}x {1:10.6f} {2:10.6f}  {3}".format(ratio, current,
+                                                                   base, nodeid))
@@ -0,0 +1,97 @@
+# -*- coding: utf-8 -*-
+"""
+Description
+-----------
+
+This module is a pytest plugin with the pytest-helper features that need pytest
+hooks.  It is not loaded automatically, since it looks at every test module
+pytest collects, so projects which use it opt in.  Load it with the pytest
+option `-p pytest_helper.plugin` (which can also go in the `addopts` setting
+of the pytest ini file), or with the line::
+
+   pytest_plugins = "pytest_helper.plugin"
+
+in the top-level `conftest.py` file.
+
+The plugin does these things:
+
+* While collecting each test module it looks up the module's info and its
+  config-file settings and saves them in the module's pytest-helper data, so
+  the pytest-helper functions called during the tests do not need to.  The
+  config files of the module's directory are read before the module is
+  imported, so calls made at import time find them cached.
+
+* If `autoimport_at_collection = True` is set in a config file, it puts the
+  `autoimport` names into each test module under that config file's
+  directory as the module is imported, with a single `dict.update`, so the
+  modules do not need to call `autoimport` (see
+  `pytest_helper.autoimport_injection`).
+
+* It deletes the globals which `locals_to_globals` copied with `evict` set
+  after the last test of each module has been torn down, and reports the
+  bytes they retained per module at the end of the session.
+
+..  Copyright (c) 2015 by Allen Barker.
+    License: MIT, see LICENSE for more details.
+
+.. default-role:: code
+
+"""
+
+from __future__ import print_function, division, absolute_import
+
+try:
+    import pytest
+except ImportError:
+    import py.test as pytest # Old pytest versions, before 3.0.
+
+import os
+
+from pytest_helper.pytest_helper_main import (evict_tracked_globals,
+                                              retained_globals_report,
+                                              precompute_module_info,
+                                              autoimport_DEFAULTS)
+from pytest_helper.autoimport_injection import (autoimport_injector,
+                                                get_autoimport_bundle)
+from pytest_helper.config_file_handler import get_dir_effective_config
+from pytest_helper.global_settings import ALLOW_USER_CONFIG_FILES
+
+@pytest.hookimpl(hookwrapper=True)
+def pytest_make_collect_report(collector):
+    is_module = isinstance(collector, pytest.Module)
+    injecting = False
+    if is_module and ALLOW_USER_CONFIG_FILES:
+        # Warm the config cache before the module is imported.
+        module_path = os.path.realpath(str(collector.fspath))
+        module_dir = os.path.dirname(module_path)
+        effective_config = get_dir_effective_config(module_dir)
+        if effective_config.get("autoimport_at_collection", False):
+            autoimport_injector.inject(module_path, get_autoimport_bundle(
+                                   module_dir, effective_config, autoimport_DEFAULTS))
+            injecting = True
+    try:
+        outcome = yield
+    finally:
+        if injecting:
+            autoimport_injector.finish()
+    if is_module and outcome.get_result().passed:
+        precompute_module_info(collector.obj) # Already imported, so no import here.
+
+@pytest.hookimpl(hookwrapper=True)
+def pytest_runtest_teardown(item, nextitem):
+    yield # Evict after the module-scoped fixtures have been torn down.
+    module = getattr(item, "module", None)
+    if module is None:
+        return
+    if nextitem is not None and getattr(nextitem, "module", None) is module:
+        return # Not the last test of the module.
+    evict_tracked_globals(module.__dict__)
+
+def pytest_terminal_summary(terminalreporter):
+    report = retained_globals_report()
+    if not report:
+        return
+    terminalreporter.write_line("pytest_helper: bytes retained by evictable"
+                                " locals_to_globals globals (peak, at end):")
+    for name, (current, peak) in sorted(report.items(), key=lambda r: -r[1][1]):
+        terminalreporter.write_line("   {0}: {1}, {2}".format(name, peak, current))
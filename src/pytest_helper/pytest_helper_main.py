@@ -54,13 +54,36 @@ from __future__ import print_function, division, absolute_import
 import inspect
 import sys
 import os
+import re
+import time
+import threading
+import collections
+import weakref
 import set_package_attribute
 
+try:
+    from itertools import zip_longest
+except ImportError: # Must be Python 2; use old names.
+    from itertools import izip_longest as zip_longest
+
 try:
     import pytest
 except ImportError:
     import py.test as pytest # Old pytest versions, before 3.0.
-from pytest_helper.config_file_handler import (get_config_value, get_config)
+from pytest_helper.config_file_handler import (get_config_value, get_config,
+                                               get_effective_config)
+from pytest_helper.result_reporter import ResultRecordPlugin, ResultsFileWriter
+from pytest_helper import impact_map
+from pytest_helper import sys_path_tools
+from pytest_helper.rewrite_warmer import RewriteWarmerPlugin
+from pytest_helper.repeat_runner import RepeatRunPlugin
+from pytest_helper import sharding
+from pytest_helper import budgets
+from pytest_helper import perf_gate
+from pytest_helper import interpreter_matrix
+from pytest_helper import sample_profiler
+from pytest_helper.module_registry import module_info_registry
+from pytest_helper.autoimport_injection import get_injected_bundle
 
 from pytest_helper.global_settings import (PytestHelperException,
                                            LocalsToGlobalsError,
@@ -70,7 +93,14 @@ from pytest_helper.global_settings import (PytestHelperException,
 def script_run(testfile_paths=None, self_test=False, pytest_args=None, pyargs=False,
                modify_syspath=None, calling_mod_name=None, calling_mod_path=None,
                single_call=True, exit=True, always_run=False, skip=False, pskip=False,
-               level=2):
+               on_result=None, max_failures=None, results_file=None,
+               record_impact=False, select=None, impact_db=None,
+               import_profile=False, warm_rewrite_cache=False,
+               shard_index=None, shard_count=None, shard_durations=None,
+               time_budget=None, rss_budget=None, repeat=None, warmup=None,
+               perf_baseline=None, perf_ratio=None, perf_fail=None,
+               update_perf_baseline=False, interpreters=None,
+               sample_profile=None, sample_rate=None, level=2):
     """Run pytest on the specified test files when the calling module is run as
     a script.  Using this function requires at least pytest 2.0.  If the module
     from which this script is called is not `__main__` then this script
@@ -164,6 +194,147 @@ def script_run(testfile_paths=None, self_test=False, pytest_args=None, pyargs=Fa
     script.  (In this case the `modify_syspath` argument is passed to the `init`
     function of `set_package_attribute`).
 
+    If `on_result` is set to a function then it is called with the result
+    record of each test as soon as that test finishes, while pytest is still
+    running.  A record is a dict with the keys `nodeid`, `when`, `outcome`,
+    `duration`, and `module` (the name of the calling module).  Failed
+    collections are also passed, with `when` set to "collect".
+
+    If `max_failures` is set to a positive integer then the test run is
+    stopped as soon as that many tests have failed.  With `single_call` false
+    the count is across all the separate pytest calls, and any remaining test
+    files are skipped.  It can be set in a config file as
+    `script_run_max_failures`.
+
+    If `results_file` is set to a filename then the result record of each test
+    is appended to that file as a line of JSON, as soon as the test finishes.
+    A relative filename is relative to the directory of the calling module.
+    The file is flushed after each record and never held in memory, so it is
+    suitable for very large test runs.  Files from parallel runs can be read
+    together or merged with the functions `read_results_files` and
+    `merge_results_files`.  It can be set in a config file as
+    `script_run_results_file`.
+
+    If `record_impact` is true then the source lines executed by each test are
+    recorded in an impact map, which is saved in the SQLite database file
+    `impact_db`.  Only files inside the git working tree of the calling module
+    (or its directory, if it is not in one) are recorded.  Later runs with
+    `select="impacted"` then compare the working tree with git `HEAD` and only
+    run the recorded tests which executed a changed line, along with any
+    changed test files (which are run in full).  The default `impact_db` is
+    the file `.pytest_helper_impact.db` at the top of the git working tree.
+    A relative `impact_db` is relative to the directory of the calling module.
+    Recording uses `sys.monitoring` on Python 3.12 and later, and the slower
+    `sys.settrace` otherwise.  The time spent in recorded tests is reported
+    at the end of the run.  The `record_impact` and `impact_db` options can be
+    set in config files as `script_run_record_impact` and
+    `script_run_impact_db`.
+
+    If `import_profile` is true then the imports made while pytest collects
+    and runs each test file are timed, and at the end of the run the slowest
+    imports of each test file are shown as a tree, with the cumulative and
+    self time of each.  Passing an integer sets the number of imports shown
+    per file (the default is 10).  Modules which were already imported before
+    pytest was called are not seen, since they are not imported again.
+    Requires Python 3.4 or later.
+
+    If `warm_rewrite_cache` is true then, before pytest collects the test
+    files, their asserts are rewritten by a pool of processes and saved in
+    pytest's cache of rewritten modules, so that pytest finds them already
+    rewritten when it imports them.  Files with an up-to-date cached version
+    are skipped.  The files are the `.py` files passed to pytest, and the
+    `conftest.py` files and files matching pytest's `python_files` setting in
+    the directories passed to it.  This can be set in config files as
+    `script_run_warm_rewrite_cache`.
+
+    Setting `shard_index` and `shard_count` runs only one shard of the tests,
+    so the tests can be split between several processes or machines.  The
+    shards are numbered from zero.  If they are not passed, they are read
+    from the environment variables `PYTEST_HELPER_SHARD_INDEX` and
+    `PYTEST_HELPER_SHARD_COUNT`.  The tests are split by test file (the
+    directories in `testfile_paths` are expanded into the test files pytest
+    collects in them, by a quick `--collect-only` run of pytest in a
+    subprocess which lists the files without importing them),
+    deterministically, so each shard can compute its own part.
+    The shards are balanced by the test durations in the results file
+    `shard_durations`, if it is set, such as the merged results file of an
+    earlier run (see `merge_shard_results`).  All the shards must use the
+    same durations file.  Files without recorded durations are balanced by
+    their sizes.  The durations file can be set in config files as
+    `script_run_shard_durations`.
+
+    Setting `time_budget` (in seconds) or `rss_budget` (in megabytes) runs
+    each test file in its own pytest subprocess, with that budget.  The value
+    can be a number, for all the files, or a dict mapping glob patterns
+    (matched against the basenames or full paths of the files) to numbers.
+    The directories in `testfile_paths` are expanded into their test files, as
+    for sharding.  A subprocess which goes over its budget has the stacks of
+    its threads dumped with `faulthandler` (on POSIX systems) and is killed,
+    along with any processes started by its tests, and the run goes on with
+    the next file.  The files over budget are listed at the end, and are
+    reported to `on_result` and the results file as failed records with `when`
+    set to "budget".  A `max_failures` limit also stops the tests within a
+    file.  The RSS budget is only checked on Linux.  The options
+    `record_impact`, `import_profile`, `warm_rewrite_cache`, `repeat`, and
+    `sample_profile` cannot be used with budgets.  The budgets can be set in
+    config files as `script_run_time_budget` and `script_run_rss_budget`.
+
+    Setting `repeat` runs each test `repeat` times in a row, after `warmup`
+    untimed runs, to use the tests as micro-benchmarks without paying the
+    startup cost of pytest for each run.  The durations of the calls of the
+    test functions are collected, and the median, 95th percentile, and
+    variance of each test are shown at the end of the run.  Tests whose
+    durations vary too much between runs to trust (a coefficient of variation
+    above 0.1) are flagged.  Pytest sees one run of each test: the last, or
+    the first which did not pass.  The duration passed to `on_result` and
+    saved in the results file is the median, and the record has the
+    statistics under the key "repeat_stats".  Only the function-scoped
+    fixtures are set up again for each run.
+
+    Setting `perf_baseline` to the name of a baseline file compares the
+    median duration of each test with its median in the baseline, as a
+    performance regression gate.  The tests are run with `repeat` (by
+    default 5 runs after 1 warmup run).  A test is a regression if its median
+    is more than `perf_ratio` times its baseline median (by default 2.0), by
+    a margin larger than the run-to-run noise of the two.  Regressions fail
+    their tests, unless `perf_fail` is false, in which case they are only
+    listed at the end of the run.  Either way their records have the
+    slowdown under the key "perf_slowdown".  Setting `update_perf_baseline`
+    true compares nothing, and saves the timings of the passing tests in the
+    baseline file instead (keeping the baselines of the other tests).  The
+    function `update_perf_baseline` does the same from results files.  The
+    options can be set in config files as `script_run_perf_baseline`,
+    `script_run_perf_ratio`, and `script_run_perf_fail`.
+
+    Setting `interpreters` to a list of Python executables (paths, or command
+    names found on `PATH`) runs pytest on the test files under each of them
+    at the same time, in subprocesses, with the same pytest arguments.  Each
+    interpreter needs pytest installed.  The records passed to `on_result`
+    and saved in the results file have the interpreter under the key
+    "interpreter".  The output of each run is shown when it finishes, and at
+    the end a matrix shows the outcome under each interpreter of the tests
+    which did not pass under all of them.  A `max_failures` limit applies to
+    each interpreter's run separately.  The options `record_impact`,
+    `import_profile`, `warm_rewrite_cache`, `repeat`, `perf_baseline`,
+    `sample_profile`, and the budgets cannot be used with `interpreters`.  It
+    can be set in config files as `script_run_interpreters`.
+
+    If `sample_profile` is set then the whole pytest session is profiled by
+    sampling the stack of the thread running the tests `sample_rate` times a
+    second (default 100), from a background thread.  The samples are
+    attributed to the node ID of the test running when they were taken, and
+    written as collapsed stacks (the input format of flamegraph tools) to the
+    file `sample_profile`, with the node IDs as the root frames.  Passing
+    `True` writes the file `pytest_helper_profile.collapsed` in the directory
+    of the calling module, and a relative filename is relative to that
+    directory.  The overhead is low enough to leave it on, a few percent at
+    the default rate.  It can be set in config files as
+    `script_run_sample_profile` and `script_run_sample_rate`.
+
+    When `exit` is false the exit code of pytest is returned.  With
+    `single_call` false the exit codes of the separate runs are merged into
+    one, as for shards.
+
     The parameter `level` is the level up the calling stack to look for the
     calling module and should not usually need to be set."""
     if skip:
@@ -179,6 +350,243 @@ def script_run(testfile_paths=None, self_test=False, pytest_args=None, pyargs=Fa
     if calling_mod_name != "__main__" and not always_run:
         return
 
+    pytest_arglist, testfile_paths = process_script_run_args(testfile_paths,
+                                  self_test, pytest_args, pyargs, calling_mod,
+                                  calling_mod_path, calling_mod_dir)
+
+    if modify_syspath or (modify_syspath is None and in_pkg):
+        set_package_attribute._delete_sys_path_0()
+
+    max_failures = get_config_value("script_run_max_failures", max_failures,
+                                    calling_mod, calling_mod_dir)
+    results_file = get_config_value("script_run_results_file", results_file,
+                                    calling_mod, calling_mod_dir)
+
+    record_impact = get_config_value("script_run_record_impact", record_impact,
+                                     calling_mod, calling_mod_dir)
+    impact_db = get_config_value("script_run_impact_db", impact_db,
+                                 calling_mod, calling_mod_dir)
+    warm_rewrite_cache = get_config_value("script_run_warm_rewrite_cache",
+                                 warm_rewrite_cache, calling_mod, calling_mod_dir)
+    shard_durations = get_config_value("script_run_shard_durations",
+                                 shard_durations, calling_mod, calling_mod_dir)
+    time_budget = get_config_value("script_run_time_budget", time_budget,
+                                   calling_mod, calling_mod_dir)
+    rss_budget = get_config_value("script_run_rss_budget", rss_budget,
+                                  calling_mod, calling_mod_dir)
+    perf_baseline = get_config_value("script_run_perf_baseline", perf_baseline,
+                                     calling_mod, calling_mod_dir)
+    perf_ratio = get_config_value("script_run_perf_ratio", perf_ratio,
+                                  calling_mod, calling_mod_dir)
+    perf_fail = get_config_value("script_run_perf_fail", perf_fail,
+                                 calling_mod, calling_mod_dir)
+    interpreters = get_config_value("script_run_interpreters", interpreters,
+                                    calling_mod, calling_mod_dir)
+    sample_profile = get_config_value("script_run_sample_profile", sample_profile,
+                                      calling_mod, calling_mod_dir)
+    sample_rate = get_config_value("script_run_sample_rate", sample_rate,
+                                   calling_mod, calling_mod_dir)
+
+    record_handlers = [on_result] if on_result else []
+    results_writer = None
+    if results_file:
+        results_writer = ResultsFileWriter(expand_relative(results_file, calling_mod_dir))
+        record_handlers.append(results_writer.write)
+
+    def handle_record(record):
+        for record_handler in record_handlers:
+            record_handler(record)
+
+    plugins = []
+    result_plugin = None
+    if record_handlers or max_failures:
+        result_plugin = ResultRecordPlugin(handle_record, calling_mod_name, max_failures)
+        plugins.append(result_plugin)
+
+    if record_impact or select:
+        git_root = impact_map.get_git_root(calling_mod_dir)
+        if impact_db:
+            impact_db = expand_relative(impact_db, calling_mod_dir)
+        else:
+            impact_db = os.path.join(git_root or calling_mod_dir,
+                                     impact_map.DEFAULT_IMPACT_DB_NAME)
+    if record_impact:
+        plugins.append(impact_map.ImpactRecorderPlugin(impact_db,
+                                                       git_root or calling_mod_dir))
+    if warm_rewrite_cache:
+        plugins.append(RewriteWarmerPlugin())
+
+    if import_profile:
+        if sys.version_info < (3, 4):
+            raise PytestHelperException("The import_profile option of script_run"
+                                        " requires Python 3.4 or later.")
+        from pytest_helper.import_profiler import (ImportProfilerPlugin,
+                                                   DEFAULT_IMPORT_PROFILE_LINES)
+        plugins.append(ImportProfilerPlugin(DEFAULT_IMPORT_PROFILE_LINES
+                           if import_profile is True else int(import_profile)))
+
+    if perf_baseline:
+        if not repeat:
+            repeat = perf_gate.DEFAULT_PERF_REPEAT
+            warmup = perf_gate.DEFAULT_PERF_WARMUP if warmup is None else warmup
+        plugins.append(perf_gate.PerfGatePlugin(
+                expand_relative(perf_baseline, calling_mod_dir),
+                perf_gate.DEFAULT_PERF_RATIO if perf_ratio is None else float(perf_ratio),
+                perf_fail is None or bool(perf_fail), update_perf_baseline))
+    elif update_perf_baseline:
+        raise PytestHelperException("The update_perf_baseline option of script_run"
+                                    " requires perf_baseline to be set.")
+    if repeat:
+        plugins.append(RepeatRunPlugin(repeat, warmup or 0))
+
+    if sample_profile:
+        plugins.append(sample_profiler.SampleProfilerPlugin(
+                expand_relative(sample_profiler.DEFAULT_SAMPLE_PROFILE_NAME
+                                if sample_profile is True else sample_profile,
+                                calling_mod_dir),
+                sample_rate or sample_profiler.DEFAULT_SAMPLE_RATE))
+
+    if select == "impacted":
+        if not git_root:
+            raise PytestHelperException("The calling module is not in a git working"
+                                        " tree, so select='impacted' cannot be used.")
+        testfile_paths = impact_map.select_impacted_tests(impact_db, testfile_paths,
+                                                          git_root, pytest_arglist)
+        if not testfile_paths:
+            print("pytest_helper: no tests are impacted by the changes.")
+    elif select is not None:
+        raise PytestHelperException("The select argument of script_run must be"
+                                    " None or 'impacted', not {0!r}.".format(select))
+
+    shard_index, shard_count = sharding.get_shard_settings(shard_index, shard_count)
+    if shard_count is not None:
+        if shard_durations:
+            shard_durations = expand_relative(shard_durations, calling_mod_dir)
+        testfile_paths = sharding.select_shard(testfile_paths, shard_index,
+                                   shard_count, shard_durations, pytest_arglist)
+        if not testfile_paths:
+            print("pytest_helper: shard {0} of {1} has no test files."
+                  .format(shard_index, shard_count))
+
+    if interpreters:
+        if (record_impact or import_profile or warm_rewrite_cache or repeat
+                or perf_baseline or sample_profile or time_budget is not None
+                or rss_budget is not None):
+            raise PytestHelperException("The record_impact, import_profile,"
+                    " warm_rewrite_cache, repeat, perf_baseline, sample_profile,"
+                    " time_budget, and rss_budget options of script_run cannot be"
+                    " used with interpreters.")
+        if isinstance(interpreters, str):
+            interpreters = [interpreters]
+        try:
+            if not testfile_paths and (select or shard_count):
+                exit_code = sharding.NO_TESTS_COLLECTED
+            else:
+                exit_code, matrix = interpreter_matrix.run_interpreter_matrix(
+                        interpreters, testfile_paths, pytest_arglist, handle_record,
+                        calling_mod_name, max_failures)
+        finally:
+            if results_writer:
+                results_writer.close()
+        if exit:
+            sys.exit(0)
+        return exit_code
+
+    if time_budget is not None or rss_budget is not None:
+        if (record_impact or import_profile or warm_rewrite_cache or repeat
+                or sample_profile):
+            raise PytestHelperException("The record_impact, import_profile,"
+                    " warm_rewrite_cache, repeat, and sample_profile options of"
+                    " script_run cannot be used with time_budget or rss_budget.")
+        try:
+            exit_code = run_files_with_budgets(testfile_paths, pytest_arglist,
+                                  time_budget, rss_budget, record_handlers,
+                                  max_failures, calling_mod_name)
+        finally:
+            if results_writer:
+                results_writer.close()
+        if exit:
+            sys.exit(0)
+        return exit_code
+
+    # Generate calling string and call pytest on the file.
+    exit_codes = []
+    try:
+        if not testfile_paths and (select or shard_count):
+            # Nothing was selected, so do not let pytest run its defaults.
+            exit_codes.append(sharding.NO_TESTS_COLLECTED)
+        elif single_call:
+            exit_codes.append(pytest.main(pytest_arglist + testfile_paths,
+                                          plugins=plugins))
+        else:
+            for testfile in testfile_paths:
+                if result_plugin and result_plugin.max_failures_reached():
+                    break # Skip the remaining files.
+                # Call pytest main; this requires pytest 2.0 or greater.
+                exit_codes.append(pytest.main(pytest_arglist + [testfile],
+                                              plugins=plugins))
+    finally:
+        if results_writer:
+            results_writer.close()
+
+    if exit:
+        sys.exit(0)
+    return sharding.merge_exit_codes(exit_codes)
+
+    #if syspath_modified: # Not exiting, so restore the system path if modified.
+    #    set set_package_attribute._restore_sys_path0() # NOTE: No longer restoring on non-exit.
+
+def run_files_with_budgets(testfile_paths, pytest_arglist, time_budget, rss_budget,
+                           record_handlers, max_failures, calling_mod_name):
+    """Run each of the test files in `testfile_paths` (after expanding any
+    directories) in a pytest subprocess with the given budgets, for
+    `script_run`.  Returns the merged exit code."""
+    num_failures = [0]
+    def handle_record(record):
+        if record["outcome"] == "failed":
+            num_failures[0] += 1
+        for record_handler in record_handlers:
+            record_handler(record)
+
+    cmd = [sys.executable, "-X", "faulthandler", "-m", "pytest",
+           "-p", "pytest_helper_reporter", "--pytest-helper-stream",
+           "--pytest-helper-module", calling_mod_name] + pytest_arglist
+    exit_codes = []
+    overruns = []
+    for testfile in sharding.find_test_files(testfile_paths, pytest_arglist):
+        if max_failures and num_failures[0] >= max_failures:
+            break # Skip the remaining files.
+        # Each subprocess stops at the failures remaining of max_failures.
+        maxfail_args = (["--maxfail={0}".format(max_failures - num_failures[0])]
+                        if max_failures else [])
+        start_time = time.time()
+        exit_code, overrun = budgets.run_file_with_budgets(
+                                 cmd + maxfail_args + [testfile],
+                                 budgets.get_file_budget(time_budget, testfile),
+                                 budgets.get_file_budget(rss_budget, testfile),
+                                 handle_record)
+        if overrun:
+            handle_record(budgets.overrun_record(testfile, overrun,
+                                         time.time() - start_time, calling_mod_name))
+            overruns.append((testfile, overrun))
+            exit_code = 1 # Count it as failed tests, whatever the signal.
+        exit_codes.append(exit_code)
+
+    if overruns:
+        print("\npytest_helper: test files over budget (killed):")
+        for testfile, overrun in overruns:
+            print("   {0}: {1}".format(testfile, overrun))
+    return sharding.merge_exit_codes(exit_codes)
+
+def process_script_run_args(testfile_paths, self_test, pytest_args, pyargs,
+                            calling_mod, calling_mod_path, calling_mod_dir):
+    """Process the arguments of `script_run` which determine what pytest is
+    run on, applying any overrides from the config file.  Returns a tuple
+    `(pytest_arglist, testfile_paths)`, where the first is the list of
+    command-line arguments to pass to pytest and the second is the list of
+    test files and directories, with relative paths expanded relative to
+    `calling_mod_dir`.  This is shared by `script_run` and the other functions
+    which run pytest with the same argument handling."""
     def convert_arg_string_to_list(arg_list_or_string):
         """Convert string pytest_args arguments to a list, keeping lists unchanged."""
         if not arg_list_or_string:
@@ -186,7 +594,7 @@ def script_run(testfile_paths=None, self_test=False, pytest_args=None, pyargs=Fa
         elif isinstance(arg_list_or_string, str):
             pytest_arglist = arg_list_or_string.split()
         else:
-            pytest_arglist = arg_list_or_string
+            pytest_arglist = list(arg_list_or_string)
         return pytest_arglist
 
     # Override arguments with any values set in the config file.
@@ -199,13 +607,12 @@ def script_run(testfile_paths=None, self_test=False, pytest_args=None, pyargs=Fa
                              get_config_value("script_run_extra_pytest_args", [],
                                              calling_mod, calling_mod_dir))
 
-    if modify_syspath or (modify_syspath is None and in_pkg):
-        set_package_attribute._delete_sys_path_0()
-
     if isinstance(testfile_paths, str):
         testfile_paths = [testfile_paths]
     elif testfile_paths is None:
         testfile_paths = []
+    else:
+        testfile_paths = list(testfile_paths) # Copy, so the caller's list is unchanged.
 
     if self_test:
         testfile_paths.append(calling_mod_path)
@@ -226,25 +633,19 @@ def script_run(testfile_paths=None, self_test=False, pytest_args=None, pyargs=Fa
     if pyargs and "--pyargs" not in pytest_arglist:
         pytest_arglist.append("--pyargs")
 
-    # Generate calling string and call pytest on the file.
-    if single_call:
-        pytest.main(pytest_arglist + testfile_paths)
-    else:
-        for testfile in testfile_paths:
-            # Call pytest main; this requires pytest 2.0 or greater.
-            pytest.main(pytest_arglist + [testfile])
-
-    if exit:
-        sys.exit(0)
-
-    #if syspath_modified: # Not exiting, so restore the system path if modified.
-    #    set set_package_attribute._restore_sys_path0() # NOTE: No longer restoring on non-exit.
+    return pytest_arglist, testfile_paths
 
 previous_sys_path_list = None # Save the sys.path before modifying it, to restore it.
+previous_meta_path_dirs = None # Likewise for the dirs of the scoped path finder.
+
+# All modifications of sys.path (and previous_sys_path_list) are serialized by
+# this lock, since the membership checks and inserts are not atomic together.
+sys_path_lock = threading.RLock()
 
 def sys_path(dirs_to_add=None, add_parent=False, add_grandparent=False,
              add_gn_parent=False, add_self=False, insert_position=1,
-             calling_mod_name=None, calling_mod_path=None, level=2):
+             warm=False, meta_path=False, calling_mod_name=None,
+             calling_mod_path=None, level=2):
     r"""Add the canonical absolute pathname of each directory in the list
     `dirs_to_add` to `sys.path` (but only if it isn't there already).  A single
     string representing a path can also be passed to `dirs_to_add`.  Relative
@@ -265,6 +666,27 @@ def sys_path(dirs_to_add=None, add_parent=False, add_grandparent=False,
     at 0 watch for conflicts with the `modify_syspath` options to `script_run`
     and `init`.
 
+    If `warm` is true then the directories which were added are warmed up to
+    make the first imports from them faster.  Their path-entry finders are
+    created and saved in `sys.path_importer_cache` immediately, and the `.py`
+    files which can be imported from them (their modules and packages) are
+    compiled to `.pyc` files in the background, by several `compileall`
+    subprocesses.  Virtualenvs and directories such as `build` and
+    `node_modules` are skipped.  The default can be set in config files as
+    `sys_path_warm`.
+
+    If `meta_path` is true then the directories are not inserted into
+    `sys.path`.  They are registered with a single finder on `sys.meta_path`
+    instead, which is searched before the `sys.path` directories.  The finder
+    keeps an index of the top-level modules and packages in the directories,
+    so imports of other names (including failed imports) do not search the
+    directories at all.  The index is rebuilt by `importlib.invalidate_caches`,
+    which should be called after new modules are created in the directories.
+    The `insert_position` is ignored; the directories are searched in the
+    order given, before those registered earlier.  The default can be set in
+    config files as `sys_path_meta_path`.  This option requires Python 3.4 or
+    later.
+
     The parameters `calling_mod_name` and `calling_mod_dir` can be set as a
     fallback in case the introspection for finding the calling module's
     information fails for some reason.  The parameter `level` is the level up
@@ -305,27 +727,47 @@ def sys_path(dirs_to_add=None, add_parent=False, add_grandparent=False,
 
     dirs_to_add = [os.path.expanduser(p) for p in dirs_to_add]
 
-    global previous_sys_path_list
-    previous_sys_path_list = sys.path[:]
-
-    for path in reversed(dirs_to_add): # Reverse since all inserted at insert_position.
-        if os.path.isabs(path):
-            path = os.path.realpath(path) # Convert to canonical path.
-            if path not in sys.path:
-                sys.path.insert(insert_position, path)
+    # Expand the paths before taking the lock, since realpath does filesystem calls.
+    expanded_dirs = [expand_relative(path, calling_mod_dir) for path in dirs_to_add]
+
+    use_meta_path = get_config_value("sys_path_meta_path", meta_path,
+                                     calling_mod, calling_mod_dir)
+    if use_meta_path and sys.version_info < (3, 4):
+        raise PytestHelperException("The meta_path option of sys_path requires"
+                                    " Python 3.4 or later.")
+
+    global previous_sys_path_list, previous_meta_path_dirs
+    added_dirs = []
+    with sys_path_lock:
+        previous_sys_path_list = sys.path[:]
+        previous_meta_path_dirs = sys_path_tools.scoped_path_finder.dirs[:]
+        if use_meta_path:
+            added_dirs = sys_path_tools.scoped_path_finder.add_dirs(
+                              [p for p in expanded_dirs if p not in sys.path], 0)
+            sys_path_tools.scoped_path_finder.install()
         else:
-            joined_path = expand_relative(path, calling_mod_dir)
-            if joined_path not in sys.path:
-                sys.path.insert(insert_position, joined_path)
+            for path in reversed(expanded_dirs): # Reverse since all inserted at insert_position.
+                if path not in sys.path:
+                    sys.path.insert(insert_position, path)
+                    added_dirs.append(path)
+
+    sys_path_tools.record_added_dirs(added_dirs, calling_mod_name)
+    if get_config_value("sys_path_warm", warm, calling_mod, calling_mod_dir):
+        sys_path_tools.warm_sys_path_dirs(added_dirs)
     return
 
 def restore_previous_sys_path():
     """This function undoes the effect of the last call to `sys_path`, returning
     `sys.path` to its previous, saved value.  This can be useful at times."""
-    global previous_sys_path_list
-    if previous_sys_path_list is not None:
-        sys.path = previous_sys_path_list
-        previous_sys_path_list = None
+    global previous_sys_path_list, previous_meta_path_dirs
+    with sys_path_lock:
+        if previous_sys_path_list is not None:
+            sys.path = previous_sys_path_list
+            previous_sys_path_list = None
+        if previous_meta_path_dirs is not None:
+            if previous_meta_path_dirs != sys_path_tools.scoped_path_finder.dirs:
+                sys_path_tools.scoped_path_finder.set_dirs(previous_meta_path_dirs)
+            previous_meta_path_dirs = None
 
 def init(modify_syspath=None, conf=True,
          calling_mod_name=None, calling_mod_path=None, level=2):
@@ -374,7 +816,8 @@ def init(modify_syspath=None, conf=True,
 #
 
 def locals_to_globals(fun_locals=None, fun_globals=None, clear=False,
-                      noclobber=True, ignore_params=True, level=2):
+                      noclobber=True, ignore_params=True, evict=None, weak=False,
+                      level=2):
     """Copy all local variables in the calling test function's local scope to
     the global scope of the module from which that function was called.  The
     test function's parameters are ignored (i.e., they are local variables but
@@ -421,6 +864,22 @@ def locals_to_globals(fun_locals=None, fun_globals=None, clear=False,
 
     to bypass the introspection used to locate the two dicts.
 
+    If `evict` is true then the approximate size in bytes of each copied value
+    is tracked, and the copied globals are deleted automatically when the last
+    test of the module has been torn down.  This requires the pytest plugin
+    `pytest_helper.plugin` to be loaded (for example with `-p
+    pytest_helper.plugin`), which also reports the bytes retained per module
+    at the end of the session.  The sizes are also available from
+    `retained_globals_report`.  The default for `evict` can be set in config
+    files as `locals_to_globals_evict`, and is otherwise false.
+
+    If `weak` is true then values which support weak references are copied to
+    the globals as `weakref.proxy` objects, so the globals do not keep them
+    alive.  This is only useful for values which are also held elsewhere for
+    as long as the tests need them, such as the value of a module-scoped
+    fixture.  Other values are copied as usual.  Weakly-held values count as
+    zero retained bytes.
+
     The `level` argument is the level up the calling stack to look for the
     calling function.  In order to call an intermediate function which then
     calls this function, for example, `level` would need to be increased by
@@ -433,15 +892,18 @@ def locals_to_globals(fun_locals=None, fun_globals=None, clear=False,
     if not fun_globals:
         fun_globals = get_calling_fun_globals_dict(level)
 
-    if NAME_OF_PYTEST_HELPER_PER_MODULE_INFO_DICT not in fun_globals:
-        fun_globals[NAME_OF_PYTEST_HELPER_PER_MODULE_INFO_DICT] = {}
-    module_info_dict = fun_globals[NAME_OF_PYTEST_HELPER_PER_MODULE_INFO_DICT]
+    module_info_dict = fun_globals.setdefault(
+                                 NAME_OF_PYTEST_HELPER_PER_MODULE_INFO_DICT, {})
+    globals_copied_to_list = module_info_dict.setdefault(
+                                 "list_of_globals_copied_to_locals", [])
 
-    if "list_of_globals_copied_to_locals" in module_info_dict:
-        globals_copied_to_list = module_info_dict["list_of_globals_copied_to_locals"]
-    else:
-        globals_copied_to_list = []
-        module_info_dict["list_of_globals_copied_to_locals"] = globals_copied_to_list
+    if evict is None and fun_globals.get("__name__") in sys.modules:
+        mod_info = get_calling_module_info(module_name=fun_globals["__name__"],
+                                           level=level+1)
+        evict = get_config_value("locals_to_globals_evict", False,
+                                 mod_info[1], mod_info[3])
+    if evict:
+        tracked_sizes = module_info_dict.setdefault("tracked_global_sizes", {})
 
     if clear:
         clear_locals_from_globals(level=level+1) # One extra level from this fun.
@@ -451,8 +913,8 @@ def locals_to_globals(fun_locals=None, fun_globals=None, clear=False,
     args, varargs, varkw, defaults, kwonlyargs, kwonlydefaults, annotations = \
                                             get_calling_fun_parameters(level)
     params = list(args) if args else []
-    params = params + varargs if varargs else params
-    params = params + varkw if varkw else params
+    params = params + [varargs] if varargs else params
+    params = params + [varkw] if varkw else params
     params = params + kwonlyargs if kwonlyargs else params
 
     # Do the actual copies.
@@ -467,8 +929,13 @@ def locals_to_globals(fun_locals=None, fun_globals=None, clear=False,
                       " module-global variable '{0}'.  The current value is"
                       " {1}.  Attempted to overwrite with a value of {2}."
                                     .format(k, str(fun_globals[k]), str(v)))
-        fun_globals[k] = fun_locals[k]
+        _record_global_change(module_info_dict, fun_globals, k)
+        value = weak_proxy_if_possible(v) if weak else v
+        fun_globals[k] = value
         globals_copied_to_list.append(k)
+        if evict:
+            _set_tracked_size(fun_globals, tracked_sizes, k,
+                              0 if value is not v else get_value_size(v))
     return
 
 def clear_locals_from_globals(level=2):
@@ -479,15 +946,213 @@ def clear_locals_from_globals(level=2):
     g = get_calling_fun_globals_dict(level)
     if NAME_OF_PYTEST_HELPER_PER_MODULE_INFO_DICT not in g:
         return
-    globals_copied_to_list = g[NAME_OF_PYTEST_HELPER_PER_MODULE_INFO_DICT].get(
+    module_info_dict = g[NAME_OF_PYTEST_HELPER_PER_MODULE_INFO_DICT]
+    globals_copied_to_list = module_info_dict.get(
             "list_of_globals_copied_to_locals", [])
+    tracked_sizes = module_info_dict.get("tracked_global_sizes", {})
     for k in globals_copied_to_list:
+        _record_global_change(module_info_dict, g, k)
         try:
             del g[k]
         except KeyError:
             pass # Ignore if not there.
+        if k in tracked_sizes:
+            _set_tracked_size(g, tracked_sizes, k, None)
     del globals_copied_to_list[:] # Empty out globals_copied_to_list in-place.
 
+_MISSING = object() # Marks a global which did not exist before a change was recorded.
+
+def _record_global_change(module_info_dict, fun_globals, k):
+    """Save the current value of global `k` in the undo log of each active
+    `globals_scope` for the module, unless that log already has an entry for
+    `k`.  Only the first (i.e., the original) value is kept."""
+    for undo_log in module_info_dict.get("globals_scope_undo_logs", ()):
+        if k not in undo_log:
+            undo_log[k] = fun_globals.get(k, _MISSING)
+
+class globals_scope(object):
+    """A context manager which undoes all the changes made to module globals
+    by `locals_to_globals` and `clear_locals_from_globals` inside its scope.
+    On exit every global that those functions set, overwrote, or deleted is
+    restored to its exact previous state, including globals which were
+    overwritten because `noclobber` was set false.  The list of globals that
+    `clear_locals_from_globals` will clear is restored, too.  Use it as::
+
+       with pytest_helper.globals_scope():
+           my_setup()
+           # ... test code ...
+
+    Only the names actually changed are recorded (an undo log), so the cost is
+    proportional to the number of globals touched rather than to the size of
+    the module's namespace.  Scopes can be nested.  See also the fixture
+    `globals_scope_fixture`, which wraps a whole test in a scope.
+
+    The `fun_globals` argument can be passed `globals()` as a fallback in case
+    the introspection does not work.  The `level` argument is the level up the
+    calling stack to look for the calling module's globals."""
+
+    def __init__(self, fun_globals=None, level=2):
+        if not fun_globals:
+            fun_globals = get_calling_fun_globals_dict(level)
+        self.fun_globals = fun_globals
+
+    def __enter__(self):
+        module_info_dict = self.fun_globals.setdefault(
+                                 NAME_OF_PYTEST_HELPER_PER_MODULE_INFO_DICT, {})
+        self.saved_copied_list = module_info_dict.setdefault(
+                                     "list_of_globals_copied_to_locals", [])[:]
+        self.saved_tracked_sizes = module_info_dict.get("tracked_global_sizes", {}).copy()
+        self.undo_log = {}
+        module_info_dict.setdefault("globals_scope_undo_logs", []).append(self.undo_log)
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        module_info_dict = self.fun_globals[NAME_OF_PYTEST_HELPER_PER_MODULE_INFO_DICT]
+        module_info_dict["globals_scope_undo_logs"].remove(self.undo_log)
+        for k, v in self.undo_log.items():
+            if v is _MISSING:
+                self.fun_globals.pop(k, None)
+            else:
+                self.fun_globals[k] = v
+        # Restore in-place, since clear_locals_from_globals may hold a reference.
+        module_info_dict["list_of_globals_copied_to_locals"][:] = self.saved_copied_list
+        tracked_sizes = module_info_dict.get("tracked_global_sizes", {})
+        for k in set(tracked_sizes) | set(self.saved_tracked_sizes):
+            _set_tracked_size(self.fun_globals, tracked_sizes, k,
+                              self.saved_tracked_sizes.get(k))
+        return False
+
+@pytest.fixture
+def globals_scope_fixture(request):
+    """A pytest fixture which runs the test inside a `globals_scope` for the
+    test's module, so any globals set by `locals_to_globals` during the test
+    (including in its other fixtures) are restored afterward.  Import it into
+    the test module, or into a `conftest.py` file, and request it like any
+    other fixture (or list it in `pytest.mark.usefixtures`)."""
+    with globals_scope(fun_globals=request.module.__dict__):
+        yield
+
+#
+# Tracking and evicting the memory retained by globals from locals_to_globals.
+#
+
+# The approximate bytes retained by the globals tracked with `evict`, keyed on
+# module names.  The values are lists `[current_bytes, peak_bytes]`.
+retained_globals_bytes = {}
+retained_globals_lock = threading.Lock()
+
+# Containers with more items than this have their size estimated from a sample.
+VALUE_SIZE_SAMPLE_ITEMS = 1000
+
+def get_value_size(value, max_depth=4):
+    """Return the approximate memory in bytes used by `value`.  The items of
+    builtin containers are included, down to `max_depth` levels, with large
+    containers estimated from a sample of their items.  Objects which count
+    their own data in `__sizeof__`, like numpy arrays and pandas DataFrames,
+    are measured by `sys.getsizeof` alone."""
+    seen = set()
+    def size(obj, depth):
+        if id(obj) in seen:
+            return 0
+        seen.add(id(obj))
+        try:
+            total = sys.getsizeof(obj)
+        except TypeError: # Some extension types do not support it.
+            return 0
+        if depth >= max_depth:
+            return total
+        if isinstance(obj, dict):
+            items = obj.items()
+        elif isinstance(obj, (list, tuple, set, frozenset)):
+            items = obj
+        else:
+            return total
+        num_items = len(obj)
+        sample_size = 0
+        for i, item in enumerate(items):
+            if i == VALUE_SIZE_SAMPLE_ITEMS:
+                return total + sample_size * num_items // VALUE_SIZE_SAMPLE_ITEMS
+            if isinstance(obj, dict):
+                sample_size += size(item[0], depth+1) + size(item[1], depth+1)
+            else:
+                sample_size += size(item, depth+1)
+        return total + sample_size
+    return size(value, 0)
+
+def weak_proxy_if_possible(value):
+    """Return a `weakref.proxy` to `value` if it supports weak references, and
+    otherwise `value` itself."""
+    try:
+        return weakref.proxy(value)
+    except TypeError:
+        return value
+
+def _set_tracked_size(module_globals, tracked_sizes, k, size):
+    """Set the tracked size of global `k` to `size` in the dict `tracked_sizes`
+    of its module, or remove it if `size` is `None`, and update the retained
+    bytes of the module."""
+    old_size = tracked_sizes.pop(k, 0)
+    if size is not None:
+        tracked_sizes[k] = size
+    module_name = module_globals.get("__name__")
+    with retained_globals_lock:
+        retained = retained_globals_bytes.setdefault(module_name, [0, 0])
+        retained[0] += (size or 0) - old_size
+        retained[1] = max(retained[0], retained[1])
+
+def evict_tracked_globals(module_globals):
+    """Delete all the globals copied by `locals_to_globals` with `evict` set
+    from the dict `module_globals`.  Returns the number of bytes released
+    (approximately).  This is called by the plugin `pytest_helper.plugin` after
+    the last test of each module has been torn down."""
+    module_info_dict = module_globals.get(NAME_OF_PYTEST_HELPER_PER_MODULE_INFO_DICT)
+    if not module_info_dict or not module_info_dict.get("tracked_global_sizes"):
+        return 0
+    tracked_sizes = module_info_dict["tracked_global_sizes"]
+    released = sum(tracked_sizes.values())
+    copied_list = module_info_dict.get("list_of_globals_copied_to_locals", [])
+    copied_list[:] = [k for k in copied_list if k not in tracked_sizes]
+    for k in list(tracked_sizes):
+        _record_global_change(module_info_dict, module_globals, k)
+        module_globals.pop(k, None)
+        _set_tracked_size(module_globals, tracked_sizes, k, None)
+    return released
+
+def retained_globals_report():
+    """Return a dict, keyed on module names, of the bytes retained by the
+    globals which `locals_to_globals` copied with `evict` set.  Each value
+    is a tuple `(current_bytes, peak_bytes)`.  The sizes are estimates made
+    when the values were copied."""
+    with retained_globals_lock:
+        return dict((name, tuple(retained))
+                    for name, retained in retained_globals_bytes.items())
+
+# Cache of unindent results, keyed on (unindent_level, string).  Looking up the
+# same string object again is fast since Python caches a string's hash and the
+# key comparison checks identity first.  The cache is cleared when the total
+# length of the cached strings would exceed UNINDENT_CACHE_MAX_CHARS or the
+# number of entries would exceed UNINDENT_CACHE_MAX_ENTRIES.
+UNINDENT_CACHE_MAX_CHARS = 2**26
+UNINDENT_CACHE_MAX_ENTRIES = 1024
+unindent_cache = {}
+unindent_cache_chars = [0] # In a list so it can be updated from functions.
+
+# Lock for the updates of unindent_cache, so that unindent_cache_chars always
+# matches the cached strings when several threads call unindent.
+unindent_cache_lock = threading.Lock()
+
+# Compiled regexes for unindent, keyed on the unindent level.  A match is a
+# non-whitespace character within the first unindent_level characters of a line.
+unindent_regex_cache = {}
+
+def get_unindent_bad_line_regex(unindent_level):
+    """Return the compiled regex which finds lines that cannot be unindented
+    by `unindent_level` characters."""
+    if unindent_level not in unindent_regex_cache:
+        unindent_regex_cache[unindent_level] = re.compile(
+                r"^[^\S\n]{{0,{0}}}\S".format(unindent_level-1), re.MULTILINE)
+    return unindent_regex_cache[unindent_level]
+
 def unindent(unindent_level, string):
     """Strip indentation from a docstring.  This function is useful in tests
     where you have assertions that something equals a multi-line string.  It
@@ -499,24 +1164,208 @@ def unindent(unindent_level, string):
     `unindent_level` characters from the beginning of each line.  Then 4) the
     modified lines are joined with newline and returned.  Raises an exception
     on an attempt to strip non-whitespace or if there are fewer than two
-    lines."""
-    # Use split instead of splitlines because splitlines drops an single trailing
+    lines.
+
+    Results are cached, so calling the function repeatedly on the same string
+    (such as a string literal inside a loop or a parametrized test) is fast.
+    See `unindent_lines` for a version which generates the lines lazily."""
+    cache_key = (unindent_level, string)
+    cached = unindent_cache.get(cache_key) # A single lookup, in case of threads.
+    if cached is not None:
+        return cached
+
+    # Use find instead of splitlines because splitlines drops an single trailing
     # newline if any are there.
-    lines = string.split("\n")
-    if len(lines) < 2:
+    first_newline = string.find("\n")
+    if first_newline < 0:
         raise PytestHelperException("String argument to unindent must have at least"
                 " two lines, since the first and last lines are discarded.  The string"
                 " argument was: '{0}'".format(string))
 
-    lines = lines[1:-1] # Discard first and last line.
-    for line in lines:
-        string_to_strip = line[0:unindent_level]
-        if not string_to_strip.lstrip() == "":
+    # The lines between the first and last line, as a single block.
+    block = string[first_newline+1:string.rfind("\n")]
+
+    # The validation and stripping are done on the whole block with string
+    # methods and a regex, rather than line by line.  The common case where
+    # every line starts with at least unindent_level spaces is checked first.
+    newline_block = "\n" + block
+    newline_indent = "\n" + " " * unindent_level
+    if unindent_level <= 0:
+        stripped = block
+    elif newline_block.count(newline_indent) == newline_block.count("\n"):
+        stripped = newline_block.replace(newline_indent, "\n")[1:]
+    else:
+        bad_line_match = get_unindent_bad_line_regex(unindent_level).search(block)
+        if bad_line_match:
+            line_start = bad_line_match.start()
+            line_end = block.find("\n", line_start)
+            line = block[line_start:line_end if line_end >= 0 else len(block)]
             raise PytestHelperException("Attempt to unindent non-whitespace at"
                     " the beginning of this line:\n'{0}'".format(line))
-    stripped = "\n".join(s[unindent_level:] for s in lines)
+        stripped = "\n".join(s[unindent_level:] for s in block.split("\n"))
+
+    num_chars = len(string) + len(stripped)
+    if num_chars > UNINDENT_CACHE_MAX_CHARS:
+        return stripped
+    with unindent_cache_lock:
+        if cache_key in unindent_cache: # Added by another thread.
+            return stripped
+        if (unindent_cache_chars[0] + num_chars > UNINDENT_CACHE_MAX_CHARS
+                or len(unindent_cache) >= UNINDENT_CACHE_MAX_ENTRIES):
+            unindent_cache.clear()
+            unindent_cache_chars[0] = 0
+        unindent_cache[cache_key] = stripped
+        unindent_cache_chars[0] += num_chars
     return stripped
 
+def unindent_lines(unindent_level, string):
+    """A generator version of `unindent` which yields the unindented lines
+    one at a time (without newlines), rather than returning them joined as a
+    single string.  The lines are produced lazily, so the full result is never
+    held in memory and an exception for non-whitespace is only raised when the
+    offending line is reached.  Lines are otherwise processed exactly as in
+    `unindent`."""
+    first_newline = string.find("\n")
+    if first_newline < 0:
+        raise PytestHelperException("String argument to unindent must have at least"
+                " two lines, since the first and last lines are discarded.  The string"
+                " argument was: '{0}'".format(string))
+    last_newline = string.rfind("\n")
+
+    line_start = first_newline + 1
+    while line_start <= last_newline:
+        line_end = string.find("\n", line_start)
+        line = string[line_start:line_end]
+        if line[0:unindent_level].strip():
+            raise PytestHelperException("Attempt to unindent non-whitespace at"
+                    " the beginning of this line:\n'{0}'".format(line))
+        yield line[unindent_level:]
+        line_start = line_end + 1
+
+def assert_text_equal(actual, expected, max_mismatches=3, context_lines=2,
+                      max_line_length=200, chunk_size=2**20):
+    """Assert that the text `actual` equals the text `expected`, for use in
+    place of `assert actual == expected` when the texts can be very large.
+    When the assertion fails an `AssertionError` is raised which shows only
+    the first `max_mismatches` mismatching lines, each with `context_lines`
+    lines of preceding context and with long lines truncated to
+    `max_line_length` characters.  The full diff and repr which pytest would
+    otherwise build for a failed `==` on the strings is avoided, as is the
+    memory it uses.  A passing comparison is a single `==`.
+
+    The arguments can be strings or readable file-like objects (in which case
+    the comparison is done lazily, in chunks of `chunk_size` characters, and
+    on failure the files are re-read line by line from their initial
+    positions if they are seekable).  This function is imported by
+    `autoimport` by default."""
+    __tracebackhide__ = True # Hide this function in pytest tracebacks.
+
+    actual_is_file = hasattr(actual, "read")
+    expected_is_file = hasattr(expected, "read")
+    if not actual_is_file and not expected_is_file:
+        if actual == expected:
+            return
+        actual_lines, expected_lines = iter_text_lines(actual), iter_text_lines(expected)
+    else:
+        actual_start = actual.tell() if actual_is_file and actual.seekable() else None
+        expected_start = (expected.tell() if expected_is_file and expected.seekable()
+                          else None)
+        if text_chunks_equal(actual, expected, chunk_size):
+            return
+        if ((actual_is_file and actual_start is None) or
+                (expected_is_file and expected_start is None)):
+            raise AssertionError("The texts differ (the file-like argument is not"
+                                 " seekable, so the mismatching lines are not shown).")
+        if actual_is_file:
+            actual.seek(actual_start)
+            actual_lines = iter_file_lines(actual)
+        else:
+            actual_lines = iter_text_lines(actual)
+        if expected_is_file:
+            expected.seek(expected_start)
+            expected_lines = iter_file_lines(expected)
+        else:
+            expected_lines = iter_text_lines(expected)
+
+    def shorten(line):
+        if line is None:
+            return "<no line>"
+        if len(line) > max_line_length:
+            return repr(line[:max_line_length]) + "..."
+        return repr(line)
+
+    report = []
+    num_mismatches = 0
+    context = collections.deque(maxlen=context_lines)
+    line_pairs = zip_longest(actual_lines, expected_lines)
+    for line_num, (actual_line, expected_line) in enumerate(line_pairs, 1):
+        if actual_line == expected_line:
+            context.append((line_num, actual_line))
+            continue
+        num_mismatches += 1
+        report.append("Mismatch at line {0}:".format(line_num))
+        report.extend("      {0:>8}  {1}".format(n, shorten(line)) for n, line in context)
+        report.append("    - {0:>8}  {1}".format(line_num, shorten(actual_line)))
+        report.append("    + {0:>8}  {1}".format(line_num, shorten(expected_line)))
+        context.clear()
+        if num_mismatches >= max_mismatches:
+            report.append("(Only the first {0} mismatches are shown.)".format(
+                                                                  max_mismatches))
+            break
+    raise AssertionError("The texts differ (- is actual, + is expected).\n"
+                         + "\n".join(report))
+
+def text_chunks_equal(text1, text2, chunk_size):
+    """Compare two texts, either of which can be a string or a readable
+    file-like object, reading `chunk_size` characters at a time.  Returns
+    true if they are equal."""
+    def iter_chunks(text):
+        if hasattr(text, "read"):
+            while True:
+                chunk = text.read(chunk_size)
+                if not chunk:
+                    return
+                yield chunk
+        else:
+            for i in range(0, len(text), chunk_size):
+                yield text[i:i+chunk_size]
+
+    # The chunks from a file can be shorter than chunk_size, so buffer them.
+    chunks1, chunks2 = iter_chunks(text1), iter_chunks(text2)
+    buffer1, buffer2 = "", ""
+    while True:
+        if not buffer1:
+            buffer1 = next(chunks1, "")
+        if not buffer2:
+            buffer2 = next(chunks2, "")
+        if not buffer1 or not buffer2:
+            return not buffer1 and not buffer2
+        length = min(len(buffer1), len(buffer2))
+        if buffer1[:length] != buffer2[:length]:
+            return False
+        buffer1, buffer2 = buffer1[length:], buffer2[length:]
+
+def iter_text_lines(string):
+    """Lazily iterate over the lines of `string`, split on newlines, giving the
+    same lines as `string.split("\\n")`."""
+    line_start = 0
+    while True:
+        line_end = string.find("\n", line_start)
+        if line_end < 0:
+            yield string[line_start:]
+            return
+        yield string[line_start:line_end]
+        line_start = line_end + 1
+
+def iter_file_lines(file_obj):
+    """Lazily iterate over the lines of the file-like object `file_obj`, giving
+    the same lines as `iter_text_lines` on the file's contents."""
+    line = ""
+    for line in file_obj:
+        yield line[:-1] if line.endswith("\n") else line
+    if not line or line.endswith("\n"):
+        yield ""
+
 autoimport_DEFAULTS = [("pytest", pytest), # (<nameToImportAs>, <value>)
                         ("raises", pytest.raises),
                         ("fail", pytest.fail),
@@ -527,6 +1376,7 @@ autoimport_DEFAULTS = [("pytest", pytest), # (<nameToImportAs>, <value>)
                         ("locals_to_globals", locals_to_globals),
                         ("clear_locals_from_globals", clear_locals_from_globals),
                         ("unindent", unindent),
+                        ("assert_text_equal", assert_text_equal),
                        ]
 
 def autoimport(noclobber=True, skip=None,
@@ -546,10 +1396,25 @@ def autoimport(noclobber=True, skip=None,
     importing, if just one or two are causing problems locally to a file.
 
     The default variables that are imported from the `pytest_helper` module are
-    `locals_to_globals`, `clear_locals_from_globals`, and `unindent`.  The
+    `locals_to_globals`, `clear_locals_from_globals`, `unindent`, and
+    `assert_text_equal`.  The
     module `pytest` is imported as `pytest`.  The functions from pytest that
     are imported by default are `raises`, `fail`, `fixture`, and `skip`,
-    `xfail`, and `approx`."""
+    `xfail`, and `approx`.
+
+    If `autoimport_at_collection = True` is set in a config file and the
+    plugin `pytest_helper.plugin` is loaded then the names are put into each
+    test module when pytest collects it, before the module is executed.  A
+    call to `autoimport` from such a module only removes the names in
+    `skip`."""
+
+    g = get_calling_fun_globals_dict(level=level)
+    injected_bundle = get_injected_bundle(g)
+    if injected_bundle is not None: # Already injected at collection.
+        for name in skip or ():
+            if name in injected_bundle and g.get(name) is injected_bundle[name]:
+                del g[name]
+        return
 
     mod_info = get_calling_module_info(module_name=calling_mod_name,
                                        module_path=calling_mod_path, level=level)
@@ -572,8 +1437,6 @@ def autoimport(noclobber=True, skip=None,
         except KeyError:
             raise
 
-    g = get_calling_fun_globals_dict(level=level)
-
     for name, value in autoimport_DEFAULTS:
         if skip and name in skip: continue
         insert_in_dict(g, name, value, noclobber)
@@ -600,13 +1463,12 @@ def expand_relative(path, basepath):
 # level 1 is the attribute of the calling function, level 2 is the function
 # that called the calling function, etc.
 
-module_info_cache = {} # Save info on modules, keyed on module names.
-
 def get_calling_module_info(level=2, check_exists=True,
                             module_name=None, module_path=None):
     """A higher-level routine to get information about the module of a function
     back some number of levels in the call stack (the calling function).
-    Returns a tuple::
+    Returns a `ModuleInfo` record, which can be unpacked and indexed like the
+    tuple::
 
        (calling_module_name,
         calling_module,
@@ -618,10 +1480,11 @@ def get_calling_module_info(level=2, check_exists=True,
     true then a check is made to make sure that the module actually exists at
     the path.
 
-    Absolute paths are cached in a dict keyed on module names so we always get
-    the pathname calculated on the first call to this program from a given
-    module.  This is important in cases where the CWD is changed between the
-    initial loading time for a module and the time it (indirectly) calls this
+    The records are cached in a registry keyed weakly on the module objects
+    (see `pytest_helper.module_registry`), so we always get the pathname
+    calculated on the first call to this program from a given module.  This
+    is important in cases where the CWD is changed between the initial
+    loading time for a module and the time it (indirectly) calls this
     routine.  Such problems are rare, but if they occur you can use these two
     lines near the top of the module (before any imports which might change
     CWD)::
@@ -633,8 +1496,8 @@ def get_calling_module_info(level=2, check_exists=True,
     introspection still fails for some reason (or just to slightly improve
     efficiency)."""
 
-    # Note that caching of looked-up calling module info is done using the
-    # fully-qualified module name as the key (just like sys.modules uses).  Not
+    # Note that caching of looked-up calling module info is keyed on the module
+    # objects, with a secondary index on the fully-qualified module names.  Not
     # everything can be cached, but the calling_module_dir is one thing that is
     # cached.
     #
@@ -643,15 +1506,24 @@ def get_calling_module_info(level=2, check_exists=True,
 
     if module_name:
         calling_module_name = module_name
-        calling_module = sys.modules[calling_module_name]
+        calling_module = sys.modules.get(calling_module_name)
+        if calling_module is None: # Can still be alive outside sys.modules.
+            calling_module = module_info_registry.find_module(calling_module_name)
+        if calling_module is None:
+            raise KeyError(calling_module_name)
     else:
         # Call low-level routine to do the introspection.
         calling_module_name, calling_module = get_calling_module(level)
 
+    cached_info = None if module_path else module_info_registry.get(calling_module)
     if module_path:
         calling_module_path = module_path
-    elif calling_module_name in module_info_cache:
-        return module_info_cache[calling_module_name]
+    elif NAME_OF_PYTEST_HELPER_PER_MODULE_INFO_DICT in vars(calling_module) and (
+            "module_info" in vars(calling_module)[NAME_OF_PYTEST_HELPER_PER_MODULE_INFO_DICT]):
+        # Precomputed at collection time by `precompute_module_info`.
+        return vars(calling_module)[NAME_OF_PYTEST_HELPER_PER_MODULE_INFO_DICT]["module_info"]
+    elif cached_info is not None:
+        return cached_info
     elif hasattr(calling_module, "__file__"):
         calling_module_path = os.path.realpath(
                                    os.path.abspath(calling_module.__file__))
@@ -674,11 +1546,29 @@ def get_calling_module_info(level=2, check_exists=True,
 
     in_pkg = os.path.exists(os.path.join(calling_module_dir, "__init__.py"))
 
-    module_info = (calling_module_name, calling_module,
-                   calling_module_path, calling_module_dir, in_pkg)
-
-    module_info_cache[calling_module_name] = module_info
-    return module_info
+    module_info = module_info_registry.new_record(calling_module, calling_module_name,
+                                 calling_module_path, calling_module_dir, in_pkg)
+
+    if module_path: # An explicitly-passed path always replaces the cached info.
+        return module_info_registry.set(calling_module, module_info)
+    return module_info_registry.setdefault(calling_module, module_info)
+
+def precompute_module_info(module):
+    """Look up the module info record (as returned by `get_calling_module_info`)
+    and the config-file settings of the module `module`, and save them in its
+    per-module info dict.  Later calls from the module then use the saved
+    values without introspection or config-file lookups.  This is called by
+    the plugin `pytest_helper.plugin` for each test module it collects."""
+    if sys.modules.get(module.__name__) is not module or not hasattr(module, "__file__"):
+        return # Cannot be looked up by name, or has no path.
+    mod_info = get_calling_module_info(module_name=module.__name__)
+    module_info_dict = vars(module).setdefault(
+                                 NAME_OF_PYTEST_HELPER_PER_MODULE_INFO_DICT, {})
+    module_info_dict["module_info"] = mod_info
+    try:
+        get_effective_config(module, mod_info[3]) # Saved in the module_info_dict.
+    except PytestHelperException:
+        pass # A missing config file is reported when the config is used.
 
 def view_locals_up_stack(num_levels=4):
     """Just to get an idea of what things look like.  Run from somewhere and see."""
@@ -700,17 +1590,42 @@ def show_globals(level=2, filt=True):
         if filt and k.startswith("__"): continue
         print("    {0} = {1}".format(k, v))
 
+def get_frame(level=1):
+    """Return the frame `level` levels up the calling stack, with the same
+    numbering as `inspect.stack()`.  Level 0 is the frame of this function and
+    level 1 is the frame of the function that called it.  Uses
+    `sys._getframe` when it is available, since `inspect.stack` builds the
+    info (including source lines) for every frame on the stack."""
+    if hasattr(sys, "_getframe"):
+        return sys._getframe(level)
+    return inspect.stack()[level][0]
+
 def get_calling_fun_parameters(level=2):
     """Note that in calling this function you have to increase the level by
     one since it is also on the stack when it does the lookup.
        level 0: This function.
        level 1: The frame of the function that called this function.
        level 2: The frame of the function that called the calling function."""
-    calling_fun_frame = inspect.stack()[level][0]
+    calling_fun_frame = get_frame(level+1)
     #params, _, _, values = inspect.getargvalues(calling_fun_frame)
     #return (params, values)
-    args, varargs, varkw, defaults, kwonlyargs, kwonlydefaults, annotations = (
-            inspect.getfullargspec(calling_fun_frame))
+    # The getfullargspec function only takes callables, not frames, so the
+    # parameters are read from the frame's code object.  The defaults and
+    # annotations are not available from a code object and are returned empty.
+    code = calling_fun_frame.f_code
+    num_args = code.co_argcount
+    num_kwonlyargs = getattr(code, "co_kwonlyargcount", 0) # Not in Python 2.
+    args = list(code.co_varnames[:num_args])
+    kwonlyargs = list(code.co_varnames[num_args:num_args+num_kwonlyargs])
+    next_index = num_args + num_kwonlyargs
+    varargs = None
+    if code.co_flags & inspect.CO_VARARGS:
+        varargs = code.co_varnames[next_index]
+        next_index += 1
+    varkw = None
+    if code.co_flags & inspect.CO_VARKEYWORDS:
+        varkw = code.co_varnames[next_index]
+    defaults, kwonlydefaults, annotations = None, None, {}
     return args, varargs, varkw, defaults, kwonlyargs, kwonlydefaults, annotations
 
 def get_calling_fun_locals_dict(level=2):
@@ -719,7 +1634,7 @@ def get_calling_fun_locals_dict(level=2):
        level 0: The locals dict of this function.
        level 1: The locals dict of the function that called this function.
        level 2: The locals dict of the function that called the calling function."""
-    calling_fun_frame = inspect.stack()[level][0]
+    calling_fun_frame = get_frame(level+1)
     calling_fun_locals = calling_fun_frame.f_locals
     return calling_fun_locals
 
@@ -729,7 +1644,7 @@ def get_calling_fun_globals_dict(level=2):
        level 0: The globals dict of this function.
        level 1: The globals dict of the function that called this function.
        level 2: The globals dict of the function that called the calling function."""
-    calling_fun_frame = inspect.stack()[level][0]
+    calling_fun_frame = get_frame(level+1)
     calling_fun_globals = calling_fun_frame.f_globals
     return calling_fun_globals
 
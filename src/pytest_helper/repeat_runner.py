@@ -0,0 +1,168 @@
+# -*- coding: utf-8 -*-
+"""
+Description
+-----------
+
+This module contains the pytest plugin used by the `repeat` and `warmup`
+options of `script_run`, which run each test many times in the same process
+to time it as a micro-benchmark.  Each test is run `warmup` times untimed and
+then `repeat` times timed, all in a row, so the process and the fixtures of
+the module and the session stay warm.  Only the test's own (function-scoped)
+fixtures are set up again for each run.  The durations of the call phases
+(not the setup and teardown of the fixtures) are collected, and at the end
+of the session the median, 95th percentile and variance of each test's
+durations are reported.  Tests whose durations vary too much between runs
+to be trusted are flagged.
+
+Only one run of each test is reported to pytest (the last run, or the first
+run which did not pass), so pytest counts each test once.  The duration of
+its call report is set to the median, and the statistics are added to it.
+
+..  Copyright (c) 2015 by Allen Barker.
+    License: MIT, see LICENSE for more details.
+
+.. default-role:: code
+
+"""
+
+from __future__ import print_function, division, absolute_import
+import math
+
+try:
+    import pytest
+except ImportError:
+    import py.test as pytest # Old pytest versions, before 3.0.
+
+from pytest_helper.global_settings import PytestHelperException
+
+# Tests whose coefficient of variation (the standard deviation of the
+# durations divided by their mean) is above this are flagged as unstable.
+REPEAT_MAX_CV = 0.1
+
+def median(values):
+    """Return the median of the list `values`."""
+    return percentile(values, 50)
+
+def percentile(values, percent):
+    """Return the `percent` percentile of the list `values`, interpolating
+    linearly between the closest ranks."""
+    values = sorted(values)
+    position = (len(values) - 1) * percent / 100
+    lower = int(math.floor(position))
+    upper = min(lower + 1, len(values) - 1)
+    return values[lower] + (values[upper] - values[lower]) * (position - lower)
+
+def variance(values):
+    """Return the sample variance of the list `values` (zero for one value)."""
+    if len(values) < 2:
+        return 0.0
+    mean = sum(values) / len(values)
+    return sum((v - mean) ** 2 for v in values) / (len(values) - 1)
+
+def duration_stats(durations):
+    """Return a dict of the statistics of the list of durations `durations`."""
+    mean = sum(durations) / len(durations)
+    var = variance(durations)
+    return {"runs": len(durations),
+            "median": median(durations),
+            "p95": percentile(durations, 95),
+            "variance": var,
+            "cv": math.sqrt(var) / mean if mean > 0 else 0.0}
+
+def finish_teardown(item, nextitem):
+    """Tear down the fixtures above the test function of `item` which are not
+    needed by `nextitem`, after the test itself was already torn down by a
+    run with its parent as the next item.  The teardown hooks are not called
+    again (the test's teardown was already reported).  Returns the report of
+    the teardown if it failed, or `None`."""
+    from _pytest.runner import CallInfo
+    setupstate = item.session._setupstate
+    if setupstate.teardown_exact.__code__.co_argcount == 2: # Pytest 7.0 and later.
+        teardown = lambda: setupstate.teardown_exact(nextitem)
+    else:
+        teardown = lambda: setupstate.teardown_exact(item, nextitem)
+    call = CallInfo.from_call(teardown, when="teardown")
+    if call.excinfo is None:
+        return None
+    return item.ihook.pytest_runtest_makereport(item=item, call=call)
+
+class RepeatRunPlugin(object):
+    """A pytest plugin which runs each test `warmup` times and then `repeat`
+    times, and reports the statistics of the timed call durations at the end
+    of the session.  Tests with a coefficient of variation above `max_cv`
+    are flagged as unstable.  The statistics are saved in the `stats` dict,
+    keyed on the node IDs."""
+
+    def __init__(self, repeat, warmup=0, max_cv=REPEAT_MAX_CV):
+        if int(repeat) < 1 or int(warmup) < 0:
+            raise PytestHelperException("The repeat option of script_run must be at"
+                    " least 1 and warmup at least 0, not {0!r} and {1!r}."
+                    .format(repeat, warmup))
+        self.repeat = int(repeat)
+        self.warmup = int(warmup)
+        self.max_cv = max_cv
+        self.stats = {}
+
+    @pytest.hookimpl(tryfirst=True)
+    def pytest_runtest_protocol(self, item, nextitem):
+        from _pytest.runner import runtestprotocol
+        ihook = item.ihook
+        ihook.pytest_runtest_logstart(nodeid=item.nodeid, location=item.location)
+        durations = []
+        logged_reports = None
+        num_runs = self.warmup + self.repeat
+        for run in range(num_runs):
+            # Before the last run only the test itself is torn down, by telling
+            # pytest that its parent comes next, so the fixtures of the module
+            # and the session stay set up.
+            last_run = run == num_runs - 1
+            reports = runtestprotocol(item, nextitem=nextitem if last_run else item.parent,
+                                      log=False)
+            if not all(r.passed for r in reports):
+                logged_reports = reports # Report the first run that did not pass.
+                break
+            if run >= self.warmup:
+                durations.extend(r.duration for r in reports if r.when == "call")
+            logged_reports = reports
+        if durations and all(r.passed for r in logged_reports):
+            stats = duration_stats(durations)
+            self.stats[item.nodeid] = stats
+            for report in logged_reports:
+                if report.when == "call":
+                    report.duration = stats["median"]
+                    report.repeat_stats = stats
+        for report in logged_reports:
+            ihook.pytest_runtest_logreport(report=report)
+        if not last_run: # Tear down as far as pytest would have after the test.
+            teardown_report = finish_teardown(item, nextitem)
+            if teardown_report is not None:
+                ihook.pytest_runtest_logreport(report=teardown_report)
+        ihook.pytest_runtest_logfinish(nodeid=item.nodeid, location=item.location)
+        return True
+
+    def unstable_tests(self):
+        """Return the sorted node IDs of the tests flagged as unstable."""
+        return sorted(nodeid for nodeid, stats in self.stats.items()
+                      if stats["cv"] > self.max_cv)
+
+    def pytest_terminal_summary(self, terminalreporter):
+        write_line = terminalreporter.write_line
+        if not self.stats:
+            write_line("pytest_helper: repeat runs, no tests passed every run.")
+            return
+        write_line("pytest_helper: timings of the test calls over {0} runs after"
+                   " {1} warmup runs (in seconds):".format(self.repeat, self.warmup))
+        write_line("   {0:>10} {1:>10} {2:>10} {3:>6}".format(
+                   "median", "p95", "variance", "cv"))
+        for nodeid in sorted(self.stats, key=lambda n: -self.stats[n]["median"]):
+            stats = self.stats[nodeid]
+            write_line("   {0:10.6f} {1:10.6f} {2:10.3g} {3:6.3f}  {4}{5}".format(
+                       stats["median"], stats["p95"], stats["variance"], stats["cv"],
+                       nodeid, "  (unstable)" if stats["cv"] > self.max_cv else ""))
+        unstable = self.unstable_tests()
+        if unstable:
+            write_line("pytest_helper: {0} tests vary too much between runs to trust"
+                       " their timings (coefficient of variation above {1}):"
+                       .format(len(unstable), self.max_cv))
+            for nodeid in unstable:
+                write_line("   " + nodeid)
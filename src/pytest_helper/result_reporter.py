@@ -0,0 +1,126 @@
+# -*- coding: utf-8 -*-
+"""
+Description
+-----------
+
+This module contains the functions for the result records of the tests, the
+compact records (dicts) with the result of each test which are reported as
+soon as it finishes.  The pytest plugin which reports them is in the
+top-level module `pytest_helper_reporter`, which is loaded in pytest
+subprocesses with the option `-p pytest_helper_reporter`.  It is imported
+here too, so it can also be loaded with `-p pytest_helper.result_reporter`.
+
+..  Copyright (c) 2015 by Allen Barker.
+    License: MIT, see LICENSE for more details.
+
+.. default-role:: code
+
+"""
+
+from __future__ import print_function, division, absolute_import
+import os
+import json
+import shutil
+import atexit
+import tempfile
+import threading
+
+import pytest_helper_reporter
+from pytest_helper_reporter import (RESULT_LINE_PREFIX, is_result_report,
+                                    report_to_record, ResultRecordPlugin,
+                                    CollectedFilesPlugin, write_record_line,
+                                    pytest_addoption, pytest_configure)
+
+# The temporary directory holding only a copy of the plugin module, created
+# by `get_plugin_dir` (a list, so it can be set without a global statement).
+plugin_dir = [None]
+plugin_dir_lock = threading.Lock()
+
+def get_plugin_dir():
+    """Return a temporary directory which holds nothing but a copy of the
+    plugin module `pytest_helper_reporter`, creating it on the first call.
+    The directory is removed when the process exits."""
+    with plugin_dir_lock:
+        if plugin_dir[0] is None:
+            dirname = tempfile.mkdtemp(prefix="pytest_helper_plugin_")
+            atexit.register(shutil.rmtree, dirname, True)
+            source = os.path.splitext(pytest_helper_reporter.__file__)[0] + ".py"
+            shutil.copy(source, os.path.join(dirname, "pytest_helper_reporter.py"))
+            plugin_dir[0] = dirname
+        return plugin_dir[0]
+
+def subprocess_env(same_interpreter=True):
+    """Return the environment for a pytest subprocess which loads the plugin
+    module `pytest_helper_reporter`, with the directory containing it put on
+    its `PYTHONPATH` so the plugin can be loaded even if the package is not
+    installed.  That is the directory containing the `pytest_helper` package,
+    unless `same_interpreter` is false.  It can be the `site-packages` of this
+    interpreter, so for other interpreters the directory of `get_plugin_dir`
+    is used instead, to keep this interpreter's packages off their path."""
+    env = os.environ.copy()
+    if same_interpreter:
+        plugin_parent_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    else:
+        plugin_parent_dir = get_plugin_dir()
+    python_path = env.get("PYTHONPATH")
+    env["PYTHONPATH"] = (plugin_parent_dir + os.pathsep + python_path
+                         if python_path else plugin_parent_dir)
+    return env
+
+def parse_record_line(line):
+    """Return the record in a line of output from a pytest subprocess with
+    `--pytest-helper-stream` set, or `None` if the line holds no record.
+    Pytest's progress output can precede the prefix on the same line."""
+    prefix_index = line.find(RESULT_LINE_PREFIX)
+    if prefix_index < 0:
+        return None
+    return json.loads(line[prefix_index+len(RESULT_LINE_PREFIX):])
+
+#
+# Results files, with one JSON record per line.
+#
+
+class ResultsFileWriter(object):
+    """Append result records to the file `filename`, one JSON record per line.
+    Each line is flushed as it is written, so nothing is held in memory and
+    the file is usable even if the run is killed.  Since the file is opened
+    for appending, several runs can write to the same file in sequence."""
+
+    def __init__(self, filename):
+        self.filename = filename
+        self.stream = open(filename, "a")
+
+    def write(self, record):
+        write_record_line(self.stream, record)
+
+    def close(self):
+        self.stream.close()
+
+def read_results_file(filename):
+    """Iterate over the result records in the results file `filename`.  The
+    file is read lazily, one line at a time.  An incomplete last line, which
+    can be left by a killed run, is ignored."""
+    with open(filename) as f:
+        for line in f:
+            if not line.endswith("\n"):
+                break # Incomplete final line.
+            yield json.loads(line)
+
+def read_results_files(filenames):
+    """Iterate over the result records in all the results files in the list
+    `filenames`, in order.  This merges the files written by separate (for
+    example parallel) runs, without reading any of them fully into memory."""
+    for filename in filenames:
+        for record in read_results_file(filename):
+            yield record
+
+def merge_results_files(filenames, output_filename):
+    """Merge the results files in the list `filenames` into the single results
+    file `output_filename`, which is overwritten.  Returns the number of
+    records written."""
+    num_records = 0
+    with open(output_filename, "w") as f:
+        for record in read_results_files(filenames):
+            write_record_line(f, record)
+            num_records += 1
+    return num_records
@@ -0,0 +1,174 @@
+# -*- coding: utf-8 -*-
+"""
+Description
+-----------
+
+This module contains the pytest plugin used by the `warm_rewrite_cache` option
+of `script_run`.  Before pytest collects the test files, the plugin rewrites
+the asserts of the test files in a pool of processes and writes the results
+to pytest's cache of rewritten modules (the `.pyc` files with a `-pytest-`
+tag in the `__pycache__` directories).  When pytest then imports the test
+files it finds them already rewritten.  Files whose cached version is up to
+date are skipped.
+
+The plugin uses the private assertion-rewriting functions of pytest, which
+are looked up when it runs.  If they are not available (or assertion
+rewriting is turned off) it does nothing.
+
+..  Copyright (c) 2015 by Allen Barker.
+    License: MIT, see LICENSE for more details.
+
+.. default-role:: code
+
+"""
+
+from __future__ import print_function, division, absolute_import
+import sys
+import os
+import timeit
+
+try:
+    from concurrent.futures import ProcessPoolExecutor
+except ImportError: # Python 2 without the futures backport.
+    ProcessPoolExecutor = None
+
+# The number of files rewritten per task sent to the process pool.
+REWRITE_CHUNK_SIZE = 8
+
+class RewriteConfig(object):
+    """A stand-in for the pytest config object, with the only setting that
+    the assertion rewriter reads from it."""
+
+    def __init__(self, enable_assertion_pass_hook):
+        self.enable_assertion_pass_hook = enable_assertion_pass_hook
+
+    def getini(self, name):
+        if name == "enable_assertion_pass_hook":
+            return self.enable_assertion_pass_hook
+        raise ValueError("Unexpected ini setting: {0}".format(name))
+
+class RewriteState(object):
+    """A stand-in for pytest's assertion state, which only needs a trace."""
+
+    def trace(self, message):
+        pass
+
+def rewrite_files(filenames, enable_assertion_pass_hook=False):
+    """Rewrite the asserts of the files in the list `filenames` and save them
+    in pytest's cache, unless the cached versions are up to date.  Runs in the
+    worker processes.  Returns a tuple `(num_rewritten, num_cached)`."""
+    from pathlib import Path
+    from _pytest.assertion import rewrite
+    config = RewriteConfig(enable_assertion_pass_hook)
+    state = RewriteState()
+    num_rewritten = num_cached = 0
+    for filename in filenames:
+        path = Path(filename)
+        cache_dir = rewrite.get_cache_dir(path)
+        pyc = cache_dir / (path.name[:-3] + rewrite.PYC_TAIL)
+        if rewrite._read_pyc(path, pyc) is not None:
+            num_cached += 1
+            continue
+        if not rewrite.try_makedirs(cache_dir):
+            continue
+        try:
+            source_stat, co = rewrite._rewrite_test(path, config)
+        except SyntaxError:
+            continue # Reported by pytest when it imports the file.
+        if rewrite._write_pyc(state, co, source_stat, pyc):
+            num_rewritten += 1
+    return num_rewritten, num_cached
+
+def rewriting_available():
+    """Return true if the private pytest functions used are available."""
+    try:
+        from _pytest.assertion import rewrite
+    except ImportError:
+        return False
+    return all(hasattr(rewrite, name) for name in ("get_cache_dir", "PYC_TAIL",
+               "_read_pyc", "try_makedirs", "_rewrite_test", "_write_pyc"))
+
+def ignored_by_pytest(config, path):
+    """Return true if pytest does not collect the file or directory `path`
+    when it walks the directories: directories matching `norecursedirs`,
+    virtualenvs (unless `--collect-in-virtualenv` is set), and the paths
+    ignored by the `pytest_ignore_collect` hooks (such as `--ignore`)."""
+    from pathlib import Path
+    from _pytest.pathlib import fnmatch_ex
+    path = Path(path)
+    if path.is_dir(): # Checked by the Session itself before pytest 8.
+        if any(fnmatch_ex(pattern, path) for pattern in config.getini("norecursedirs")):
+            return True
+        in_venv = getattr(sys.modules["_pytest.main"], "_in_venv", None)
+        if (in_venv is not None and in_venv(path)
+                and not config.getoption("collect_in_virtualenv", False)):
+            return True
+    return bool(config.hook.pytest_ignore_collect(collection_path=path, config=config))
+
+def find_rewritten_files(config):
+    """Return the sorted list of the files which pytest will rewrite, out of
+    those in the paths passed to it: the `.py` files given explicitly, and the
+    `conftest.py` files and the files matching the `python_files` patterns
+    in the directories given.  The directories and files which pytest does
+    not collect are skipped (see `ignored_by_pytest`)."""
+    from _pytest.pathlib import fnmatch_ex
+    patterns = config.getini("python_files")
+    invocation_dir = str(getattr(getattr(config, "invocation_params", None), "dir",
+                                 os.getcwd()))
+    filenames = set()
+    for arg in config.args:
+        path = os.path.join(invocation_dir, arg.split("::")[0])
+        if os.path.isfile(path) and path.endswith(".py"):
+            filenames.add(os.path.realpath(path))
+            continue
+        for root, subdirs, files in os.walk(path):
+            subdirs[:] = [d for d in subdirs
+                          if not ignored_by_pytest(config, os.path.join(root, d))]
+            for name in files:
+                if not name.endswith(".py"):
+                    continue
+                filename = os.path.join(root, name)
+                if ((name == "conftest.py" or any(fnmatch_ex(pattern, filename)
+                                                  for pattern in patterns))
+                        and not ignored_by_pytest(config, filename)):
+                    filenames.add(os.path.realpath(filename))
+    return sorted(filenames)
+
+class RewriteWarmerPlugin(object):
+    """A pytest plugin which warms up pytest's assertion-rewrite cache for the
+    test files at the start of the session, before they are collected, with
+    a pool of up to `max_workers` processes.  The counts and the time taken
+    are reported at the end of the session."""
+
+    def __init__(self, max_workers=None):
+        self.max_workers = max_workers
+        self.num_rewritten = 0
+        self.num_cached = 0
+        self.warm_time = None
+
+    def pytest_sessionstart(self, session):
+        config = session.config
+        if (config.getoption("assertmode", "rewrite") != "rewrite"
+                or sys.dont_write_bytecode or not rewriting_available()):
+            return
+        start_time = timeit.default_timer()
+        filenames = find_rewritten_files(config)
+        hook_enabled = bool(config.getini("enable_assertion_pass_hook"))
+        chunks = [filenames[i:i+REWRITE_CHUNK_SIZE]
+                  for i in range(0, len(filenames), REWRITE_CHUNK_SIZE)]
+        if ProcessPoolExecutor is None or len(chunks) <= 1:
+            results = [rewrite_files(chunk, hook_enabled) for chunk in chunks]
+        else:
+            with ProcessPoolExecutor(max_workers=self.max_workers) as executor:
+                results = list(executor.map(rewrite_files, chunks,
+                                            [hook_enabled] * len(chunks)))
+        self.num_rewritten = sum(r[0] for r in results)
+        self.num_cached = sum(r[1] for r in results)
+        self.warm_time = timeit.default_timer() - start_time
+
+    def pytest_terminal_summary(self, terminalreporter):
+        if self.warm_time is None:
+            return
+        terminalreporter.write_line("pytest_helper: warmed the assertion-rewrite"
+                " cache in {0:.2f}s ({1} files rewritten, {2} already cached)."
+                .format(self.warm_time, self.num_rewritten, self.num_cached))
@@ -0,0 +1,170 @@
+# -*- coding: utf-8 -*-
+"""
+Description
+-----------
+
+This module contains the sampling profiler used by the `sample_profile`
+option of `script_run`.  A background thread wakes up at a fixed rate and
+takes the stack of the thread running pytest from `sys._current_frames()`.
+Nothing is done in the profiled thread itself, so short tests are not
+distorted the way they are by a deterministic profiler, and the overhead is
+a few percent at the default rate.
+
+Each sample is attributed to the node ID of the test running when it was
+taken (samples taken outside of any test, such as during collection, go to
+`OUTSIDE_TESTS_LABEL`).  At the end of the session the samples are written
+as collapsed stacks, one line per distinct stack with the node ID as its
+root frame, followed by the number of samples.  That is the input format of
+flamegraph tools such as `flamegraph.pl` and speedscope.
+
+The sampler thread needs the GIL to take a sample, so while the tests run
+pure Python code the rate is limited by the thread switch interval (see
+`sys.setswitchinterval`), 200 samples a second by default.
+
+..  Copyright (c) 2015 by Allen Barker.
+    License: MIT, see LICENSE for more details.
+
+.. default-role:: code
+
+"""
+
+from __future__ import print_function, division, absolute_import
+import sys
+import os
+import time
+import threading
+import collections
+
+try:
+    import pytest
+except ImportError:
+    import py.test as pytest # Old pytest versions, before 3.0.
+
+from pytest_helper.global_settings import PytestHelperException
+
+# The default sampling rate, in samples per second.
+DEFAULT_SAMPLE_RATE = 100
+
+# The default name of the collapsed-stack file, in the directory of the module
+# calling `script_run`.
+DEFAULT_SAMPLE_PROFILE_NAME = "pytest_helper_profile.collapsed"
+
+# The root frame of the samples taken while no test was running.
+OUTSIDE_TESTS_LABEL = "pytest_helper:outside_tests"
+
+# Stacks deeper than this keep only their innermost frames.
+MAX_STACK_DEPTH = 256
+
+# The number of tests with the most samples shown at the end of the run.
+NUM_TOP_TESTS = 10
+
+def frame_label(code):
+    """Return the label of the frames of the code object `code` in the
+    collapsed stacks.  Semicolons separate the frames, so none are allowed."""
+    name = getattr(code, "co_qualname", code.co_name) # Python 3.11 and later.
+    return "{0} ({1}:{2})".format(name, os.path.basename(code.co_filename),
+                                  code.co_firstlineno).replace(";", ",")
+
+def collapsed_lines(counts):
+    """Return the lines of collapsed stacks for the sample counts `counts`,
+    a dict mapping tuples `(root, codes)` to numbers of samples, where `root`
+    is a node ID or label and `codes` holds the code objects of the stack,
+    outermost first.  Stacks with the same labels are merged."""
+    merged = collections.Counter()
+    for (root, codes), count in counts.items():
+        labels = [root.replace(";", ",")] + [frame_label(code) for code in codes]
+        merged[";".join(labels)] += count
+    return ["{0} {1}".format(stack, merged[stack]) for stack in sorted(merged)]
+
+class SampleProfilerPlugin(object):
+    """A pytest plugin which samples the stack of the thread running pytest
+    `rate` times a second, from the start of the session to its end, and
+    writes the samples to the file `filename` as collapsed stacks.  The same
+    plugin object can be passed to several pytest runs, in which case the
+    file is rewritten with the samples of all of them after each run."""
+
+    def __init__(self, filename, rate=DEFAULT_SAMPLE_RATE):
+        if float(rate) <= 0:
+            raise PytestHelperException("The sample_rate option of script_run must"
+                                        " be positive, not {0!r}.".format(rate))
+        self.filename = filename
+        self.rate = float(rate)
+        self.counts = collections.Counter()
+        self.test_counts = collections.Counter()
+        self.num_samples = 0
+        self.sampling_time = 0.0 # Spent taking samples, for the overhead.
+        self.profiled_time = 0.0
+        self.current_nodeid = None
+        self.thread_id = None
+        self.sampler = None
+        self.stop_event = threading.Event()
+        self.start_time = None
+
+    def take_sample(self):
+        """Add a sample of the current stack of the profiled thread."""
+        frame = sys._current_frames().get(self.thread_id)
+        if frame is None:
+            return
+        codes = []
+        while frame is not None and len(codes) < MAX_STACK_DEPTH:
+            codes.append(frame.f_code)
+            frame = frame.f_back
+        codes.reverse()
+        root = self.current_nodeid or OUTSIDE_TESTS_LABEL
+        self.counts[(root, tuple(codes))] += 1
+        self.test_counts[root] += 1
+        self.num_samples += 1
+
+    def sample(self):
+        """Take samples until `stop_event` is set.  Run in the sampler thread."""
+        interval = 1.0 / self.rate
+        next_time = time.perf_counter() + interval
+        while not self.stop_event.wait(max(next_time - time.perf_counter(), 0)):
+            start_time = time.perf_counter()
+            self.take_sample()
+            self.sampling_time += time.perf_counter() - start_time
+            # Keep to the rate, but do not catch up on samples missed while
+            # waiting for the GIL.
+            next_time = max(next_time + interval, start_time)
+
+    def pytest_sessionstart(self, session):
+        self.thread_id = threading.current_thread().ident
+        self.stop_event.clear()
+        self.start_time = time.perf_counter()
+        self.sampler = threading.Thread(target=self.sample,
+                                        name="pytest_helper_sample_profiler")
+        self.sampler.daemon = True
+        self.sampler.start()
+
+    @pytest.hookimpl(hookwrapper=True)
+    def pytest_runtest_protocol(self, item, nextitem):
+        self.current_nodeid = item.nodeid
+        try:
+            yield
+        finally:
+            self.current_nodeid = None
+
+    def pytest_sessionfinish(self, session):
+        if self.sampler is None:
+            return
+        self.stop_event.set()
+        self.sampler.join()
+        self.sampler = None
+        self.profiled_time += time.perf_counter() - self.start_time
+        with open(self.filename, "w") as f:
+            for line in collapsed_lines(self.counts):
+                f.write(line + "\n")
+
+    def pytest_terminal_summary(self, terminalreporter):
+        write_line = terminalreporter.write_line
+        overhead = (100 * self.sampling_time / self.profiled_time
+                    if self.profiled_time else 0.0)
+        write_line("pytest_helper: took {0} stack samples at {1:g} per second, written"
+                   " to {2} (sampling used {3:.1f}% of the time).".format(
+                   self.num_samples, self.rate, self.filename, overhead))
+        if not self.test_counts:
+            return
+        write_line("pytest_helper: the tests with the most samples:")
+        for root, count in self.test_counts.most_common(NUM_TOP_TESTS):
+            write_line("   {0:8d} {1:6.1f}%  {2}".format(count,
+                       100 * count / self.num_samples, root))
@@ -0,0 +1,215 @@
+# -*- coding: utf-8 -*-
+"""
+Description
+-----------
+
+This module contains the code for splitting the tests run by `script_run` into
+shards, which can be run separately (for example in parallel CI jobs), and for
+merging the results of the shards.  It is used by the `shard_index` and
+`shard_count` options of `script_run`.
+
+The tests are split by test file.  The split is deterministic, so every shard
+computes the same split independently, and it is balanced by the durations
+recorded in an earlier results file (see the `results_file` option of
+`script_run`).  Files without recorded durations are weighted by their sizes.
+
+..  Copyright (c) 2015 by Allen Barker.
+    License: MIT, see LICENSE for more details.
+
+.. default-role:: code
+
+"""
+
+from __future__ import print_function, division, absolute_import
+import sys
+import os
+import subprocess
+
+from pytest_helper.global_settings import PytestHelperException
+from pytest_helper.result_reporter import (read_results_files, write_record_line,
+                                           subprocess_env, parse_record_line)
+
+SHARD_INDEX_ENV_VAR = "PYTEST_HELPER_SHARD_INDEX"
+SHARD_COUNT_ENV_VAR = "PYTEST_HELPER_SHARD_COUNT"
+
+# The priority of the pytest exit codes when merging them, highest first:
+# internal error, usage error, interrupted, tests failed.  A code of 5 (no
+# tests collected) only counts if no shard collected any tests.
+EXIT_CODE_PRIORITY = [3, 4, 2, 1]
+NO_TESTS_COLLECTED = 5
+
+def get_shard_settings(shard_index=None, shard_count=None):
+    """Return the tuple `(shard_index, shard_count)`, with any value which is
+    `None` read from the environment variables `PYTEST_HELPER_SHARD_INDEX` and
+    `PYTEST_HELPER_SHARD_COUNT`.  Returns `(None, None)` if no sharding is
+    set.  The shards are numbered from zero."""
+    if shard_index is None:
+        shard_index = os.environ.get(SHARD_INDEX_ENV_VAR)
+    if shard_count is None:
+        shard_count = os.environ.get(SHARD_COUNT_ENV_VAR)
+    if shard_index is None and shard_count is None:
+        return None, None
+    try:
+        shard_index, shard_count = int(shard_index), int(shard_count)
+    except (TypeError, ValueError):
+        raise PytestHelperException("Both the shard index and the shard count"
+                " must be set to integers, not {0!r} and {1!r}."
+                .format(shard_index, shard_count))
+    if not 0 <= shard_index < shard_count:
+        raise PytestHelperException("The shard index must be at least 0 and less"
+                " than the shard count {0}, not {1}.".format(shard_count, shard_index))
+    return shard_index, shard_count
+
+# The exit codes of a successful `--collect-only` run, the second for when no
+# tests are found (as always, since the files are not collected).
+COLLECT_EXIT_CODES = (0, 5)
+
+def collect_test_files(dirnames, pytest_arglist=()):
+    """Return the set of the real paths of the test files which pytest
+    collects in the directories `dirnames`, with the pytest arguments
+    `pytest_arglist`.  Pytest is run with `--collect-only` in a subprocess, so
+    its `norecursedirs`, `python_files`, and virtualenv detection all apply,
+    as well as any plugins and conftest files.  The test files are only
+    listed, not imported.  Any `-x` or `--maxfail` argument is overridden so
+    that every file is listed, and `PytestHelperException` is raised if
+    pytest fails (for example on a usage error)."""
+    cmd = [sys.executable, "-m", "pytest", "--collect-only", "-q",
+           "-p", "pytest_helper_reporter", "--pytest-helper-collect-files"]
+    proc = subprocess.Popen(cmd + list(pytest_arglist) + ["--maxfail=0"] + list(dirnames),
+                            stdout=subprocess.PIPE, env=subprocess_env())
+    output = proc.communicate()[0].decode("utf-8", "replace")
+    files = set()
+    other_lines = []
+    for line in output.splitlines():
+        record = parse_record_line(line)
+        if record is not None:
+            files.add(os.path.realpath(record["path"]))
+        elif line.strip():
+            other_lines.append(line)
+    if proc.returncode not in COLLECT_EXIT_CODES:
+        raise PytestHelperException("Listing the test files in {0} with pytest"
+                " failed with exit code {1}:\n{2}".format(", ".join(dirnames),
+                proc.returncode, "\n".join(other_lines)))
+    return files
+
+def find_test_files(testfile_paths, pytest_arglist=()):
+    """Expand the directories in `testfile_paths` into the sorted test files
+    under them which pytest collects (see `collect_test_files`).  Other paths
+    (files and node IDs) are kept as they are."""
+    dirnames = [path for path in testfile_paths if os.path.isdir(path)]
+    if not dirnames:
+        return list(testfile_paths)
+    collected = collect_test_files(dirnames, pytest_arglist)
+    expanded = []
+    for path in testfile_paths:
+        if not os.path.isdir(path):
+            expanded.append(path)
+            continue
+        prefix = os.path.join(os.path.realpath(path), "")
+        expanded.extend(sorted(f for f in collected if f.startswith(prefix)))
+    return expanded
+
+def read_file_durations(results_filenames):
+    """Return a dict of the total test durations recorded in the results files
+    `results_filenames`, keyed on the file parts of the node IDs (which are
+    relative to pytest's root directory).  Only the last record of each node
+    ID is used."""
+    durations = {}
+    for record in read_results_files(results_filenames):
+        if record.get("when") == "collect":
+            continue
+        durations[record["nodeid"]] = record.get("duration", 0.0)
+    file_durations = {}
+    for nodeid, duration in durations.items():
+        file_part = nodeid.split("::")[0]
+        file_durations[file_part] = file_durations.get(file_part, 0.0) + duration
+    return file_durations
+
+def get_weights(test_files, durations_file=None):
+    """Return a list with an estimated run time for each item of `test_files`.
+    Files with durations recorded in the results file `durations_file` get
+    their recorded total.  The others get their size in bytes, scaled by the
+    average time per byte of the recorded files (if there are any)."""
+    file_durations = {}
+    if durations_file and os.path.exists(durations_file):
+        file_durations = read_file_durations([durations_file])
+
+    def recorded_duration(test_file):
+        path = test_file.split("::")[0].replace(os.sep, "/")
+        for file_part, duration in file_durations.items():
+            if path == file_part or path.endswith("/" + file_part):
+                return duration
+        return None
+
+    def file_size(test_file):
+        try:
+            return os.path.getsize(test_file.split("::")[0])
+        except OSError:
+            return 1
+
+    durations = [recorded_duration(f) for f in test_files]
+    sizes = [file_size(f) for f in test_files]
+    recorded_sizes = sum(s for d, s in zip(durations, sizes) if d is not None)
+    recorded_time = sum(d for d in durations if d is not None)
+    seconds_per_byte = recorded_time / recorded_sizes if recorded_time else 1.0
+    return [d if d is not None else s * seconds_per_byte
+            for d, s in zip(durations, sizes)]
+
+def split_into_shards(test_files, weights, shard_count):
+    """Split `test_files` into `shard_count` lists with similar total weights.
+    Each file, heaviest first, goes to the shard with the least total weight
+    so far (the lowest index on ties).  Files with equal weights are taken in
+    sorted order, so the result only depends on the arguments.  Each shard
+    keeps its files in their original order."""
+    order = sorted(range(len(test_files)), key=lambda i: (-weights[i], test_files[i]))
+    loads = [0.0] * shard_count
+    assignments = [[] for i in range(shard_count)]
+    for i in order:
+        shard = loads.index(min(loads))
+        loads[shard] += weights[i]
+        assignments[shard].append(i)
+    return [[test_files[i] for i in sorted(indices)] for indices in assignments]
+
+def select_shard(testfile_paths, shard_index, shard_count, durations_file=None,
+                 pytest_arglist=()):
+    """Return the test files of shard `shard_index` out of `shard_count`, for
+    the tests in `testfile_paths` run with the pytest arguments
+    `pytest_arglist`."""
+    test_files = find_test_files(testfile_paths, pytest_arglist)
+    weights = get_weights(test_files, durations_file)
+    return split_into_shards(test_files, weights, shard_count)[shard_index]
+
+def merge_exit_codes(exit_codes):
+    """Merge the pytest exit codes of several runs (such as shards) into one.
+    The most serious nonzero code wins.  A shard which collected no tests
+    does not count as a failure unless none of the shards collected any."""
+    exit_codes = [int(code) for code in exit_codes]
+    for code in EXIT_CODE_PRIORITY:
+        if code in exit_codes:
+            return code
+    other_codes = [c for c in exit_codes if c not in (0, NO_TESTS_COLLECTED)]
+    if other_codes:
+        return max(other_codes)
+    if exit_codes and all(c == NO_TESTS_COLLECTED for c in exit_codes):
+        return NO_TESTS_COLLECTED
+    return 0
+
+def merge_shard_results(results_filenames, output_filename=None, exit_codes=None):
+    """Merge the results files written by the shards of a run, and their exit
+    codes.  If `output_filename` is set the records of all the files in
+    `results_filenames` are written to it, in order.  Returns the tuple
+    `(records, exit_code)`, where `records` is the number of records and
+    `exit_code` is the merged exit code of `exit_codes` (or `None` if no exit
+    codes are given).  Missing results files are treated as empty, since a
+    shard can fail before it writes any results."""
+    existing_files = [f for f in results_filenames if os.path.exists(f)]
+    num_records = 0
+    if output_filename:
+        with open(output_filename, "w") as f:
+            for record in read_results_files(existing_files):
+                write_record_line(f, record)
+                num_records += 1
+    else:
+        num_records = sum(1 for record in read_results_files(existing_files))
+    exit_code = merge_exit_codes(exit_codes) if exit_codes is not None else None
+    return num_records, exit_code
@@ -0,0 +1,435 @@
+# -*- coding: utf-8 -*-
+"""
+Description
+-----------
+
+This module contains the code used by `sys_path` for the directories it adds
+to `sys.path`, beyond the insertion itself.  That is warming them up (the
+`warm` option), so that the first imports from them are faster, and the
+scoped finder used instead of `sys.path` by the `meta_path` option.
+
+Each directory on `sys.path` is searched by every import which is not found
+in the directories before it, including every import which fails (such as
+the optional imports of many packages).  With the `meta_path` option the
+directories are instead registered with a single finder on `sys.meta_path`,
+which keeps an index of the top-level module and package names that the
+directories provide.  Imports of other names cost one dict lookup.  The
+index is rebuilt when `importlib.invalidate_caches()` is called, so call it
+after creating new modules in the directories (as is needed for the
+directories on `sys.path` too).
+
+The function `analyze_sys_path` reports on the health of `sys.path` and of
+the directories registered with the scoped finder: duplicate entries,
+entries which are missing or provide nothing to import, directories added
+by `sys_path` which no imported module came from, and an estimate of what
+each entry costs the imports which miss it.  The misses are counted by a
+finder at the end of `sys.meta_path`, which is only installed when
+`count_import_misses` is called.
+
+..  Copyright (c) 2015 by Allen Barker.
+    License: MIT, see LICENSE for more details.
+
+.. default-role:: code
+
+"""
+
+from __future__ import print_function, division, absolute_import
+import sys
+import os
+import threading
+import timeit
+import fnmatch
+import compileall
+import subprocess
+import multiprocessing
+import pkgutil
+import importlib
+
+# The smallest number of files compiled by each compiling subprocess.  Fewer
+# files than this are compiled in the calling process.
+COMPILE_CHUNK_SIZE = 32
+
+# The directories which are not searched for files to compile, like pytest's
+# default `norecursedirs` (virtualenvs are skipped too).
+SKIPPED_DIR_PATTERNS = ["*.egg", ".*", "_darcs", "build", "CVS", "dist",
+                        "node_modules", "venv", "{arch}", "__pycache__"]
+
+# The background threads started by `warm_sys_path_dirs`, which can be joined
+# to wait for the compiling to finish.
+warm_threads = []
+
+def warm_importer_cache(dirnames):
+    """Create the path-entry finders for the directories in `dirnames` and
+    save them in `sys.path_importer_cache`, as the import system would do on
+    the first import that searches them.  The finders are also made to read
+    their directory listings now, rather than during the first import."""
+    for dirname in dirnames:
+        finder = pkgutil.get_importer(dirname) # Caches it in sys.path_importer_cache.
+        if finder is None or not hasattr(finder, "find_spec"):
+            continue
+        try:
+            # A lookup of a name that is not there makes a FileFinder read and
+            # cache the directory contents.
+            finder.find_spec("__pytest_helper_warm_importer_cache__")
+        except (ImportError, OSError):
+            pass
+
+def is_skipped_dir(dirname):
+    """Return true if the directory `dirname` is a virtualenv or matches one
+    of the `SKIPPED_DIR_PATTERNS`."""
+    name = os.path.basename(dirname)
+    return (any(fnmatch.fnmatch(name, pattern) for pattern in SKIPPED_DIR_PATTERNS)
+            or os.path.isfile(os.path.join(dirname, "pyvenv.cfg"))
+            or os.path.isdir(os.path.join(dirname, "conda-meta")))
+
+def find_python_files(dirnames):
+    """Return a list of the `.py` files which can be imported from the
+    directories in `dirnames`: their top-level modules and the modules of
+    their packages (the subdirectories with an `__init__.py` file), down
+    through the subpackages.  Directories for which `is_skipped_dir` is true
+    are not searched."""
+    filenames = []
+    for dirname in dirnames:
+        for root, subdirs, files in os.walk(dirname):
+            subdirs[:] = [d for d in subdirs
+                          if os.path.isfile(os.path.join(root, d, "__init__.py"))
+                          and not is_skipped_dir(os.path.join(root, d))]
+            filenames.extend(os.path.join(root, f) for f in files if f.endswith(".py"))
+    return filenames
+
+def compile_files(filenames):
+    """Byte-compile the files in the list `filenames` to their `.pyc` files,
+    skipping any that are up to date."""
+    for filename in filenames:
+        try:
+            compileall.compile_file(filename, quiet=2)
+        except Exception: # Never fail the warm-up; the import will report errors.
+            pass
+    return len(filenames)
+
+def compile_dirs(dirnames, max_workers=None):
+    """Byte-compile the importable `.py` files under the directories in
+    `dirnames` (see `find_python_files`), in parallel in up to `max_workers`
+    subprocesses running `compileall` (by default one for each CPU).  Since
+    this is usually called from a background thread, the subprocesses are
+    started fresh rather than forked as a process pool, and nothing from the
+    calling program runs in them.  Returns the number of files."""
+    filenames = find_python_files(dirnames)
+    num_procs = min(max_workers or multiprocessing.cpu_count(),
+                    len(filenames) // COMPILE_CHUNK_SIZE)
+    if num_procs <= 1:
+        return compile_files(filenames)
+    encoding = sys.getfilesystemencoding()
+    with open(os.devnull, "w") as devnull:
+        procs = []
+        for i in range(num_procs):
+            proc = subprocess.Popen([sys.executable, "-m", "compileall", "-q", "-i", "-"],
+                                    stdin=subprocess.PIPE, stdout=devnull, stderr=devnull)
+            proc.stdin.write("".join(f + "\n" for f in filenames[i::num_procs])
+                             .encode(encoding))
+            proc.stdin.close()
+            procs.append(proc)
+        for proc in procs:
+            proc.wait()
+    return len(filenames)
+
+def warm_sys_path_dirs(dirnames, compile_in_background=True):
+    """Warm up the directories in `dirnames`, which were just added to
+    `sys.path`.  Their finders are put in `sys.path_importer_cache` right away,
+    and their `.py` files are compiled to `.pyc` files by `compile_dirs`.
+    If `compile_in_background` is true (the default) the compiling is started
+    from a daemon thread and this function returns without waiting for it.
+    The thread is saved in the list `warm_threads`.  Nothing is compiled if
+    `sys.dont_write_bytecode` is set."""
+    dirnames = [d for d in dirnames if os.path.isdir(d)]
+    warm_importer_cache(dirnames)
+    if sys.dont_write_bytecode or not dirnames:
+        return
+    if not compile_in_background:
+        compile_dirs(dirnames)
+        return
+    def compile_in_thread():
+        try:
+            compile_dirs(dirnames)
+        except RuntimeError: # The interpreter is shutting down.
+            pass
+    thread = threading.Thread(target=compile_in_thread,
+                              name="pytest_helper_sys_path_warm")
+    thread.daemon = True
+    warm_threads.append(thread)
+    thread.start()
+
+def list_top_level_names(dirname):
+    """Return the set of the top-level module and package names which the
+    directory `dirname` provides: the modules with any of the import suffixes,
+    and the subdirectories whose names are identifiers (packages, or portions
+    of namespace packages)."""
+    import importlib.machinery # Not in Python 2, which has no meta_path option.
+    suffixes = sorted(importlib.machinery.all_suffixes(), key=len, reverse=True)
+    names = set()
+    try:
+        entries = os.listdir(dirname)
+    except OSError:
+        return names
+    for entry in entries:
+        for suffix in suffixes:
+            if entry.endswith(suffix):
+                names.add(entry[:-len(suffix)])
+                break
+        else:
+            if entry.isidentifier() and os.path.isdir(os.path.join(dirname, entry)):
+                names.add(entry)
+    names.discard("__init__")
+    return names
+
+class ScopedPathFinder(object):
+    """A meta path finder for the top-level modules and packages in the
+    directories in its `dirs` list, which are searched in order.  Lookups go
+    through an index mapping the names to the directories which provide them,
+    so a name which is not in any of the directories costs a dict lookup.
+    The index is rebuilt by `invalidate_caches`, which is called by
+    `importlib.invalidate_caches()`.  Submodules are found by the usual
+    finders, through the `__path__` of their packages."""
+
+    def __init__(self):
+        self.dirs = []
+        self.index = {}
+        self.num_lookups = {} # The number of modules found in each directory.
+
+    def build_index(self):
+        """Rebuild the index from the contents of the directories."""
+        index = {}
+        for dirname in self.dirs:
+            for name in list_top_level_names(dirname):
+                index.setdefault(name, []).append(dirname)
+        self.index = index # Replaced in one step, for concurrent lookups.
+
+    def set_dirs(self, dirs):
+        """Set the list of directories to `dirs` and rebuild the index."""
+        self.dirs = list(dirs)
+        self.build_index()
+
+    def add_dirs(self, dirs, position=None):
+        """Add those directories in `dirs` which are not already registered,
+        at `position` in the list (by default at the end).  Returns the list
+        of the directories added."""
+        added = [d for d in dirs if d not in self.dirs]
+        if added:
+            position = len(self.dirs) if position is None else position
+            self.set_dirs(self.dirs[:position] + added + self.dirs[position:])
+        return added
+
+    def invalidate_caches(self):
+        self.build_index()
+
+    def find_spec(self, fullname, path=None, target=None):
+        if path is not None:
+            return None # A submodule.
+        dirnames = self.index.get(fullname)
+        if not dirnames:
+            return None
+        namespace_portions = []
+        for dirname in dirnames:
+            finder = pkgutil.get_importer(dirname) # Cached in sys.path_importer_cache.
+            if finder is None or not hasattr(finder, "find_spec"):
+                continue
+            spec = finder.find_spec(fullname, target)
+            if spec is None:
+                continue
+            self.num_lookups[dirname] = self.num_lookups.get(dirname, 0) + 1
+            if spec.loader is not None:
+                return spec
+            # Like the path finder, collect the portions of a namespace package
+            # in case no directory has a regular module or package.
+            namespace_portions.extend(spec.submodule_search_locations or [])
+        if not namespace_portions:
+            return None
+        import importlib.machinery
+        spec = importlib.machinery.ModuleSpec(fullname, None, is_package=True)
+        spec.submodule_search_locations = namespace_portions
+        return spec
+
+    def install(self):
+        """Put this finder on `sys.meta_path` just before the standard path
+        finder, so it is searched like entries at the front of `sys.path`."""
+        if self in sys.meta_path:
+            return
+        import importlib.machinery
+        for position, finder in enumerate(sys.meta_path):
+            if finder is importlib.machinery.PathFinder:
+                sys.meta_path.insert(position, self)
+                return
+        sys.meta_path.append(self)
+
+scoped_path_finder = ScopedPathFinder()
+
+#
+# Analysis of sys.path.
+#
+
+# The directories added by `sys_path`, mapped to the names of the modules
+# which added them.
+added_dirs_by_module = {}
+
+# The name looked up to time the import misses of the entries.
+MISSING_MODULE_NAME = "__pytest_helper_missing_module__"
+
+# The number of lookups timed for each entry.
+MISS_TIMING_LOOKUPS = 20
+
+class ImportMissCounter(object):
+    """A meta path finder at the end of `sys.meta_path`, which only sees the
+    imports that no other finder found.  It counts those of top-level names
+    (which searched all of `sys.path`) in `num_misses` and finds nothing."""
+
+    def __init__(self):
+        self.num_misses = 0
+
+    def find_spec(self, fullname, path=None, target=None):
+        if path is None:
+            self.num_misses += 1
+        return None
+
+    def find_module(self, fullname, path=None):
+        # The meta path finder method before Python 3.4.
+        return self.find_spec(fullname, path)
+
+    def install(self):
+        if self not in sys.meta_path:
+            sys.meta_path.append(self)
+
+    def uninstall(self):
+        if self in sys.meta_path:
+            sys.meta_path.remove(self)
+
+import_miss_counter = ImportMissCounter()
+
+def count_import_misses(enable=True):
+    """Start counting the imports of top-level names which are not found
+    anywhere, for the estimates of `analyze_sys_path`, by putting a finder at
+    the end of `sys.meta_path`.  If `enable` is false the finder is removed
+    again.  The count is reset either way."""
+    import_miss_counter.num_misses = 0
+    if enable:
+        import_miss_counter.install()
+    else:
+        import_miss_counter.uninstall()
+
+def record_added_dirs(dirnames, module_name):
+    """Record that the module `module_name` added the directories `dirnames`
+    with `sys_path`."""
+    for dirname in dirnames:
+        added_dirs_by_module.setdefault(dirname, module_name)
+
+def canonical_entry(entry):
+    """Return the canonical absolute path of the `sys.path` entry `entry`.  The
+    empty string is the current directory."""
+    return os.path.realpath(os.path.abspath(entry or os.curdir))
+
+def find_used_dirs():
+    """Return the set of the canonical directories which the top-level modules
+    and packages in `sys.modules` were imported from."""
+    used = set()
+    for name, module in list(sys.modules.items()):
+        if "." in name or module is None:
+            continue
+        filename = getattr(module, "__file__", None)
+        if filename:
+            dirname = os.path.dirname(filename)
+            if os.path.basename(filename).startswith("__init__."):
+                dirname = os.path.dirname(dirname)
+            used.add(canonical_entry(dirname))
+        elif getattr(module, "__path__", None): # A namespace package.
+            for portion in list(module.__path__):
+                used.add(canonical_entry(os.path.dirname(portion)))
+    return used
+
+def time_import_miss(entry, lookups=MISS_TIMING_LOOKUPS):
+    """Return the time in seconds that a lookup of a missing module takes in
+    the `sys.path` entry `entry`, or `None` if it has no finder."""
+    finder = pkgutil.get_importer(entry)
+    if finder is None or not hasattr(finder, "find_spec"):
+        return None
+    timer = timeit.default_timer
+    start = timer()
+    for i in range(lookups):
+        finder.find_spec(MISSING_MODULE_NAME)
+    return (timer() - start) / lookups
+
+def analyze_sys_path(print_report=True):
+    """Analyze the entries of `sys.path` and the directories registered with
+    the scoped finder (by the `meta_path` option of `sys_path`).  Returns a
+    dict with these keys:
+
+    * "duplicates": lists of the entries which are the same directory after
+      canonicalization (each list in `sys.path` order).
+
+    * "missing": the entries which do not exist.
+
+    * "empty": the directories which contain no modules or packages.
+
+    * "unused": the directories added by `sys_path` which no top-level module
+      in `sys.modules` was imported from, as a dict mapping them to the
+      names of the modules that added them.
+
+    * "miss_cost": a dict mapping the entries to the estimated time in seconds
+      that each import miss spends on them.  Entries on the scoped finder
+      which do not provide a name cost nothing, so they are not included.
+
+    * "num_misses": the number of top-level import misses counted since
+      `count_import_misses` was called (or `None` if they are not counted).
+
+    If `print_report` is true then a report is also printed, with the
+    estimated total time that each entry has added to the counted misses."""
+    sys_path_entries = list(sys.path)
+    entries = sys_path_entries + [d for d in scoped_path_finder.dirs
+                                  if d not in sys_path_entries]
+
+    by_canonical = {}
+    for entry in entries:
+        by_canonical.setdefault(canonical_entry(entry), []).append(entry)
+    duplicates = [group for group in by_canonical.values() if len(group) > 1]
+    missing = [e for e in entries if not os.path.exists(canonical_entry(e))]
+    empty = [e for e in entries if os.path.isdir(canonical_entry(e))
+             and not list_top_level_names(canonical_entry(e))]
+
+    used_dirs = find_used_dirs()
+    used_dirs.update(d for d, count in scoped_path_finder.num_lookups.items() if count)
+    unused = dict((d, m) for d, m in added_dirs_by_module.items()
+                  if (d in entries) and canonical_entry(d) not in used_dirs)
+
+    miss_cost = {}
+    for entry in sys_path_entries:
+        if entry not in missing:
+            cost = time_import_miss(entry)
+            if cost is not None:
+                miss_cost[entry] = cost
+
+    num_misses = (import_miss_counter.num_misses
+                  if import_miss_counter in sys.meta_path else None)
+    report = {"duplicates": duplicates, "missing": missing, "empty": empty,
+              "unused": unused, "miss_cost": miss_cost, "num_misses": num_misses}
+    if print_report:
+        print_sys_path_report(report)
+    return report
+
+def print_sys_path_report(report):
+    """Print the report returned by `analyze_sys_path`."""
+    print("pytest_helper: sys.path analysis.")
+    for group in report["duplicates"]:
+        print("   duplicate entries: {0}".format(", ".join(repr(e) for e in group)))
+    for entry in report["missing"]:
+        print("   missing: {0!r}".format(entry))
+    for entry in report["empty"]:
+        print("   empty: {0!r}".format(entry))
+    for entry, module_name in sorted(report["unused"].items()):
+        print("   unused, added by {0}: {1!r}".format(module_name, entry))
+    num_misses = report["num_misses"]
+    if num_misses is None:
+        print("   import-miss cost per entry, in microseconds per miss:")
+    else:
+        print("   import-miss cost per entry, in microseconds per miss and the"
+              " estimated total for the {0} misses counted:".format(num_misses))
+    for entry, cost in sorted(report["miss_cost"].items(), key=lambda i: -i[1]):
+        total = "" if num_misses is None else " {0:10.4f} s".format(cost * num_misses)
+        print("   {0:8.2f} us{1}  {2!r}".format(cost * 1e6, total, entry))
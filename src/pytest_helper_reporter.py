@@ -0,0 +1,173 @@
+# -*- coding: utf-8 -*-
+"""
+Description
+-----------
+
+This module contains the pytest plugin which reports the result of each test
+as soon as it finishes, as a compact record (a dict).  It is loaded in the
+pytest subprocesses started by `script_run_async` and by the `interpreters`,
+budget, and sharding options of `script_run`, with the option
+`-p pytest_helper_reporter`.
+
+It is a top-level module rather than a part of the `pytest_helper` package,
+and imports nothing but pytest, so loading it does not import the package or
+any of its dependencies.  The subprocesses only need pytest itself, which
+matters for the `interpreters` option.  The other result-record functions,
+and this plugin under its old name, are in `pytest_helper.result_reporter`.
+
+..  Copyright (c) 2015 by Allen Barker.
+    License: MIT, see LICENSE for more details.
+
+.. default-role:: code
+
+"""
+
+from __future__ import print_function, division, absolute_import
+import sys
+import json
+
+import pytest
+
+try:
+    from pytest import File as FILE_COLLECTOR_CLASS
+except ImportError:
+    from _pytest.main import File as FILE_COLLECTOR_CLASS # Old pytest versions.
+try:
+    from pytest import CollectReport
+except ImportError:
+    from _pytest.runner import CollectReport # Old pytest versions.
+
+# Before pytest 8 packages are collected by a subclass of Module, so a File.
+PACKAGE_COLLECTOR_CLASS = getattr(pytest, "Package", None)
+
+# Prefix on the stdout lines which hold result records, to tell them apart
+# from pytest's regular terminal output.
+RESULT_LINE_PREFIX = "pytest_helper_result: "
+
+def is_result_report(report):
+    """Return true if the pytest report `report` holds the result of a test.
+    That is the report for the call phase, or a setup or teardown report that
+    did not pass (i.e., an error or skip outside the test function itself)."""
+    return report.when == "call" or not report.passed
+
+def report_to_record(report, calling_mod_name=None):
+    """Convert the pytest report `report` into a result record, which is a dict
+    that can be serialized as JSON.  The timing statistics of tests run with
+    the `repeat` option of `script_run` are included as `repeat_stats`, and
+    the slowdowns found by the `perf_baseline` option as `perf_slowdown`."""
+    record = {"nodeid": report.nodeid,
+              "when": getattr(report, "when", "collect"), # Collect reports have no when.
+              "outcome": report.outcome,
+              "duration": getattr(report, "duration", 0.0),
+              "module": calling_mod_name}
+    repeat_stats = getattr(report, "repeat_stats", None)
+    if repeat_stats:
+        record["repeat_stats"] = repeat_stats
+    perf_slowdown = getattr(report, "perf_slowdown", None)
+    if perf_slowdown:
+        record["perf_slowdown"] = perf_slowdown
+    return record
+
+class ResultRecordPlugin(object):
+    """A pytest plugin object which calls `handle_record` with the record of each
+    test result as soon as its report is available.  Failed collections are
+    also reported, with `when` set to "collect".
+
+    The failures are counted in the `num_failures` attribute.  If
+    `max_failures` is set then pytest is stopped after that many failures
+    (like the pytest option `--maxfail`).  The same plugin object can be
+    passed to several pytest runs to count the failures across all of them."""
+
+    def __init__(self, handle_record=None, calling_mod_name=None, max_failures=None):
+        self.handle_record = handle_record
+        self.calling_mod_name = calling_mod_name
+        self.max_failures = max_failures
+        self.num_failures = 0
+        self.session = None
+
+    def max_failures_reached(self):
+        """Return true if `max_failures` is set and has been reached."""
+        return bool(self.max_failures) and self.num_failures >= self.max_failures
+
+    def handle_report(self, report):
+        if self.handle_record:
+            self.handle_record(report_to_record(report, self.calling_mod_name))
+        if report.failed:
+            self.num_failures += 1
+            if self.max_failures_reached() and self.session is not None:
+                self.session.shouldstop = ("pytest_helper: stopping after {0} failures"
+                                           .format(self.num_failures))
+
+    def pytest_sessionstart(self, session):
+        self.session = session
+
+    def pytest_runtest_logreport(self, report):
+        if is_result_report(report):
+            self.handle_report(report)
+
+    def pytest_collectreport(self, report):
+        if report.failed:
+            self.handle_report(report)
+
+def write_record_line(stream, record, prefix=""):
+    """Write `record` to `stream` as a single line of JSON, with `prefix`
+    prepended, and flush it immediately."""
+    stream.write(prefix + json.dumps(record, separators=(",", ":")) + "\n")
+    stream.flush()
+
+#
+# Hooks for when this module is loaded as a plugin with `-p`.
+#
+
+def pytest_addoption(parser):
+    group = parser.getgroup("pytest_helper")
+    group.addoption("--pytest-helper-stream", action="store_true", default=False,
+                    help="Write a prefixed JSON record line to stdout for each"
+                         " test result as soon as it finishes.")
+    group.addoption("--pytest-helper-module", default=None,
+                    help="The name of the module that ran pytest, saved in the records.")
+    group.addoption("--pytest-helper-collect-files", action="store_true", default=False,
+                    help="Write a prefixed JSON record line to stdout with the path"
+                         " of each test file collected.")
+
+def pytest_configure(config):
+    if config.getoption("pytest_helper_stream"):
+        # Global output capturing is suspended while the report hooks run, so
+        # the records written to sys.stdout go to the real stdout.
+        def handle_record(record):
+            write_record_line(sys.stdout, record, prefix=RESULT_LINE_PREFIX)
+        plugin = ResultRecordPlugin(handle_record,
+                                    config.getoption("pytest_helper_module"))
+        config.pluginmanager.register(plugin, "pytest_helper_stream")
+    if config.getoption("pytest_helper_collect_files"):
+        config.pluginmanager.register(CollectedFilesPlugin(config),
+                                      "pytest_helper_collect_files")
+
+class CollectedFilesPlugin(object):
+    """A pytest plugin which writes a record with the path of each test file
+    that pytest collects to stdout, as a prefixed line of JSON.  The files
+    themselves are not collected, so no test module is imported and no tests
+    are found.  Files which have no tests or fail to import are included."""
+
+    def __init__(self, config):
+        self.capture_manager = config.pluginmanager.getplugin("capturemanager")
+
+    def write_path(self, path):
+        if self.capture_manager is None:
+            write_record_line(sys.stdout, {"path": str(path)}, prefix=RESULT_LINE_PREFIX)
+            return
+        # Output is captured during collection, so suspend it for the record.
+        with self.capture_manager.global_and_fixture_disabled():
+            write_record_line(sys.stdout, {"path": str(path)}, prefix=RESULT_LINE_PREFIX)
+
+    @pytest.hookimpl(tryfirst=True)
+    def pytest_make_collect_report(self, collector):
+        path = getattr(collector, "path", None) or getattr(collector, "fspath", None)
+        if (not isinstance(collector, FILE_COLLECTOR_CLASS) or path is None
+                or (PACKAGE_COLLECTOR_CLASS is not None
+                    and isinstance(collector, PACKAGE_COLLECTOR_CLASS))):
+            return None
+        self.write_path(path)
+        # An empty report in place of the one from collecting the file.
+        return CollectReport(collector.nodeid, "passed", None, [])
+
@@ -0,0 +1,72 @@
+# -*- coding: utf-8 -*-
+"""
+
+Benchmark of the cost of `autoimport` over many test modules, comparing a
+call of `autoimport` from each module with injecting the names at collection
+(as the plugin does with `autoimport_at_collection` set), after which the
+call of `autoimport` in the module returns at once.  Run it as a script::
+
+   python bench_autoimport.py [num_modules]
+
+"""
+
+from __future__ import print_function, division, absolute_import
+import sys
+import os
+import types
+import timeit
+
+from pytest_helper.pytest_helper_main import autoimport_DEFAULTS
+from pytest_helper.autoimport_injection import inject_bundle
+
+MODULE_SOURCE = "import pytest_helper\npytest_helper.autoimport()\n"
+
+def make_modules(num_modules):
+    """Return a list of new modules, registered in `sys.modules`, with their
+    files in this directory."""
+    dirname = os.path.dirname(os.path.abspath(__file__))
+    modules = []
+    for i in range(num_modules):
+        name = "_bench_autoimport_mod_{0}".format(i)
+        module = types.ModuleType(name)
+        module.__file__ = os.path.join(dirname, name + ".py")
+        sys.modules[name] = module
+        modules.append(module)
+    return modules
+
+def drop_modules(modules):
+    for module in modules:
+        sys.modules.pop(module.__name__, None)
+
+def run_benchmarks(num_modules=3000):
+    code = compile(MODULE_SOURCE, "<bench>", "exec")
+    bundle = dict(autoimport_DEFAULTS)
+
+    def per_call():
+        modules = make_modules(num_modules)
+        start = timeit.default_timer()
+        for module in modules:
+            exec(code, vars(module))
+        elapsed = timeit.default_timer() - start
+        drop_modules(modules)
+        return elapsed
+
+    def injected():
+        modules = make_modules(num_modules)
+        start = timeit.default_timer()
+        for module in modules:
+            inject_bundle(vars(module), bundle)
+            exec(code, vars(module))
+        elapsed = timeit.default_timer() - start
+        drop_modules(modules)
+        return elapsed
+
+    print("Running autoimport in {0} modules, best of 3:".format(num_modules))
+    per_call_time = min(per_call() for i in range(3))
+    print("   autoimport call per module:   {0:.4f} s".format(per_call_time))
+    injected_time = min(injected() for i in range(3))
+    print("   injected at collection:       {0:.4f} s ({1:.1f}x faster)".format(
+          injected_time, per_call_time / injected_time))
+
+if __name__ == "__main__":
+    run_benchmarks(*[int(arg) for arg in sys.argv[1:]])
@@ -0,0 +1,83 @@
+# -*- coding: utf-8 -*-
+"""
+
+Benchmark of the overhead of recording the impact map, by timing some
+pure-Python code with and without a `LineRecorder` running: a long loop
+under the recorded directory, the same loop outside of it, and many short
+recorded tests.  The recorder
+uses `sys.monitoring` on Python 3.12 and later, and `sys.settrace` otherwise.
+Run it as a script::
+
+   python bench_impact_map.py
+
+"""
+
+from __future__ import print_function, division, absolute_import
+import sys
+import os
+import shutil
+import tempfile
+import timeit
+
+from pytest_helper.impact_map import LineRecorder
+
+def workload(n=200000):
+    """Some pure-Python code, similar to the code run by a typical test."""
+    total = 0
+    for i in range(n):
+        if i % 3:
+            total += i
+        else:
+            total -= i
+    return total
+
+def short_workload():
+    """A short workload, like a fast unit test."""
+    return workload(200)
+
+def run_benchmarks(number=5, num_short_tests=2000):
+    def best_time(fun):
+        return min(timeit.repeat(fun, number=1, repeat=number))
+
+    def recorded(recorder, fun, num_tests=1):
+        def run_recorded():
+            for i in range(num_tests):
+                recorder.start()
+                try:
+                    fun()
+                finally:
+                    recorder.stop()
+        return run_recorded
+
+    this_dir = os.path.dirname(os.path.abspath(__file__))
+    other_dir = tempfile.mkdtemp() # A root which the workload is not under.
+    method = "sys.monitoring" if hasattr(sys, "monitoring") else "sys.settrace"
+    print("Recording with {0}, best of {1} runs:".format(method, number))
+    cases = [("workload under the root", this_dir, workload, 1),
+             ("workload outside the root", other_dir, workload, 1),
+             ("{0} short tests under the root".format(num_short_tests), this_dir,
+              short_workload, num_short_tests)]
+    try:
+        for name, root_dir, fun, num_tests in cases:
+            plain_time = best_time(recorded(NoRecorder(), fun, num_tests))
+            recorder = LineRecorder(root_dir)
+            try:
+                recorded_time = best_time(recorded(recorder, fun, num_tests))
+            finally:
+                recorder.close()
+            print("   {0:32} {1:.4f} s, not recorded {2:.4f} s ({3:.2f}x)".format(
+                  name + ":", recorded_time, plain_time, recorded_time / plain_time))
+    finally:
+        shutil.rmtree(other_dir)
+
+class NoRecorder(object):
+    """A recorder which does nothing, for the times without recording."""
+
+    def start(self):
+        pass
+
+    def stop(self):
+        return {}
+
+if __name__ == "__main__":
+    run_benchmarks()
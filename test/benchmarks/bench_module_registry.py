@@ -0,0 +1,76 @@
+# -*- coding: utf-8 -*-
+"""
+
+Benchmark of the memory kept by the module-info registry, by generating many
+small modules, importing them, looking up their info, and dropping them from
+`sys.modules`.  The memory still allocated after the modules are dropped is
+measured with `tracemalloc`, both for the registry (which is keyed weakly on
+the module objects) and for a dict keyed on the module names holding the old
+info tuples (which keeps every module alive).  Run it as a script::
+
+   python bench_module_registry.py [num_modules]
+
+"""
+
+from __future__ import print_function, division, absolute_import
+import sys
+import os
+import gc
+import shutil
+import tempfile
+import importlib
+import tracemalloc
+
+from pytest_helper.module_registry import module_info_registry
+from pytest_helper.pytest_helper_main import get_calling_module_info
+
+MODULE_NAME_PREFIX = "_bench_registry_mod_"
+
+def make_modules(dirname, num_modules):
+    for i in range(num_modules):
+        with open(os.path.join(dirname, "{0}{1}.py".format(MODULE_NAME_PREFIX, i)), "w") as f:
+            f.write("value = {0}\n\ndef fun():\n    return value\n".format(i))
+
+def import_and_drop(dirname, num_modules, save_info):
+    """Import the generated modules, pass their info to `save_info`, and drop
+    them from `sys.modules`.  Returns the memory still allocated, in bytes."""
+    gc.collect()
+    tracemalloc.start()
+    start_size = tracemalloc.get_traced_memory()[0]
+    sys.path.insert(0, dirname)
+    try:
+        importlib.invalidate_caches()
+        for i in range(num_modules):
+            name = MODULE_NAME_PREFIX + str(i)
+            importlib.import_module(name)
+            save_info(get_calling_module_info(module_name=name))
+            del sys.modules[name]
+    finally:
+        sys.path.remove(dirname)
+    gc.collect()
+    retained = tracemalloc.get_traced_memory()[0] - start_size
+    tracemalloc.stop()
+    return retained
+
+def run_benchmarks(num_modules=10000):
+    dirname = tempfile.mkdtemp()
+    try:
+        make_modules(dirname, num_modules)
+        print("Importing and dropping {0} generated modules:".format(num_modules))
+
+        registry_size = len(module_info_registry)
+        retained = import_and_drop(dirname, num_modules, lambda mod_info: None)
+        print("   weak-keyed registry:  {0:10.1f} kB retained, {1} records left".format(
+              retained / 1024, len(module_info_registry) - registry_size))
+
+        name_keyed_cache = {} # Like the old cache, keyed on names with tuples.
+        def save_tuple(mod_info):
+            name_keyed_cache[mod_info[0]] = tuple(mod_info)
+        retained = import_and_drop(dirname, num_modules, save_tuple)
+        print("   name-keyed dict:      {0:10.1f} kB retained, {1} records left".format(
+              retained / 1024, len(name_keyed_cache)))
+    finally:
+        shutil.rmtree(dirname)
+
+if __name__ == "__main__":
+    run_benchmarks(*[int(arg) for arg in sys.argv[1:]])
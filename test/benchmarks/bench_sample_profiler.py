@@ -0,0 +1,62 @@
+# -*- coding: utf-8 -*-
+"""
+
+Benchmark of the overhead of the sampling profiler of the `sample_profile`
+option of `script_run`, by timing a pytest session of many short CPU-bound
+tests with and without the profiler, at a few sampling rates.  The sessions
+are interleaved, and the best time of each is used.  Run it as a script::
+
+   python bench_sample_profiler.py [num_tests] [num_sessions]
+
+"""
+
+from __future__ import print_function, division, absolute_import
+import sys
+import os
+import time
+import shutil
+import tempfile
+
+import pytest
+
+from pytest_helper.sample_profiler import SampleProfilerPlugin
+
+TEST_SOURCE = """
+def work(n):
+    return sum(i * i for i in range(n))
+
+def test_work(n):
+    assert work(n) >= 0
+
+def pytest_generate_tests(metafunc):
+    metafunc.parametrize("n", [3000 + i for i in range({0})])
+"""
+
+def time_session(test_file, plugins):
+    start_time = time.perf_counter()
+    pytest.main(["-qq", "-p", "no:cacheprovider", test_file], plugins=plugins)
+    return time.perf_counter() - start_time
+
+def run_benchmarks(num_tests=2000, num_sessions=5):
+    dirname = tempfile.mkdtemp()
+    rates = [None, 100, 1000] # No profiler, then the sampling rates.
+    best_times = dict((rate, float("inf")) for rate in rates)
+    try:
+        test_file = os.path.join(dirname, "test_bench_work.py")
+        with open(test_file, "w") as f:
+            f.write(TEST_SOURCE.replace("{0}", str(num_tests)))
+        profile_file = os.path.join(dirname, "profile.collapsed")
+        for i in range(num_sessions): # Interleaved, so drifts hit all of them.
+            for rate in rates:
+                plugins = [SampleProfilerPlugin(profile_file, rate)] if rate else []
+                best_times[rate] = min(best_times[rate], time_session(test_file, plugins))
+    finally:
+        shutil.rmtree(dirname)
+    print("\nSessions of {0} short tests, best of {1}:".format(num_tests, num_sessions))
+    for rate in rates:
+        name = "{0} samples/s".format(rate) if rate else "no profiler"
+        print("   {0:15} {1:8.3f}s {2:+7.1f}%".format(name, best_times[rate],
+                                              100 * (best_times[rate] / best_times[None] - 1)))
+
+if __name__ == "__main__":
+    run_benchmarks(*[int(arg) for arg in sys.argv[1:]])
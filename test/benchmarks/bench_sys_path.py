@@ -0,0 +1,73 @@
+# -*- coding: utf-8 -*-
+"""
+
+Benchmark of the latency of an import miss (an import of a name which no
+directory provides) with many directories added by `sys_path`, comparing
+insertion into `sys.path` with the scoped finder of the `meta_path` option.
+Run it as a script::
+
+   python bench_sys_path.py [num_dirs] [modules_per_dir]
+
+"""
+
+from __future__ import print_function, division, absolute_import
+import sys
+import os
+import shutil
+import tempfile
+import timeit
+import importlib
+
+from pytest_helper.sys_path_tools import scoped_path_finder
+
+MISSING_NAME = "_bench_sys_path_missing_module"
+
+def make_dirs(parent_dir, num_dirs, modules_per_dir):
+    dirnames = []
+    for i in range(num_dirs):
+        dirname = os.path.join(parent_dir, "dir_{0}".format(i))
+        os.mkdir(dirname)
+        for j in range(modules_per_dir):
+            with open(os.path.join(dirname, "mod_{0}_{1}.py".format(i, j)), "w") as f:
+                f.write("value = {0}\n".format(j))
+        dirnames.append(dirname)
+    return dirnames
+
+def import_miss():
+    try:
+        importlib.import_module(MISSING_NAME)
+    except ImportError:
+        pass
+
+def time_misses(number):
+    import_miss() # Create the path-entry finders first.
+    return min(timeit.repeat(import_miss, number=number, repeat=5)) / number
+
+def run_benchmarks(num_dirs=50, modules_per_dir=20, number=2000):
+    parent_dir = tempfile.mkdtemp()
+    saved_sys_path = sys.path[:]
+    saved_finder_dirs = scoped_path_finder.dirs[:]
+    try:
+        dirnames = make_dirs(parent_dir, num_dirs, modules_per_dir)
+        print("Import-miss latency with {0} added directories of {1} modules,"
+              " best of 5:".format(num_dirs, modules_per_dir))
+
+        base_time = time_misses(number)
+        print("   no added directories:    {0:8.2f} us".format(base_time * 1e6))
+
+        sys.path[1:1] = dirnames
+        sys_path_time = time_misses(number)
+        print("   inserted in sys.path:    {0:8.2f} us".format(sys_path_time * 1e6))
+        sys.path[:] = saved_sys_path
+
+        scoped_path_finder.add_dirs(dirnames, 0)
+        scoped_path_finder.install()
+        meta_path_time = time_misses(number)
+        print("   scoped meta_path finder: {0:8.2f} us".format(meta_path_time * 1e6))
+    finally:
+        sys.path[:] = saved_sys_path
+        scoped_path_finder.set_dirs(saved_finder_dirs)
+        shutil.rmtree(parent_dir)
+
+if __name__ == "__main__":
+    run_benchmarks(*[int(arg) for arg in sys.argv[1:]])
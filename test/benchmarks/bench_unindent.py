@@ -0,0 +1,56 @@
+# -*- coding: utf-8 -*-
+"""
+
+Benchmark of `unindent` and `unindent_lines` on large strings, compared with
+the original split-and-join implementation.  Run it as a script::
+
+   python bench_unindent.py
+
+"""
+
+from __future__ import print_function, division, absolute_import
+import timeit
+
+from pytest_helper.pytest_helper_main import (unindent, unindent_lines,
+                                              unindent_cache, unindent_cache_chars)
+
+def unindent_split_join(unindent_level, string):
+    """The previous implementation of `unindent`, for comparison."""
+    lines = string.split("\n")
+    lines = lines[1:-1]
+    for line in lines:
+        string_to_strip = line[0:unindent_level]
+        if not string_to_strip.lstrip() == "":
+            raise ValueError("Non-whitespace.")
+    return "\n".join(s[unindent_level:] for s in lines)
+
+def make_text(num_bytes, unindent_level=8):
+    """Return an indented multi-line string of about `num_bytes` characters."""
+    line = " " * (unindent_level+4) + "<k_identifier,'x'> some expected output"
+    num_lines = num_bytes // (len(line) + 1)
+    return "\n" + "\n".join([line] * num_lines) + "\n" + " " * unindent_level
+
+def clear_cache():
+    unindent_cache.clear()
+    unindent_cache_chars[0] = 0
+
+def run_benchmarks(num_bytes=10*2**20, number=5):
+    text = make_text(num_bytes)
+    print("Unindenting a {0:.1f} MB string, best of {1} runs:".format(
+                                                    len(text) / 2**20, number))
+    def best_time(fun):
+        return min(timeit.repeat(fun, number=1, repeat=number))
+
+    print("   split and join (previous): {0:.4f} s".format(
+          best_time(lambda: unindent_split_join(8, text))))
+    print("   unindent, uncached:        {0:.4f} s".format(
+          best_time(lambda: (clear_cache(), unindent(8, text)))))
+    unindent(8, text)
+    print("   unindent, cached:          {0:.6f} s".format(
+          best_time(lambda: unindent(8, text))))
+    print("   unindent_lines, consumed:  {0:.4f} s".format(
+          best_time(lambda: sum(1 for line in unindent_lines(8, text)))))
+    clear_cache()
+
+if __name__ == "__main__":
+    run_benchmarks()
@@ -0,0 +1,23 @@
+# -*- coding: utf-8 -*-
+"""
+
+Tests which keep the CPU busy in a known function, run by other tests to
+check the samples of the sampling profiler.
+
+"""
+
+from __future__ import print_function, division, absolute_import
+import time
+
+def spin_for(seconds):
+    end_time = time.time() + seconds
+    count = 0
+    while time.time() < end_time:
+        count += 1
+    return count
+
+def test_busy():
+    assert spin_for(0.3) > 0
+
+def test_idle():
+    pass
@@ -0,0 +1,23 @@
+# -*- coding: utf-8 -*-
+"""
+
+Tests which copy a large value to globals with `locals_to_globals(evict=True)`,
+run by other tests with the plugin `pytest_helper.plugin` loaded.
+
+"""
+
+from __future__ import print_function, division, absolute_import
+
+import pytest
+import pytest_helper
+
+@pytest.fixture(scope="module")
+def setup_large():
+    large_list = list(range(10000))
+    pytest_helper.locals_to_globals(evict=True)
+
+def test_uses_large(setup_large):
+    assert len(large_list) == 10000
+
+def test_still_there(setup_large):
+    assert large_list[-1] == 9999
@@ -0,0 +1,22 @@
+# -*- coding: utf-8 -*-
+"""
+
+Tests with known failures, run by other tests through `script_run`.  The
+filename does not start with `test_`, so pytest does not collect these tests
+directly.
+
+"""
+
+from __future__ import print_function, division, absolute_import
+
+def test_pass_first():
+    pass
+
+def test_fail_first():
+    assert False
+
+def test_fail_second():
+    assert False
+
+def test_pass_last():
+    pass
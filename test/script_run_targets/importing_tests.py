@@ -0,0 +1,14 @@
+# -*- coding: utf-8 -*-
+"""
+
+Tests which make a slow import, run by other tests with `import_profile` set.
+
+"""
+
+from __future__ import print_function, division, absolute_import
+
+import slow_import_target
+
+def test_lazy_import():
+    import slow_import_child_lazy
+    assert slow_import_target.value == 1
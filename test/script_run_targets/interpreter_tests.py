@@ -0,0 +1,18 @@
+# -*- coding: utf-8 -*-
+"""
+
+Tests run under several interpreters by other tests, through the
+`interpreters` option of `script_run`.  One test fails under any interpreter
+whose executable name ends in "_odd".  The filename does not start with
+`test_`, so pytest does not collect these tests directly.
+
+"""
+
+from __future__ import print_function, division, absolute_import
+import sys
+
+def test_everywhere():
+    pass
+
+def test_not_odd_interpreter():
+    assert not sys.executable.endswith("_odd")
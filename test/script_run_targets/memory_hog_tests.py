@@ -0,0 +1,15 @@
+# -*- coding: utf-8 -*-
+"""
+
+A test which uses too much memory, run by other tests with an RSS budget.
+
+"""
+
+from __future__ import print_function, division, absolute_import
+import time
+
+def test_uses_memory():
+    data = bytearray(300 * 2**20)
+    for i in range(0, len(data), 4096):
+        data[i] = 1 # Touch the pages, so they count in the RSS.
+    time.sleep(60)
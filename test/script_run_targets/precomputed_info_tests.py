@@ -0,0 +1,20 @@
+# -*- coding: utf-8 -*-
+"""
+
+Tests which check that the plugin `pytest_helper.plugin` saved the module info
+and config of this module at collection time.  Run by other tests.
+
+"""
+
+from __future__ import print_function, division, absolute_import
+
+import pytest_helper
+from pytest_helper.global_settings import NAME_OF_PYTEST_HELPER_PER_MODULE_INFO_DICT
+
+def test_precomputed_info():
+    module_info_dict = globals()[NAME_OF_PYTEST_HELPER_PER_MODULE_INFO_DICT]
+    mod_info = module_info_dict["module_info"]
+    assert mod_info[0] == __name__
+    assert mod_info[2] == __file__
+    assert "effective_config" in module_info_dict
+    assert pytest_helper.pytest_helper_main.get_calling_module_info(level=1) is mod_info
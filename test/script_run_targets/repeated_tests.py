@@ -0,0 +1,32 @@
+# -*- coding: utf-8 -*-
+"""
+
+Tests which are run many times by other tests, with the repeat option.
+
+"""
+
+from __future__ import print_function, division, absolute_import
+import time
+import pytest
+
+counts = {"module_setups": 0, "steady": 0, "noisy": 0, "flaky": 0}
+
+@pytest.fixture(scope="module")
+def module_resource():
+    counts["module_setups"] += 1
+    return counts
+
+def test_steady(module_resource):
+    counts["steady"] += 1
+    time.sleep(0.01)
+
+def test_noisy(module_resource):
+    counts["noisy"] += 1
+    time.sleep(0.02 if counts["noisy"] % 2 else 0.0)
+
+def test_module_setups(module_resource):
+    assert module_resource["module_setups"] == 1
+
+def test_flaky(module_resource):
+    counts["flaky"] += 1
+    assert counts["flaky"] < 3
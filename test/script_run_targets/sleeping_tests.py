@@ -0,0 +1,15 @@
+# -*- coding: utf-8 -*-
+"""
+
+Tests which take far too long, run by other tests with a time budget.
+
+"""
+
+from __future__ import print_function, division, absolute_import
+import time
+
+def test_quick():
+    pass
+
+def test_sleeps_too_long():
+    time.sleep(60)
@@ -0,0 +1,11 @@
+# -*- coding: utf-8 -*-
+"""
+
+A module which is slow to import, imported by `slow_import_target.py`.
+
+"""
+
+import time
+
+time.sleep(0.1)
+value = 1
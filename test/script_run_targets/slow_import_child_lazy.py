@@ -0,0 +1,8 @@
+# -*- coding: utf-8 -*-
+"""
+
+A module imported inside a test of `importing_tests.py`.
+
+"""
+
+value = 2
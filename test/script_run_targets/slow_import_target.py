@@ -0,0 +1,12 @@
+# -*- coding: utf-8 -*-
+"""
+
+A module which is slow to import, imported by `importing_tests.py`.
+
+"""
+
+import time
+import slow_import_child
+
+time.sleep(0.05)
+value = slow_import_child.value
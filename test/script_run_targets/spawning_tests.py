@@ -0,0 +1,20 @@
+# -*- coding: utf-8 -*-
+"""
+
+A test which starts a long-running child process and then sleeps, run by
+other tests with a time budget (and `-s`, so the child holds the stdout of
+the pytest subprocess).  The PID of the child is written to the file named
+by the environment variable `PYTEST_HELPER_CHILD_PID_FILE`.
+
+"""
+
+from __future__ import print_function, division, absolute_import
+import os
+import time
+import subprocess
+
+def test_starts_child_and_sleeps():
+    child = subprocess.Popen(["sleep", "40"])
+    with open(os.environ["PYTEST_HELPER_CHILD_PID_FILE"], "w") as f:
+        f.write(str(child.pid))
+    time.sleep(60)
@@ -0,0 +1,14 @@
+# -*- coding: utf-8 -*-
+"""
+
+A test with a duration set by an environment variable, run by other tests to
+compare its timings with a baseline.
+
+"""
+
+from __future__ import print_function, division, absolute_import
+import os
+import time
+
+def test_timed():
+    time.sleep(float(os.environ.get("PYTEST_HELPER_TIMED_TEST_DELAY", "0.005")))
@@ -0,0 +1,66 @@
+# -*- coding: utf-8 -*-
+"""
+
+Tests of injecting the `autoimport` names into test modules at collection,
+with `autoimport_at_collection` set in a config file.
+
+"""
+
+from __future__ import print_function, division, absolute_import
+import sys
+import os
+
+import pytest_helper
+pytest_helper.script_run(self_test=True, pytest_args="-v")
+pytest_helper.autoimport()
+
+from pytest_helper.autoimport_injection import get_autoimport_bundle, bundle_cache
+
+INI_FILE = """\
+[pytest_helper]
+autoimport_at_collection = True
+autoimport_skip = ["clear_locals_from_globals"]
+"""
+
+INJECTED_TESTS = """\
+def test_injected():
+    assert raises is pytest.raises and approx is pytest.approx
+    assert "clear_locals_from_globals" not in globals()
+"""
+
+CALLING_TESTS = """\
+approx = "own approx"
+import pytest_helper
+pytest_helper.autoimport(skip=["xfail"])
+
+def test_autoimport_call():
+    assert approx == "own approx" # Defined by the module, not clobbered.
+    assert fixture is pytest.fixture
+    assert "xfail" not in globals()
+"""
+
+def test_bundle_cache():
+    class Config(dict):
+        pass
+    config = Config(autoimport_skip=["b"])
+    bundle = get_autoimport_bundle("/some/dir", config, [("a", 1), ("b", 2)])
+    assert bundle == {"a": 1}
+    assert get_autoimport_bundle("/some/dir", config, [("a", 1), ("b", 2)]) is bundle
+    assert get_autoimport_bundle("/some/dir", Config(), [("a", 1), ("b", 2)]) == {"a": 1, "b": 2}
+    bundle_cache.pop("/some/dir")
+
+def test_autoimport_at_collection(tmpdir):
+    tmpdir.join("pytest_helper.ini").write(INI_FILE)
+    tmpdir.join("test_injected_names.py").write(INJECTED_TESTS)
+    tmpdir.join("test_calling_autoimport.py").write(CALLING_TESTS)
+    records = []
+    try:
+        exit_code = pytest_helper.script_run(str(tmpdir), pytest_args="-q -p no:cacheprovider"
+                                 " -p pytest_helper.plugin", always_run=True, exit=False,
+                                 on_result=records.append)
+    finally:
+        sys.modules.pop("test_injected_names", None)
+        sys.modules.pop("test_calling_autoimport", None)
+    assert exit_code == 0
+    assert sorted(r["nodeid"].split("::")[-1] for r in records
+                  if r["outcome"] == "passed") == ["test_autoimport_call", "test_injected"]
@@ -0,0 +1,88 @@
+# -*- coding: utf-8 -*-
+"""
+
+Tests of running test files with time and memory budgets in `script_run`.
+
+"""
+
+from __future__ import print_function, division, absolute_import
+import sys
+import os
+import time
+
+import pytest_helper
+pytest_helper.script_run(self_test=True, pytest_args="-v")
+pytest_helper.autoimport()
+
+from pytest_helper import budgets
+
+def run_script(target_files, pytest_args="-q -p no:cacheprovider", **kwargs):
+    records = []
+    exit_code = pytest_helper.script_run(target_files,
+                      pytest_args=pytest_args, always_run=True,
+                      exit=False, on_result=records.append, **kwargs)
+    return exit_code, records
+
+def test_get_file_budget():
+    assert budgets.get_file_budget(10, "/a/test_x.py") == 10
+    budget = {"test_slow_*.py": 60, "*/integration/*": 30, "*": 5}
+    assert budgets.get_file_budget(budget, "/a/test_slow_one.py") == 60
+    assert budgets.get_file_budget(budget, "/a/integration/test_x.py") == 30
+    assert budgets.get_file_budget(budget, "/a/test_x.py") == 5
+    assert budgets.get_file_budget({"test_y.py": 1}, "/a/test_x.py") is None
+
+def test_time_budget(capfd):
+    start_time = time.time()
+    exit_code, records = run_script(["script_run_targets/sleeping_tests.py",
+                                     "script_run_targets/passing_tests.py"],
+                                    time_budget={"sleeping_tests.py": 2, "*": 30})
+    assert time.time() - start_time < 30
+    assert exit_code == 1
+    assert [(r["when"], r["outcome"]) for r in records] == [("call", "passed"),
+                 ("budget", "failed"), ("call", "passed"), ("call", "passed")]
+    assert records[1]["nodeid"].endswith("sleeping_tests.py")
+    assert "wall-clock budget of 2s exceeded" in records[1]["message"]
+    out, err = capfd.readouterr()
+    assert "test files over budget" in out
+    if os.name == "posix":
+        assert "test_sleeps_too_long" in err # In the stack dump.
+
+@pytest.mark.skipif(budgets.get_rss_megabytes(os.getpid()) is None,
+                    reason="The RSS cannot be read on this system.")
+def test_rss_budget():
+    exit_code, records = run_script(["script_run_targets/memory_hog_tests.py",
+                                     "script_run_targets/passing_tests.py"],
+                                    rss_budget=200, time_budget=40)
+    assert exit_code == 1
+    assert [(r["when"], r["outcome"]) for r in records] == [("budget", "failed"),
+                 ("call", "passed"), ("call", "passed")]
+    assert "RSS budget of 200 MB exceeded" in records[0]["message"]
+
+@pytest.mark.skipif(os.name != "posix", reason="Needs process groups.")
+def test_time_budget_kills_child_processes(tmpdir, monkeypatch):
+    pid_file = os.path.join(str(tmpdir), "child.pid")
+    monkeypatch.setenv("PYTEST_HELPER_CHILD_PID_FILE", pid_file)
+    start_time = time.time()
+    exit_code, records = run_script(["script_run_targets/spawning_tests.py"],
+                                    pytest_args="-q -s -p no:cacheprovider",
+                                    time_budget=2)
+    assert time.time() - start_time < 20 # Not waiting for the child's output.
+    assert [(r["when"], r["outcome"]) for r in records] == [("budget", "failed")]
+    with open(pid_file) as f:
+        child_pid = int(f.read())
+    for i in range(50): # It may take a moment to be reaped.
+        try:
+            os.kill(child_pid, 0)
+        except OSError:
+            break
+        time.sleep(0.1)
+    else:
+        pytest.fail("The child process of the test was not killed.")
+
+def test_max_failures_within_file():
+    exit_code, records = run_script(["script_run_targets/failing_tests.py",
+                                     "script_run_targets/passing_tests.py"],
+                                    time_budget=30, max_failures=1)
+    assert exit_code == 1
+    assert [(r["nodeid"].split("::")[-1], r["outcome"]) for r in records] == [
+                 ("test_pass_first", "passed"), ("test_fail_first", "failed")]
@@ -0,0 +1,50 @@
+"""
+
+"""
+
+from __future__ import print_function, division, absolute_import
+import os
+import pytest_helper
+
+testing_var = "foo"
+
+if __name__ == "__main__":
+    pytest_helper.script_run(self_test=True, pytest_args="-v")
+
+pytest_helper.autoimport()
+
+from pytest_helper import config_file_handler
+
+this_dir = os.path.dirname(os.path.realpath(__file__))
+
+def test_config_values():
+    assert testing_var == "foo"
+    locals_to_globals()
+    clear_locals_from_globals() # Skipped in the parent's ini, but overridden here.
+    with raises(NameError):
+        unindent # This is on the autoimport skip list in this dir's ini file.
+
+def test_merged_config():
+    config = config_file_handler.get_dir_effective_config(this_dir)
+    assert config.autoimport_skip == ["unindent"]
+    assert config.script_run_extra_pytest_args == "-v" # Inherited from parent dir.
+    assert config.script_run_pytest_args == "-s" # Overrides the top ini file.
+    assert [os.path.basename(os.path.dirname(f)) for f in config.config_files] == [
+                               "test_config_files", "top_dir", "subdir_with_ini"]
+    with raises(AttributeError):
+        config.autoimport_imports = []
+    with raises(AttributeError):
+        config.no_such_setting
+    assert config.get("no_such_setting", 4) == 4
+
+    # Directories without their own file share the parent directory's config.
+    subdir_no_ini = os.path.join(os.path.dirname(this_dir), "subdir_with_no_ini")
+    assert (config_file_handler.get_dir_effective_config(subdir_no_ini) is
+            config_file_handler.get_dir_effective_config(os.path.dirname(this_dir)))
+
+def test_config_root():
+    config = config_file_handler.get_dir_effective_config(
+                            os.path.join(this_dir, "subdir_with_root_ini"))
+    assert len(config.config_files) == 1
+    assert config.get("autoimport_skip") is None
+    assert config.config_root is True
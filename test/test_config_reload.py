@@ -0,0 +1,82 @@
+# -*- coding: utf-8 -*-
+"""
+
+Tests of noticing changed config files in long-running processes.
+
+"""
+
+from __future__ import print_function, division, absolute_import
+import os
+import sys
+
+import pytest_helper
+pytest_helper.script_run(self_test=True, pytest_args="-v")
+pytest_helper.autoimport()
+
+from pytest_helper import config_file_handler, global_settings
+
+def write_config(dirname, text, mtime):
+    """Write a config file in `dirname` and give it the modification time
+    `mtime`, so the change is seen regardless of the filesystem's resolution."""
+    path = os.path.join(dirname, "pytest_helper.ini")
+    with open(path, "w") as f:
+        f.write("[pytest_helper]\n" + text + "\n")
+    os.utime(path, (mtime, mtime))
+    return path
+
+@fixture
+def config_dirs(tmpdir, monkeypatch):
+    top_dir = str(tmpdir)
+    sub_dir = os.path.join(top_dir, "sub")
+    os.mkdir(sub_dir)
+    write_config(top_dir, "config_root = True\nscript_run_pytest_args = '-v'", 1000)
+    module = type(sys)("_pytest_helper_config_reload_test_mod")
+    locals_to_globals()
+
+def get_value(key):
+    return config_file_handler.get_config_value(key, None, module, sub_dir)
+
+def test_recheck_changed_files(config_dirs, monkeypatch):
+    monkeypatch.setattr(global_settings, "CONFIG_RECHECK_INTERVAL", 0)
+    assert get_value("script_run_pytest_args") == "-v"
+    config = config_file_handler.get_dir_effective_config(sub_dir)
+    assert config_file_handler.get_dir_effective_config(sub_dir) is config
+
+    write_config(top_dir, "config_root = True\nscript_run_pytest_args = '-s'", 2000)
+    assert get_value("script_run_pytest_args") == "-s"
+
+    # A new file in a subdirectory is noticed, and its deletion, too.
+    path = write_config(sub_dir, "autoimport_noclobber = False", 1000)
+    assert get_value("autoimport_noclobber") is False
+    assert get_value("script_run_pytest_args") == "-s"
+    os.remove(path)
+    assert get_value("autoimport_noclobber") is None
+
+def test_recheck_interval(config_dirs, monkeypatch):
+    monkeypatch.setattr(global_settings, "CONFIG_RECHECK_INTERVAL", 1000)
+    assert get_value("script_run_pytest_args") == "-v"
+    write_config(top_dir, "config_root = True\nscript_run_pytest_args = '-s'", 2000)
+    assert get_value("script_run_pytest_args") == "-v" # Not yet rechecked.
+    monkeypatch.setattr(config_file_handler, "monotonic_time",
+                        lambda: config_file_handler.time.time() + 10**6)
+    assert get_value("script_run_pytest_args") == "-s"
+
+def test_saved_module_config(config_dirs, monkeypatch):
+    monkeypatch.setattr(global_settings, "CONFIG_RECHECK_INTERVAL", 1000)
+    assert get_value("script_run_pytest_args") == "-v"
+    def fail_lookup(dirname):
+        raise AssertionError("The saved config of the module was not used.")
+    monkeypatch.setattr(config_file_handler, "get_dir_effective_config", fail_lookup)
+    assert get_value("script_run_pytest_args") == "-v"
+    monkeypatch.setattr(config_file_handler, "monotonic_time",
+                        lambda: config_file_handler.time.time() + 10**6)
+    with raises(AssertionError):
+        get_value("script_run_pytest_args") # Due for a recheck.
+
+def test_invalidate_without_recheck(config_dirs, monkeypatch):
+    monkeypatch.setattr(global_settings, "CONFIG_RECHECK_INTERVAL", None)
+    assert get_value("script_run_pytest_args") == "-v"
+    write_config(top_dir, "config_root = True\nscript_run_pytest_args = '-s'", 2000)
+    assert get_value("script_run_pytest_args") == "-v"
+    config_file_handler.invalidate_config_caches()
+    assert get_value("script_run_pytest_args") == "-s"
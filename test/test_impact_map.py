@@ -0,0 +1,176 @@
+# -*- coding: utf-8 -*-
+"""
+
+Tests of recording the impact map of tests and selecting the tests impacted
+by the changes in a git working tree.
+
+"""
+
+from __future__ import print_function, division, absolute_import
+import sys
+import os
+import subprocess
+
+import pytest_helper
+pytest_helper.script_run(self_test=True, pytest_args="-v")
+pytest_helper.autoimport()
+
+from pytest_helper import impact_map
+
+LIB_SOURCE = """
+def double(x):
+    return 2 * x
+
+def negate(x):
+    return -x
+"""
+
+TESTS_SOURCE = """
+from lib import double, negate
+
+def test_double():
+    assert double(2) == 4
+
+def test_negate():
+    assert negate(2) == -2
+"""
+
+def test_line_ranges():
+    assert impact_map.lines_to_ranges_string([10, 1, 2, 3, 5, 11, 12]) == "1-3,5,10-12"
+    assert impact_map.lines_to_ranges_string([]) == ""
+    ranges = impact_map.ranges_string_to_ranges("1-3,5,10-12")
+    assert ranges == [(1, 3), (5, 5), (10, 12)]
+    assert impact_map.ranges_intersect(ranges, {4, 5})
+    assert not impact_map.ranges_intersect(ranges, {4, 6, 13})
+
+def recorded_function():
+    x = 1
+    return x + 1
+
+def test_line_recorder():
+    recorder = impact_map.LineRecorder(os.path.dirname(__file__))
+    try:
+        recorder.start()
+        recorded_function()
+        lines_by_file = recorder.stop()
+    finally:
+        recorder.close()
+    first_line = recorded_function.__code__.co_firstlineno
+    this_file = os.path.realpath(__file__.replace(".pyc", ".py"))
+    assert {first_line + 1, first_line + 2} <= lines_by_file[this_file]
+
+def outside_function(x):
+    return x + 1
+
+@pytest.mark.skipif(not hasattr(sys, "monitoring"), reason="Needs sys.monitoring.")
+def test_line_recorder_monitoring(tmpdir):
+    tmpdir.join("lib_in_root.py").write(LIB_SOURCE)
+    sys.path.insert(0, str(tmpdir))
+    try:
+        import lib_in_root
+    finally:
+        sys.path.remove(str(tmpdir))
+        sys.modules.pop("lib_in_root", None)
+    recorder = impact_map.LineRecorder(str(tmpdir))
+    start_codes = []
+    def counting_start_callback(code, instruction_offset):
+        start_codes.append(code.co_name)
+        return impact_map.LineRecorder.monitoring_start_callback(recorder, code,
+                                                                 instruction_offset)
+    recorder.monitoring_start_callback = counting_start_callback
+
+    # Another tool, like coverage.py, which disables its line events as they run.
+    monitoring = sys.monitoring
+    other_tool_id = 5
+    monitoring.use_tool_id(other_tool_id, "other_tool")
+    other_lines = []
+    def other_line_callback(code, line_number):
+        if code is outside_function.__code__:
+            other_lines.append(line_number)
+        return monitoring.DISABLE
+    monitoring.register_callback(other_tool_id, monitoring.events.LINE, other_line_callback)
+    monitoring.set_events(other_tool_id, monitoring.events.LINE)
+    try:
+        lines = []
+        for i in range(3): # Like three tests.
+            recorder.start()
+            lib_in_root.double(i)
+            outside_function(i)
+            lines.append(recorder.stop())
+            if i == 0:
+                assert start_codes.count("outside_function") == 1
+                del start_codes[:]
+    finally:
+        recorder.close()
+        monitoring.set_events(other_tool_id, 0)
+        monitoring.register_callback(other_tool_id, monitoring.events.LINE, None)
+        monitoring.free_tool_id(other_tool_id)
+    lib_file = os.path.realpath(str(tmpdir.join("lib_in_root.py")))
+    assert lines[0] == lines[1] == lines[2] == {lib_file: {3}}
+    assert "outside_function" not in start_codes # Disabled after the first time.
+    assert len(other_lines) == 1 # Its disabled events were not restarted.
+
+def test_impact_map_db(tmpdir):
+    db = impact_map.ImpactMapDB(str(tmpdir.join("impact.db")))
+    try:
+        db.store("t.py::test_a", {"/x/lib.py": {1, 2, 3}, "/x/t.py": {5}})
+        db.store("t.py::test_b", {"/x/lib.py": {10}})
+        assert db.impacted_nodeids({"/x/lib.py": {3}}) == ["t.py::test_a"]
+        assert db.impacted_nodeids({"/x/lib.py": {2, 10}}) == ["t.py::test_a",
+                                                                "t.py::test_b"]
+        db.store("t.py::test_a", {"/x/t.py": {5}}) # Replaces the old lines.
+        assert db.impacted_nodeids({"/x/lib.py": {3}}) == []
+    finally:
+        db.close()
+
+def git(repo_dir, *args):
+    subprocess.check_call(("git",) + args, cwd=repo_dir, stdout=subprocess.PIPE)
+
+def test_record_and_select_impacted(tmpdir):
+    repo_dir = os.path.realpath(str(tmpdir))
+    with open(os.path.join(repo_dir, "lib.py"), "w") as f:
+        f.write(LIB_SOURCE)
+    with open(os.path.join(repo_dir, "test_lib.py"), "w") as f:
+        f.write(TESTS_SOURCE)
+    git(repo_dir, "init", "-q")
+    git(repo_dir, "add", "lib.py", "test_lib.py")
+    git(repo_dir, "-c", "user.name=test", "-c", "user.email=test@example.com",
+        "commit", "-q", "-m", "Initial.")
+    assert impact_map.get_git_root(repo_dir) == repo_dir
+
+    db_path = os.path.join(repo_dir, impact_map.DEFAULT_IMPACT_DB_NAME)
+    plugin = impact_map.ImpactRecorderPlugin(db_path, repo_dir)
+    pytest.main(["-q", "-p", "no:cacheprovider", "--rootdir", repo_dir,
+                 os.path.join(repo_dir, "test_lib.py")], plugins=[plugin])
+    assert plugin.num_tests == 2
+
+    test_file = os.path.join(repo_dir, "test_lib.py")
+    assert impact_map.select_impacted_tests(db_path, [test_file], repo_dir) == []
+
+    # Change only the body of negate.
+    with open(os.path.join(repo_dir, "lib.py"), "w") as f:
+        f.write(LIB_SOURCE.replace("return -x", "return 0 - x"))
+    changed_lines = impact_map.get_changed_lines(repo_dir)
+    assert changed_lines[os.path.join(repo_dir, "lib.py")] == {6}
+    assert changed_lines[db_path] == set() # Untracked files have no lines.
+    assert impact_map.select_impacted_tests(db_path, [test_file], repo_dir) == [
+                                      test_file + "::test_negate"]
+
+    # A changed test file is run in full.
+    with open(test_file, "a") as f:
+        f.write("\ndef test_new():\n    pass\n")
+    assert impact_map.select_impacted_tests(db_path, [test_file], repo_dir) == [
+                                      test_file]
+
+    # New test files are run, including staged ones, matched with python_files.
+    with open(os.path.join(repo_dir, "pytest.ini"), "w") as f:
+        f.write("[pytest]\npython_files = test_*.py check_*.py\n")
+    for name in ["check_new.py", "check_staged.py", "helper_new.py"]:
+        with open(os.path.join(repo_dir, name), "w") as f:
+            f.write("def test_new():\n    pass\n")
+    git(repo_dir, "add", "check_staged.py")
+    assert os.path.join(repo_dir, "check_staged.py") in impact_map.get_changed_lines(repo_dir)
+    selected = impact_map.select_impacted_tests(db_path, [repo_dir], repo_dir,
+                                                ["-p", "no:cacheprovider"])
+    assert selected == [os.path.join(repo_dir, name) for name in
+                        ["check_new.py", "check_staged.py", "test_lib.py"]]
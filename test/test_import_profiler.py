@@ -0,0 +1,63 @@
+# -*- coding: utf-8 -*-
+"""
+
+Tests of the import profiler used by the `import_profile` option of
+`script_run`.
+
+"""
+
+from __future__ import print_function, division, absolute_import
+import sys
+import os
+
+import pytest_helper
+pytest_helper.script_run(self_test=True, pytest_args="-v")
+pytest_helper.autoimport()
+
+from pytest_helper.import_profiler import ImportTimingFinder
+
+def test_import_timing_finder(tmpdir, monkeypatch):
+    tmpdir.join("profiled_parent.py").write("import time, profiled_child\n"
+                                            "time.sleep(0.02)\n")
+    tmpdir.join("profiled_child.py").write("import time\ntime.sleep(0.05)\n")
+    monkeypatch.syspath_prepend(str(tmpdir))
+    finder = ImportTimingFinder()
+    finder.current_file = "some_file.py"
+    sys.meta_path.insert(0, finder)
+    try:
+        import profiled_parent
+    finally:
+        sys.meta_path.remove(finder)
+        sys.modules.pop("profiled_parent", None)
+        sys.modules.pop("profiled_child", None)
+
+    [(filename, record)] = finder.roots
+    assert filename == "some_file.py"
+    assert record.name == "profiled_parent"
+    [child] = record.children
+    assert child.name == "profiled_child"
+    assert child.cumulative >= 0.05 and child.self_time == child.cumulative
+    assert record.cumulative >= 0.07
+    assert 0.02 <= record.self_time < record.cumulative - 0.04
+    assert type(profiled_parent.__loader__) is not type(finder) # Restored.
+    assert profiled_parent.__spec__.loader is profiled_parent.__loader__
+
+def test_script_run_import_profile(capsys):
+    target = os.path.join(os.path.dirname(__file__),
+                          "script_run_targets", "importing_tests.py")
+    try:
+        pytest_helper.script_run(target, pytest_args="-q -p no:cacheprovider",
+                                 always_run=True, exit=False, import_profile=5)
+    finally:
+        for name in ["slow_import_target", "slow_import_child",
+                     "slow_import_child_lazy", "importing_tests"]:
+            sys.modules.pop(name, None)
+    lines = capsys.readouterr().out.splitlines()
+    start = lines.index([l for l in lines if "import profile" in l][0])
+    assert lines[start+1].startswith(os.path.relpath(target) + ":")
+    names = [line.split()[-1] for line in lines[start+2:start+7]]
+    # The slowest imports, in tree order.
+    assert names[:3] == ["importing_tests", "slow_import_target", "slow_import_child"]
+    assert "slow_import_child_lazy" in names # Imported in a test, not collection.
+    child_cumulative, child_self = [float(t) for t in lines[start+4].split()[:2]]
+    assert child_cumulative >= 0.1 and child_self >= 0.1
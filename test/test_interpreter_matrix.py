@@ -0,0 +1,69 @@
+# -*- coding: utf-8 -*-
+"""
+
+Tests of running the tests under several interpreters with `script_run`.
+
+"""
+
+from __future__ import print_function, division, absolute_import
+import sys
+import os
+import subprocess
+
+import pytest_helper
+pytest_helper.script_run(self_test=True, pytest_args="-v")
+pytest_helper.autoimport()
+
+from pytest_helper import PytestHelperException
+from pytest_helper.interpreter_matrix import InterpreterMatrix
+from pytest_helper.result_reporter import subprocess_env, get_plugin_dir
+
+def test_matrix_summary():
+    matrix = InterpreterMatrix(["py_a", "py_b"])
+    for interpreter in ["py_a", "py_b"]:
+        matrix.add_record(interpreter, {"nodeid": "t.py::test_ok", "when": "call",
+                                        "outcome": "passed"})
+        matrix.exit_codes[interpreter] = 0
+    matrix.add_record("py_a", {"nodeid": "t.py::test_x", "when": "call",
+                               "outcome": "failed"})
+    matrix.add_record("py_a", {"nodeid": "t.py::test_x", "when": "teardown",
+                               "outcome": "failed"})
+    lines = matrix.summary_lines()
+    assert "   py_a: 1 passed, 0 skipped, 0 failed, 1 error, exit code 0" in lines[1]
+    assert lines[-1].split() == ["error", "missing", "t.py::test_x"]
+    assert not any("test_ok" in line for line in lines)
+
+def test_reporter_loads_without_package():
+    # The interpreters only need pytest, not the dependencies of pytest_helper.
+    code = "import sys, pytest_helper_reporter; sys.exit('pytest_helper' in sys.modules)"
+    assert subprocess.call([sys.executable, "-c", code], env=subprocess_env()) == 0
+
+    # Other interpreters only get the plugin, not the directory of the package.
+    env = subprocess_env(same_interpreter=False)
+    assert env["PYTHONPATH"].split(os.pathsep)[0] == get_plugin_dir()
+    assert os.listdir(get_plugin_dir()) == ["pytest_helper_reporter.py"]
+    assert subprocess.call([sys.executable, "-c", code], env=env) == 0
+
+def test_script_run_interpreters(tmpdir, capfd):
+    odd_python = os.path.join(str(tmpdir), "python_odd")
+    os.symlink(sys.executable, odd_python)
+    records = []
+    exit_code = pytest_helper.script_run("script_run_targets/interpreter_tests.py",
+                      pytest_args="-q -p no:cacheprovider", always_run=True,
+                      exit=False, on_result=records.append,
+                      interpreters=[sys.executable, odd_python])
+    assert exit_code == 1
+    outcomes = dict(((r["interpreter"], r["nodeid"].split("::")[-1]), r["outcome"])
+                    for r in records)
+    assert outcomes == {(sys.executable, "test_everywhere"): "passed",
+                        (sys.executable, "test_not_odd_interpreter"): "passed",
+                        (odd_python, "test_everywhere"): "passed",
+                        (odd_python, "test_not_odd_interpreter"): "failed"}
+    out, err = capfd.readouterr()
+    assert "output of the run under " + odd_python in out
+    assert "tests which did not pass under every interpreter (1 of 2)" in out
+
+    with raises(PytestHelperException):
+        pytest_helper.script_run("script_run_targets/interpreter_tests.py",
+                                 always_run=True, exit=False,
+                                 interpreters=[sys.executable, "no_such_python_x"])
@@ -11,6 +11,10 @@ if __name__ == "__main__":
 
 pytest_helper.autoimport()  # Do some basic imports automatically.
 
+from pytest_helper import globals_scope_fixture
+import os
+import weakref
+
 def my_setup1():
     setup_var1 = "foo"
     setup_var2 = "bar"
@@ -81,3 +85,148 @@ def test_unindent():
     assert unindent(0, "\nHello\nthere.\n") == "Hello\nthere."
     assert unindent(0, "\nHello\nthere.") == "Hello"
 
+def test_unindent_cached():
+    text = """
+            Hello
+              there.
+          """
+    first = unindent(10, text)
+    assert first == "  Hello\n    there."
+    assert unindent(10, text) is first # Cached result.
+    assert unindent(8, text) == "    Hello\n      there." # Level is in the cache key.
+    with raises(pytest_helper.PytestHelperException):
+        unindent(13, text)
+    with raises(pytest_helper.PytestHelperException):
+        unindent(13, text) # Errors are not cached.
+
+def test_assert_text_equal():
+    import io
+    text = "\n".join("line {0}".format(i) for i in range(1000)) + "\n"
+    assert_text_equal(text, text[:]) # Autoimported.
+    assert_text_equal(io.StringIO(text), text, chunk_size=7)
+    assert_text_equal(text, io.StringIO(text), chunk_size=7)
+
+    changed = text.replace("line 500\n", "line 500 changed\n").replace(
+                           "line 700\n", "line 700 changed\n")
+    with raises(AssertionError) as excinfo:
+        assert_text_equal(changed, text, max_mismatches=1, context_lines=1)
+    message = str(excinfo.value)
+    assert "Mismatch at line 501:" in message
+    assert "'line 499'" in message and "'line 498'" not in message # Context.
+    assert "- " in message and "'line 500 changed'" in message
+    assert "line 700" not in message # Only the first mismatch is shown.
+
+    with raises(AssertionError) as excinfo:
+        assert_text_equal(io.StringIO(text + "extra"), io.StringIO(text))
+    assert "Mismatch at line 1001:" in str(excinfo.value)
+    assert "<no line>" not in str(excinfo.value)
+
+    with raises(AssertionError) as excinfo:
+        assert_text_equal(text + "extra\n", text)
+    assert "<no line>" in str(excinfo.value)
+
+    with raises(AssertionError) as excinfo:
+        assert_text_equal("x" * 1000 + "\n", "y\n", max_line_length=10)
+    assert "'xxxxxxxxxx'..." in str(excinfo.value)
+
+def test_unindent_lines():
+    lines = pytest_helper.unindent_lines(8, """
+        unindented line 1
+            indented line 2
+
+        unindented line 4
+        """)
+    assert next(lines) == "unindented line 1"
+    assert list(lines) == ["    indented line 2", "", "unindented line 4"]
+    assert list(pytest_helper.unindent_lines(3, "   Two\nlines")) == []
+
+    lines = pytest_helper.unindent_lines(3, "\n   Hello\n  there.\n")
+    assert next(lines) == "Hello" # The error is raised lazily.
+    with raises(pytest_helper.PytestHelperException):
+        next(lines)
+
+
+shadowed_var = "original"
+
+def my_setup3():
+    shadowed_var = "shadowing"
+    scope_only_var = "scoped"
+    locals_to_globals(noclobber=False)
+
+def test_globals_scope():
+    with pytest_helper.globals_scope():
+        my_setup3()
+        assert shadowed_var == "shadowing"
+        assert scope_only_var == "scoped"
+    assert shadowed_var == "original"
+    with raises(NameError):
+        scope_only_var
+
+    # Values deleted by clear_locals_from_globals are also restored.
+    my_setup3()
+    with pytest_helper.globals_scope():
+        clear_locals_from_globals()
+        with raises(NameError):
+            shadowed_var
+    assert shadowed_var == "shadowing"
+
+    # Nested scopes each restore to their own starting state.
+    clear_locals_from_globals()
+    globals()["shadowed_var"] = "original"
+    with pytest_helper.globals_scope():
+        my_setup3()
+        with pytest_helper.globals_scope():
+            clear_locals_from_globals()
+            my_setup4()
+            assert shadowed_var == "inner"
+        assert shadowed_var == "shadowing"
+        assert scope_only_var == "scoped"
+    assert shadowed_var == "original"
+    with raises(NameError):
+        scope_only_var
+
+def my_setup4():
+    shadowed_var = "inner"
+    locals_to_globals(noclobber=False)
+
+def test_globals_scope_fixture(globals_scope_fixture):
+    my_setup3()
+    assert shadowed_var == "shadowing"
+
+def test_globals_scope_fixture_restored():
+    assert shadowed_var == "original"
+
+class WeaklyReferenceable(object):
+    pass
+
+def my_evicting_setup():
+    evicted_list = list(range(1000))
+    evicted_obj = WeaklyReferenceable()
+    locals_to_globals(evict=True, weak=True)
+    return evicted_obj
+
+def test_evict_and_weak():
+    obj = my_evicting_setup() # Holds the only strong reference.
+    assert len(evicted_list) == 1000
+    assert evicted_obj == obj
+    assert type(globals()["evicted_obj"]) is weakref.ProxyType
+    current, peak = pytest_helper.retained_globals_report()[__name__]
+    assert current >= pytest_helper.pytest_helper_main.get_value_size(evicted_list)
+    assert peak >= current
+
+    released = pytest_helper.evict_tracked_globals(globals())
+    assert released == current - pytest_helper.retained_globals_report()[__name__][0]
+    assert pytest_helper.retained_globals_report()[__name__][1] == peak
+    with raises(NameError):
+        evicted_list
+    with raises(NameError):
+        evicted_obj
+
+def test_evict_plugin():
+    target = os.path.join(os.path.dirname(__file__),
+                          "script_run_targets", "evicting_tests.py")
+    pytest.main(["-q", "-p", "no:cacheprovider", "-p", "pytest_helper.plugin", target])
+    report = pytest_helper.retained_globals_report()
+    current, peak = [v for k, v in report.items() if k.endswith("evicting_tests")][0]
+    assert current == 0
+    assert peak > 8 * 10000
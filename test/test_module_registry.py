@@ -0,0 +1,95 @@
+# -*- coding: utf-8 -*-
+"""
+
+Tests of the registry of module info used by `get_calling_module_info`.
+
+"""
+
+from __future__ import print_function, division, absolute_import
+import sys
+import os
+import gc
+import importlib
+
+import pytest_helper
+pytest_helper.script_run(self_test=True, pytest_args="-v")
+pytest_helper.autoimport()
+
+from pytest_helper.module_registry import module_info_registry
+from pytest_helper.pytest_helper_main import get_calling_module_info
+
+def import_from(dirname, name, source):
+    with open(os.path.join(dirname, name + ".py"), "w") as f:
+        f.write(source)
+    sys.path.insert(0, dirname)
+    try:
+        importlib.invalidate_caches()
+        return importlib.import_module(name)
+    finally:
+        sys.path.remove(dirname)
+
+def test_record_unpacks_like_tuple():
+    mod_info = get_calling_module_info(level=1)
+    name, module, path, dirname, in_pkg = mod_info
+    assert module is sys.modules[__name__]
+    assert mod_info[0] == name and mod_info[3] == dirname == os.path.dirname(path)
+    assert mod_info[1:3] == (module, path)
+    assert get_calling_module_info(level=1) is mod_info
+    assert module_info_registry.get_by_name(__name__) is mod_info
+
+def test_evicted_when_collected(tmpdir):
+    dirname = os.path.realpath(str(tmpdir))
+    module = import_from(dirname, "_registry_test_mod", "value = 1\n")
+    mod_info = get_calling_module_info(module_name="_registry_test_mod")
+    assert mod_info.module is module and mod_info.dir == dirname
+    num_records = len(module_info_registry)
+
+    del sys.modules["_registry_test_mod"] # Still alive, and found by name.
+    assert get_calling_module_info(module_name="_registry_test_mod") is mod_info
+
+    del module
+    gc.collect()
+    assert mod_info.module is None
+    assert len(module_info_registry) == num_records - 1
+    assert module_info_registry.get_by_name("_registry_test_mod") is None
+    with raises(KeyError):
+        get_calling_module_info(module_name="_registry_test_mod")
+
+def test_reused_name_and_reload(tmpdir):
+    dirname = os.path.realpath(str(tmpdir))
+    old_module = import_from(dirname, "_registry_reused_mod", "value = 1\n")
+    try:
+        old_info = get_calling_module_info(module_name="_registry_reused_mod")
+        del sys.modules["_registry_reused_mod"]
+
+        # A new module under the same name, from another directory.
+        new_dirname = os.path.join(dirname, "new")
+        os.mkdir(new_dirname)
+        new_module = import_from(new_dirname, "_registry_reused_mod", "value = 2\n")
+        new_info = get_calling_module_info(module_name="_registry_reused_mod")
+        assert new_info.module is new_module and new_info.dir == new_dirname
+        assert old_info.module is old_module and old_info.dir == dirname
+        assert module_info_registry.get_by_name("_registry_reused_mod") is new_info
+
+        # Dropping the old module leaves the name index of the new one alone.
+        del old_module, old_info
+        gc.collect()
+        assert module_info_registry.get_by_name("_registry_reused_mod") is new_info
+
+        # A reload from a different file gets new info.
+        os.remove(os.path.join(new_dirname, "_registry_reused_mod.py"))
+        os.mkdir(os.path.join(new_dirname, "_registry_reused_mod"))
+        with open(os.path.join(new_dirname, "_registry_reused_mod", "__init__.py"), "w") as f:
+            f.write("value = 3\n")
+        sys.path.insert(0, new_dirname)
+        try:
+            importlib.invalidate_caches()
+            importlib.reload(new_module)
+        finally:
+            sys.path.remove(new_dirname)
+        reloaded_info = get_calling_module_info(module_name="_registry_reused_mod")
+        assert reloaded_info is not new_info
+        assert reloaded_info.dir == os.path.join(new_dirname, "_registry_reused_mod")
+        assert reloaded_info.in_pkg
+    finally:
+        sys.modules.pop("_registry_reused_mod", None)
@@ -0,0 +1,77 @@
+# -*- coding: utf-8 -*-
+"""
+
+Tests of the performance regression gate used by the `perf_baseline` option
+of `script_run`.
+
+"""
+
+from __future__ import print_function, division, absolute_import
+import sys
+import os
+
+import pytest_helper
+pytest_helper.script_run(self_test=True, pytest_args="-v")
+pytest_helper.autoimport()
+
+from pytest_helper.perf_gate import slowdown, read_perf_baseline
+
+target = os.path.join(os.path.dirname(__file__), "script_run_targets", "timed_tests.py")
+
+def run_timed_tests(delay, monkeypatch, **kwargs):
+    monkeypatch.setenv("PYTEST_HELPER_TIMED_TEST_DELAY", str(delay))
+    records = []
+    try:
+        exit_code = pytest_helper.script_run(target, pytest_args="-q -p no:cacheprovider",
+                             always_run=True, exit=False, repeat=3, warmup=1,
+                             on_result=records.append, **kwargs)
+    finally:
+        sys.modules.pop("timed_tests", None)
+    return exit_code, dict((r["nodeid"].split("::")[-1], r) for r in records)
+
+def test_slowdown():
+    base = {"median": 1.0, "variance": 0.0}
+    assert slowdown(base, {"median": 1.9, "variance": 0.0}, 2.0) is None
+    assert slowdown(base, {"median": 3.0, "variance": 0.0}, 2.0) == 3.0
+    # Not a regression when within the noise.
+    assert slowdown(base, {"median": 3.0, "variance": 0.5}, 2.0) is None
+
+def test_perf_baseline(tmpdir, monkeypatch, capsys):
+    baseline_file = str(tmpdir.join("baseline.jsonl"))
+    exit_code, records = run_timed_tests(0.005, monkeypatch, perf_baseline=baseline_file,
+                                         update_perf_baseline=True)
+    assert exit_code == 0
+    baseline = read_perf_baseline(baseline_file)
+    assert [n.split("::")[-1] for n in baseline] == ["test_timed"]
+
+    # The same speed passes.
+    exit_code, records = run_timed_tests(0.005, monkeypatch, perf_baseline=baseline_file)
+    assert exit_code == 0
+    assert "perf_slowdown" not in records["test_timed"]
+    assert "compared 1 tests" in capsys.readouterr().out
+
+    # Four times slower fails.
+    exit_code, records = run_timed_tests(0.02, monkeypatch, perf_baseline=baseline_file,
+                                         perf_ratio=3)
+    assert exit_code == 1
+    assert records["test_timed"]["outcome"] == "failed"
+    assert records["test_timed"]["perf_slowdown"] > 3
+    out = capsys.readouterr().out
+    assert "performance regression" in out and "1 regressions" in out
+
+    # Or is only marked.
+    exit_code, records = run_timed_tests(0.02, monkeypatch, perf_baseline=baseline_file,
+                                         perf_ratio=3, perf_fail=False)
+    assert exit_code == 0
+    assert records["test_timed"]["outcome"] == "passed"
+    assert records["test_timed"]["perf_slowdown"] > 3
+
+def test_update_perf_baseline(tmpdir, monkeypatch):
+    results_file = str(tmpdir.join("results.jsonl"))
+    baseline_file = str(tmpdir.join("baseline.jsonl"))
+    run_timed_tests(0.005, monkeypatch, results_file=results_file)
+    assert pytest_helper.update_perf_baseline(baseline_file, [results_file]) == 1
+    baseline = read_perf_baseline(baseline_file)
+    [timed_nodeid] = [n for n in baseline if n.endswith("test_timed")]
+    assert baseline[timed_nodeid]["median"] >= 0.005
+    assert baseline[timed_nodeid]["runs"] == 3
@@ -0,0 +1,27 @@
+# -*- coding: utf-8 -*-
+"""
+
+Tests of the pytest plugin `pytest_helper.plugin`.
+
+"""
+
+from __future__ import print_function, division, absolute_import
+import os
+
+import pytest_helper
+pytest_helper.script_run(self_test=True, pytest_args="-v")
+pytest_helper.autoimport()
+
+def test_precompute_module_info():
+    target = os.path.join(os.path.dirname(__file__),
+                          "script_run_targets", "precomputed_info_tests.py")
+    records = []
+    pytest_helper.script_run(target, pytest_args="-q -p no:cacheprovider"
+                                                 " -p pytest_helper.plugin",
+                             always_run=True, exit=False, on_result=records.append)
+    assert [r["outcome"] for r in records] == ["passed"]
+
+def test_get_frame():
+    frame = pytest_helper.pytest_helper_main.get_frame(1)
+    assert frame.f_code.co_name == "test_get_frame"
+    assert pytest_helper.pytest_helper_main.get_calling_fun_globals_dict(1) is globals()
@@ -0,0 +1,65 @@
+# -*- coding: utf-8 -*-
+"""
+
+Tests of the `repeat` and `warmup` options of `script_run`.
+
+"""
+
+from __future__ import print_function, division, absolute_import
+import sys
+import os
+import re
+
+import pytest_helper
+pytest_helper.script_run(self_test=True, pytest_args="-v")
+pytest_helper.autoimport()
+
+from pytest_helper.repeat_runner import (percentile, variance, duration_stats,
+                                         RepeatRunPlugin)
+
+def test_stats():
+    values = [5.0, 1.0, 4.0, 2.0, 3.0]
+    assert percentile(values, 50) == 3.0
+    assert percentile(values, 95) == 4.8
+    assert percentile([2.0], 95) == 2.0
+    assert variance(values) == 2.5
+    assert variance([2.0]) == 0.0
+    stats = duration_stats([1.0, 1.0, 1.0])
+    assert stats["median"] == 1.0 and stats["cv"] == 0.0 and stats["runs"] == 3
+    plugin = RepeatRunPlugin(3)
+    plugin.stats = {"steady": stats, "noisy": duration_stats([1.0, 2.0, 1.0])}
+    assert plugin.unstable_tests() == ["noisy"]
+
+def test_script_run_repeat(capsys):
+    target = os.path.join(os.path.dirname(__file__),
+                          "script_run_targets", "repeated_tests.py")
+    records = []
+    try:
+        exit_code = pytest_helper.script_run(target, pytest_args="-q -p no:cacheprovider",
+                                 always_run=True, exit=False, repeat=6, warmup=2,
+                                 on_result=records.append)
+        counts = sys.modules["repeated_tests"].counts
+    finally:
+        sys.modules.pop("repeated_tests", None)
+    assert exit_code == 1
+    assert counts["steady"] == counts["noisy"] == 8
+    assert counts["flaky"] == 3 # Stopped at the first failing run.
+    assert counts["module_setups"] == 1
+
+    records = dict((r["nodeid"].split("::")[-1], r) for r in records)
+    assert records["test_flaky"]["outcome"] == "failed"
+    assert "repeat_stats" not in records["test_flaky"]
+    stats = records["test_steady"]["repeat_stats"]
+    assert stats["runs"] == 6
+    assert records["test_steady"]["duration"] == stats["median"] >= 0.01
+    assert stats["p95"] >= stats["median"]
+
+    out = capsys.readouterr().out
+    # Each test is counted once, with no errors from tearing down twice.
+    assert re.search(r"^=* ?1 failed, 3 passed in [0-9.]+s ?=*$", out, re.MULTILINE)
+    assert "ERROR" not in out
+    assert "over 6 runs after 2 warmup runs" in out
+    unstable = [line.split("::")[-1] for line in
+                out.split("vary too much between runs")[1].splitlines()[1:]
+                if line.startswith("   ")]
+    assert "test_noisy" in unstable
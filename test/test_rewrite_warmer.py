@@ -0,0 +1,85 @@
+# -*- coding: utf-8 -*-
+"""
+
+Tests of warming up pytest's assertion-rewrite cache with the
+`warm_rewrite_cache` option of `script_run`.
+
+"""
+
+from __future__ import print_function, division, absolute_import
+import sys
+import os
+
+import pytest_helper
+pytest_helper.script_run(self_test=True, pytest_args="-v")
+pytest_helper.autoimport()
+
+from pytest_helper import rewrite_warmer
+
+pytestmark = pytest.mark.skipif(not rewrite_warmer.rewriting_available(),
+                                reason="The pytest rewrite functions are not available.")
+
+TEST_SOURCE = """
+def test_value():
+    x = {0}
+    assert x == {0}
+"""
+
+def cached_pyc_files(dirname):
+    from _pytest.assertion.rewrite import PYC_TAIL
+    pycache_dir = os.path.join(dirname, "__pycache__")
+    if not os.path.isdir(pycache_dir):
+        return []
+    return sorted(f for f in os.listdir(pycache_dir) if f.endswith(PYC_TAIL))
+
+def test_warm_rewrite_cache(tmpdir, monkeypatch, capsys):
+    monkeypatch.setattr(sys, "dont_write_bytecode", False)
+    dirname = str(tmpdir)
+    num_files = 3 * rewrite_warmer.REWRITE_CHUNK_SIZE
+    module_names = ["test_warm_{0}".format(i) for i in range(num_files)]
+    for i, name in enumerate(module_names):
+        tmpdir.join(name + ".py").write(TEST_SOURCE.format(i))
+    tmpdir.join("helper.py").write("value = 1\n")
+
+    plugin = rewrite_warmer.RewriteWarmerPlugin(max_workers=2)
+    try:
+        pytest.main(["-q", "-p", "no:cacheprovider", "--collect-only", dirname],
+                     plugins=[plugin])
+    finally:
+        for name in module_names:
+            sys.modules.pop(name, None)
+    assert plugin.num_rewritten == num_files
+    assert plugin.num_cached == 0
+    assert len(cached_pyc_files(dirname)) == num_files
+
+    # A second run finds them all cached, also when run from script_run.
+    records = []
+    try:
+        pytest_helper.script_run(dirname, pytest_args="-q -p no:cacheprovider",
+                                 always_run=True, exit=False, warm_rewrite_cache=True,
+                                 on_result=records.append)
+    finally:
+        for name in module_names:
+            sys.modules.pop(name, None)
+    assert len(records) == num_files
+    assert all(r["outcome"] == "passed" for r in records)
+    assert "({0} files rewritten, {1} already cached)".format(0, num_files) in (
+                                                             capsys.readouterr().out)
+
+def test_warm_skips_ignored_dirs(tmpdir, monkeypatch):
+    monkeypatch.setattr(sys, "dont_write_bytecode", False)
+    tmpdir.join("test_top.py").write(TEST_SOURCE.format(0))
+    for dirname in ["build", "node_modules", "env", "skipped"]:
+        tmpdir.mkdir(dirname).join("test_b.py").write(TEST_SOURCE.format(1))
+    tmpdir.join("env", "pyvenv.cfg").write("home = /usr/bin\n") # A virtualenv.
+
+    plugin = rewrite_warmer.RewriteWarmerPlugin(max_workers=2)
+    try:
+        pytest.main(["-q", "-p", "no:cacheprovider", "--collect-only", str(tmpdir),
+                     "--ignore", str(tmpdir.join("skipped"))], plugins=[plugin])
+    finally:
+        sys.modules.pop("test_top", None)
+    assert plugin.num_rewritten == 1
+    assert len(cached_pyc_files(str(tmpdir))) == 1
+    for dirname in ["build", "node_modules", "env", "skipped"]:
+        assert cached_pyc_files(str(tmpdir.join(dirname))) == []
@@ -0,0 +1,50 @@
+# -*- coding: utf-8 -*-
+"""
+
+Tests of the sampling profiler used by the `sample_profile` option of
+`script_run`.
+
+"""
+
+from __future__ import print_function, division, absolute_import
+import sys
+import os
+
+import pytest_helper
+pytest_helper.script_run(self_test=True, pytest_args="-v")
+pytest_helper.autoimport()
+
+from pytest_helper.sample_profiler import (collapsed_lines, frame_label,
+                                           OUTSIDE_TESTS_LABEL)
+
+def test_collapsed_lines():
+    code = test_collapsed_lines.__code__
+    label = frame_label(code)
+    assert label.startswith("test_collapsed_lines (test_sample_profiler.py:")
+    counts = {("t.py::test_a[x;y]", (code,)): 2, ("t.py::test_a[x;y]", (code, code)): 1,
+              (OUTSIDE_TESTS_LABEL, ()): 3}
+    assert collapsed_lines(counts) == [OUTSIDE_TESTS_LABEL + " 3",
+                                       "t.py::test_a[x,y];" + label + " 2",
+                                       "t.py::test_a[x,y];{0};{0} 1".format(label)]
+
+def test_script_run_sample_profile(tmpdir, capfd):
+    profile_file = os.path.join(str(tmpdir), "profile.collapsed")
+    exit_code = pytest_helper.script_run("script_run_targets/busy_tests.py",
+                      pytest_args="-q -p no:cacheprovider", always_run=True,
+                      exit=False, sample_profile=profile_file, sample_rate=500)
+    assert exit_code == 0
+    samples = {}
+    spin_samples = 0
+    with open(profile_file) as f:
+        for line in f:
+            stack, count = line.rsplit(" ", 1)
+            root = stack.split(";")[0].split("::")[-1]
+            samples[root] = samples.get(root, 0) + int(count)
+            if ";spin_for (busy_tests.py:" in stack:
+                assert root == "test_busy" and ";test_busy (busy_tests.py:" in stack
+                spin_samples += int(count)
+    assert spin_samples > 10 # Up to 60 in 0.3 seconds, limited by the GIL.
+    assert samples["test_busy"] >= spin_samples
+    assert samples.get("test_idle", 0) < samples["test_busy"]
+    out, err = capfd.readouterr()
+    assert "stack samples at 500 per second" in out
@@ -0,0 +1,39 @@
+# -*- coding: utf-8 -*-
+"""
+
+Tests of `script_run_async`, which runs pytest in a subprocess and streams
+back the results.
+
+"""
+
+from __future__ import print_function, division, absolute_import
+import sys
+
+import pytest_helper
+pytest_helper.script_run(self_test=True, pytest_args="-v")
+pytest_helper.autoimport()
+
+if sys.version_info < (3, 7):
+    skip("Requires asyncio.run, from Python 3.7.", allow_module_level=True)
+
+import asyncio
+
+def test_script_run_async_records():
+    async def collect_records():
+        run = pytest_helper.script_run_async("test_intro_example.py")
+        records = [r async for r in run]
+        return records, run.returncode
+    records, returncode = asyncio.run(collect_records())
+    assert returncode == 0
+    assert len(records) == 1
+    assert records[0]["nodeid"].endswith("test_intro_example.py::test_var_values")
+    assert records[0]["outcome"] == "passed"
+    assert records[0]["when"] == "call"
+    assert records[0]["module"] == __name__
+
+def test_script_run_async_await():
+    async def run_tests():
+        return await pytest_helper.script_run_async("test_intro_example.py",
+                                                    pytest_args="-k no_such_test")
+    exit_code = asyncio.run(run_tests())
+    assert exit_code == 5 # Pytest's exit code when no tests were collected.
@@ -0,0 +1,63 @@
+# -*- coding: utf-8 -*-
+"""
+
+Tests of the options to `script_run` which report or act on the results of
+the individual tests.
+
+"""
+
+from __future__ import print_function, division, absolute_import
+
+import pytest_helper
+pytest_helper.script_run(self_test=True, pytest_args="-v")
+pytest_helper.autoimport()
+
+TARGET_FILES = ["script_run_targets/failing_tests.py",
+                "script_run_targets/passing_tests.py"]
+
+def run_script(**kwargs):
+    """Run `script_run` on the target files without exiting, returning the
+    list of records passed to `on_result`."""
+    records = []
+    pytest_helper.script_run(TARGET_FILES, pytest_args="-q -p no:cacheprovider",
+                             always_run=True, exit=False, on_result=records.append,
+                             **kwargs)
+    return records
+
+def test_on_result():
+    records = run_script()
+    assert [r["outcome"] for r in records] == ["passed", "failed", "failed",
+                                               "passed", "passed", "passed"]
+    assert records[1]["nodeid"].endswith("failing_tests.py::test_fail_first")
+    assert all(r["module"] == __name__ for r in records)
+
+def test_max_failures_single_call():
+    records = run_script(max_failures=1)
+    assert [r["outcome"] for r in records] == ["passed", "failed"]
+
+def test_max_failures_separate_calls():
+    records = run_script(max_failures=2, single_call=False)
+    # The second file is skipped after the failures in the first.
+    assert [r["outcome"] for r in records] == ["passed", "failed", "failed"]
+
+def test_results_file(tmpdir):
+    results_file = str(tmpdir.join("results.jsonl"))
+    run_script(results_file=results_file)
+    run_script(results_file=results_file, max_failures=1) # Appends to the file.
+    records = list(pytest_helper.read_results_files([results_file]))
+    assert [r["outcome"] for r in records] == ["passed", "failed", "failed", "passed",
+                                               "passed", "passed", "passed", "failed"]
+    assert all(r["module"] == __name__ and r["duration"] >= 0 for r in records)
+
+    # Merge with a copy which has an incomplete last line, as from a killed run.
+    partial_file = str(tmpdir.join("partial.jsonl"))
+    with open(results_file) as f:
+        partial_text = f.read()
+    with open(partial_file, "w") as f:
+        f.write(partial_text[:-10])
+    merged_file = str(tmpdir.join("merged.jsonl"))
+    num_records = pytest_helper.merge_results_files([results_file, partial_file],
+                                                    merged_file)
+    assert num_records == 15
+    assert list(pytest_helper.read_results_files([merged_file])) == (
+                                                        records + records[:-1])
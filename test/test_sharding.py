@@ -0,0 +1,137 @@
+# -*- coding: utf-8 -*-
+"""
+
+Tests of running the tests in shards with `script_run`, and of merging the
+results of the shards.
+
+"""
+
+from __future__ import print_function, division, absolute_import
+import os
+import json
+
+import pytest_helper
+pytest_helper.script_run(self_test=True, pytest_args="-v")
+pytest_helper.autoimport()
+
+from pytest_helper import sharding
+from pytest_helper import PytestHelperException
+
+TARGET_FILES = ["script_run_targets/failing_tests.py",
+                "script_run_targets/passing_tests.py"]
+
+def test_get_shard_settings(monkeypatch):
+    monkeypatch.delenv(sharding.SHARD_INDEX_ENV_VAR, raising=False)
+    monkeypatch.delenv(sharding.SHARD_COUNT_ENV_VAR, raising=False)
+    assert sharding.get_shard_settings() == (None, None)
+    assert sharding.get_shard_settings(1, 3) == (1, 3)
+    monkeypatch.setenv(sharding.SHARD_INDEX_ENV_VAR, "2")
+    monkeypatch.setenv(sharding.SHARD_COUNT_ENV_VAR, "4")
+    assert sharding.get_shard_settings() == (2, 4)
+    assert sharding.get_shard_settings(shard_index=0) == (0, 4)
+    with raises(PytestHelperException):
+        sharding.get_shard_settings(4, 4)
+    monkeypatch.delenv(sharding.SHARD_COUNT_ENV_VAR)
+    with raises(PytestHelperException):
+        sharding.get_shard_settings()
+
+def test_split_into_shards():
+    files = ["a", "b", "c", "d", "e"]
+    weights = [5.0, 1.0, 4.0, 2.0, 2.0]
+    shards = sharding.split_into_shards(files, weights, 2)
+    assert shards == [["a", "e"], ["b", "c", "d"]] # Totals 7 and 7.
+    assert sharding.split_into_shards(files, weights, 2) == shards # Deterministic.
+    assert sorted(sum(sharding.split_into_shards(files, weights, 3), [])) == files
+    assert sharding.split_into_shards(["a"], [1.0], 3) == [["a"], [], []]
+
+def test_get_weights(tmpdir):
+    for name, size in [("test_a.py", 100), ("test_b.py", 300), ("test_c.py", 50)]:
+        tmpdir.join(name).write("#" * size)
+    files = sharding.find_test_files([str(tmpdir)])
+    assert [os.path.basename(f) for f in files] == ["test_a.py", "test_b.py", "test_c.py"]
+    assert sharding.get_weights(files) == [100, 300, 50] # Sizes only.
+
+    durations_file = tmpdir.join("results.jsonl")
+    subdir = tmpdir.basename # Node IDs are relative to the pytest root directory.
+    records = [{"nodeid": subdir + "/test_a.py::test_1", "when": "call", "duration": 1.0},
+               {"nodeid": subdir + "/test_a.py::test_2", "when": "call", "duration": 3.0},
+               {"nodeid": subdir + "/test_a.py::test_2", "when": "call", "duration": 1.0},
+               {"nodeid": "test_c.py::test_1", "when": "call", "duration": 0.5}]
+    durations_file.write("".join(json.dumps(r) + "\n" for r in records))
+    weights = sharding.get_weights(files, str(durations_file))
+    assert weights[0] == 2.0 # Last record of each test used.
+    assert weights[2] == 0.5
+    assert weights[1] == 300 * 2.5 / 150 # Size times the average time per byte.
+
+def make_tree_with_ignored_dirs(tmpdir):
+    """Make a tree with one passing test and failing tests in directories
+    which pytest does not collect by default (or by its `python_files`)."""
+    tmpdir.join("pytest.ini").write("[pytest]\npython_files = test_*.py check_*.py\n")
+    tmpdir.join("test_a.py").write("def test_a():\n    pass\n")
+    tmpdir.join("check_e.py").write("def test_e():\n    pass\n")
+    tmpdir.join("helper_test.py").write("def test_h():\n    assert False\n")
+    for dirname in ["build", "node_modules", "venv", "env"]:
+        tmpdir.mkdir(dirname).join("test_b.py").write("def test_b():\n    assert False\n")
+    tmpdir.join("env", "pyvenv.cfg").write("home = /usr/bin\n") # A virtualenv.
+
+def test_find_test_files_like_pytest(tmpdir):
+    make_tree_with_ignored_dirs(tmpdir)
+    files = sharding.find_test_files([str(tmpdir)], ["-p", "no:cacheprovider"])
+    assert [os.path.basename(f) for f in files] == ["check_e.py", "test_a.py"]
+
+    records = []
+    exit_code = pytest_helper.script_run(str(tmpdir), always_run=True, exit=False,
+                      pytest_args="-q -p no:cacheprovider", on_result=records.append,
+                      shard_index=0, shard_count=1)
+    assert exit_code == 0
+    assert sorted(r["nodeid"].split("::")[-1] for r in records) == ["test_a", "test_e"]
+
+def test_find_test_files_without_importing(tmpdir):
+    marker = tmpdir.join("imported")
+    tmpdir.join("test_a.py").write("def test_a():\n    pass\n")
+    tmpdir.join("test_b.py").write("open({0!r}, 'w').close()\nimport no_such_mod_x\n"
+                                   .format(str(marker)))
+    tmpdir.join("test_c.py").write("def test_c():\n    pass\n")
+    files = sharding.find_test_files([str(tmpdir)], ["-x", "-p", "no:cacheprovider"])
+    assert [os.path.basename(f) for f in files] == ["test_a.py", "test_b.py", "test_c.py"]
+    assert not marker.exists()
+
+    with raises(PytestHelperException):
+        sharding.find_test_files([str(tmpdir)], ["--no-such-pytest-option"])
+
+def test_merge_exit_codes():
+    assert sharding.merge_exit_codes([0, 0]) == 0
+    assert sharding.merge_exit_codes([0, 1, 5]) == 1
+    assert sharding.merge_exit_codes([1, 2]) == 2
+    assert sharding.merge_exit_codes([0, 5]) == 0
+    assert sharding.merge_exit_codes([5, 5]) == 5
+    assert sharding.merge_exit_codes([4, 3, 1]) == 3
+
+def test_script_run_shards(tmpdir):
+    results_files = []
+    exit_codes = []
+    outcomes = []
+    for shard_index in range(3):
+        results_file = str(tmpdir.join("shard_{0}.jsonl".format(shard_index)))
+        records = []
+        exit_codes.append(pytest_helper.script_run(TARGET_FILES,
+                    pytest_args="-q -p no:cacheprovider", always_run=True,
+                    exit=False, on_result=records.append, results_file=results_file,
+                    shard_index=shard_index, shard_count=3))
+        results_files.append(results_file)
+        outcomes.append([r["outcome"] for r in records])
+    # The larger failing file goes to shard 0, and shard 2 gets nothing.
+    assert outcomes == [["passed", "failed", "failed", "passed"],
+                        ["passed", "passed"], []]
+    assert exit_codes == [1, 0, 5]
+
+    merged_file = str(tmpdir.join("merged.jsonl"))
+    num_records, exit_code = pytest_helper.merge_shard_results(results_files,
+                                                  merged_file, exit_codes)
+    assert (num_records, exit_code) == (6, 1)
+    # Rebalance using the recorded durations; the split stays deterministic.
+    shards = [sharding.select_shard([os.path.join(os.path.dirname(__file__), f)
+                                     for f in TARGET_FILES], i, 2, merged_file)
+              for i in range(2)]
+    assert sorted(sum(shards, [])) == sorted(os.path.join(os.path.dirname(__file__), f)
+                                             for f in TARGET_FILES)
@@ -0,0 +1,130 @@
+# -*- coding: utf-8 -*-
+"""
+
+Tests of the options of `sys_path` implemented in the `sys_path_tools` module.
+
+"""
+
+from __future__ import print_function, division, absolute_import
+import sys
+import os
+import importlib
+
+import pytest_helper
+pytest_helper.script_run(self_test=True, pytest_args="-v")
+pytest_helper.autoimport()
+
+from pytest_helper import sys_path_tools
+
+def make_modules(dirname, num_modules):
+    os.makedirs(os.path.join(dirname, "sub"))
+    filenames = [os.path.join(dirname, "sub", "__init__.py")] # A package.
+    open(filenames[0], "w").close()
+    for i in range(num_modules):
+        filename = os.path.join(dirname, "sub" if i % 2 else "", "mod_{0}.py".format(i))
+        with open(filename, "w") as f:
+            f.write("value = {0}\n".format(i))
+        filenames.append(filename)
+    return filenames
+
+def test_sys_path_warm(tmpdir, monkeypatch):
+    monkeypatch.setattr(sys, "dont_write_bytecode", False)
+    dirname = os.path.realpath(str(tmpdir))
+    filenames = make_modules(dirname, 4)
+    try:
+        pytest_helper.sys_path(dirname, warm=True)
+        assert dirname in sys.path
+        assert dirname in sys.path_importer_cache
+        for thread in sys_path_tools.warm_threads:
+            thread.join()
+    finally:
+        pytest_helper.restore_previous_sys_path()
+    assert dirname not in sys.path
+    for filename in filenames:
+        assert os.path.exists(importlib.util.cache_from_source(filename))
+
+def test_compile_dirs_subprocesses(tmpdir):
+    dirname = str(tmpdir)
+    num_modules = 3 * sys_path_tools.COMPILE_CHUNK_SIZE
+    filenames = make_modules(dirname, num_modules)
+    assert sys_path_tools.compile_dirs([dirname], max_workers=2) == num_modules + 1
+    for filename in filenames:
+        assert os.path.exists(importlib.util.cache_from_source(filename))
+
+def test_find_python_files(tmpdir):
+    tmpdir.join("top_mod.py").write("")
+    tmpdir.mkdir("pkg").join("__init__.py").write("")
+    tmpdir.join("pkg").mkdir("sub").join("__init__.py").write("")
+    tmpdir.join("pkg", "sub").join("mod.py").write("")
+    tmpdir.join("pkg").mkdir("data").join("not_imported.py").write("")
+    tmpdir.mkdir("scripts").join("not_imported.py").write("")
+    for dirname in ["build", "node_modules", "venv", "env"]:
+        tmpdir.mkdir(dirname).join("__init__.py").write("")
+    tmpdir.join("env", "pyvenv.cfg").write("home = /usr/bin\n") # A virtualenv.
+    filenames = sys_path_tools.find_python_files([str(tmpdir)])
+    assert sorted(os.path.relpath(f, str(tmpdir)) for f in filenames) == [
+                os.path.join("pkg", "__init__.py"), os.path.join("pkg", "sub", "__init__.py"),
+                os.path.join("pkg", "sub", "mod.py"), "top_mod.py"]
+
+def test_sys_path_meta_path(tmpdir):
+    dirname = os.path.realpath(str(tmpdir))
+    tmpdir.join("scoped_mod.py").write("value = 1\n")
+    tmpdir.join("scoped_pkg").mkdir().join("__init__.py").write("value = 2\n")
+    tmpdir.join("scoped_ns").mkdir().join("sub.py").write("value = 3\n")
+    finder = sys_path_tools.scoped_path_finder
+    names = ["scoped_mod", "scoped_pkg", "scoped_ns", "scoped_ns.sub", "scoped_new"]
+    try:
+        pytest_helper.sys_path(dirname, meta_path=True)
+        assert dirname not in sys.path
+        assert finder in sys.meta_path and dirname in finder.dirs
+        assert sorted(finder.index) == ["scoped_mod", "scoped_ns", "scoped_pkg"]
+        import scoped_mod, scoped_pkg, scoped_ns.sub
+        assert (scoped_mod.value, scoped_pkg.value, scoped_ns.sub.value) == (1, 2, 3)
+        assert finder.find_spec("scoped_missing") is None
+        with raises(ImportError):
+            import scoped_new
+        tmpdir.join("scoped_new.py").write("value = 4\n")
+        importlib.invalidate_caches() # Rebuilds the index.
+        import scoped_new
+        assert scoped_new.value == 4
+    finally:
+        pytest_helper.restore_previous_sys_path()
+        for name in names:
+            sys.modules.pop(name, None)
+    assert dirname not in finder.dirs
+    assert "scoped_mod" not in finder.index
+
+def test_analyze_sys_path(tmpdir, capsys):
+    dirname = os.path.realpath(str(tmpdir))
+    used_dir, unused_dir, empty_dir = [os.path.join(dirname, d)
+                                       for d in ("used", "unused", "empty")]
+    for d in (used_dir, unused_dir, empty_dir):
+        os.mkdir(d)
+    with open(os.path.join(used_dir, "analyzed_mod.py"), "w") as f:
+        f.write("value = 1\n")
+    with open(os.path.join(unused_dir, "never_imported_mod.py"), "w") as f:
+        f.write("value = 2\n")
+    missing_dir = os.path.join(dirname, "missing")
+    saved_sys_path = sys.path[:]
+    try:
+        pytest_helper.sys_path([used_dir, unused_dir, empty_dir])
+        sys.path.extend([missing_dir, used_dir + os.sep + "."]) # Duplicate of used_dir.
+        import analyzed_mod
+        assert sys_path_tools.import_miss_counter not in sys.meta_path
+        pytest_helper.count_import_misses()
+        with raises(ImportError):
+            import analyzed_missing_mod
+        report = pytest_helper.analyze_sys_path()
+    finally:
+        pytest_helper.count_import_misses(False)
+        sys.path[:] = saved_sys_path
+        sys.modules.pop("analyzed_mod", None)
+    assert [used_dir, used_dir + os.sep + "."] in report["duplicates"]
+    assert missing_dir in report["missing"]
+    assert empty_dir in report["empty"] and used_dir not in report["empty"]
+    assert report["unused"][unused_dir] == report["unused"][empty_dir] == __name__
+    assert used_dir not in report["unused"]
+    assert report["miss_cost"][used_dir] > 0 and missing_dir not in report["miss_cost"]
+    assert report["num_misses"] >= 1
+    out = capsys.readouterr().out
+    assert "unused, added by {0}: {1!r}".format(__name__, unused_dir) in out
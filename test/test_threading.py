@@ -0,0 +1,126 @@
+# -*- coding: utf-8 -*-
+"""
+
+Stress tests of calling the pytest-helper functions concurrently from many
+threads.  They check that the caches and `sys.path` stay consistent.
+
+"""
+
+from __future__ import print_function, division, absolute_import
+import sys
+import os
+import threading
+
+import pytest_helper
+pytest_helper.script_run(self_test=True, pytest_args="-v")
+pytest_helper.autoimport()
+
+from pytest_helper import config_file_handler, pytest_helper_main
+from pytest_helper.global_settings import NAME_OF_PYTEST_HELPER_PER_MODULE_INFO_DICT
+from pytest_helper.module_registry import module_info_registry
+
+NUM_THREADS = 32
+NUM_LOOPS = 50
+
+def run_in_threads(target):
+    """Run `target` in `NUM_THREADS` threads, all released at the same time, and
+    return the list of their results.  Any exception in a thread is re-raised."""
+    start = threading.Event()
+    results = [None] * NUM_THREADS
+    errors = []
+    def run(i):
+        try:
+            start.wait()
+            results[i] = target()
+        except Exception as e:
+            errors.append(e)
+    threads = [threading.Thread(target=run, args=(i,)) for i in range(NUM_THREADS)]
+    for t in threads: t.start()
+    start.set()
+    for t in threads: t.join()
+    if errors:
+        raise errors[0]
+    return results
+
+def test_concurrent_sys_path():
+    saved_sys_path = sys.path[:]
+    this_dir = os.path.dirname(os.path.realpath(__file__))
+    added_dirs = [os.path.join(this_dir, "test_config_files"),
+                  os.path.join(this_dir, "test_dir_tree"),
+                  os.path.dirname(this_dir)]
+    def target():
+        for i in range(NUM_LOOPS):
+            pytest_helper.sys_path(["test_config_files", "test_dir_tree"],
+                                   add_parent=True)
+        return True
+    try:
+        assert all(run_in_threads(target))
+        for d in added_dirs:
+            assert sys.path.count(d) == 1
+    finally:
+        sys.path[:] = saved_sys_path
+
+def test_concurrent_get_config(monkeypatch):
+    test_dir = os.path.join(os.path.dirname(os.path.realpath(__file__)),
+                            "test_config_files", "top_dir")
+    config_file_handler.config_dict_cache.clear()
+    config_file_handler.effective_config_cache.clear()
+    num_reads = {}
+    read_and_eval_config_file = config_file_handler.read_and_eval_config_file
+    def counting_read(filename):
+        num_reads[filename] = num_reads.get(filename, 0) + 1
+        return read_and_eval_config_file(filename)
+    monkeypatch.setattr(config_file_handler, "read_and_eval_config_file", counting_read)
+    modules = []
+    for i in range(NUM_THREADS):
+        mod = type(sys)("_pytest_helper_thread_test_mod_{0}".format(i))
+        modules.append(mod)
+    def target():
+        return [config_file_handler.get_config(mod, test_dir) for mod in modules]
+    results = run_in_threads(target)
+    # Every thread and module gets the same, single cached config for the dir.
+    config_dicts = set(id(d) for r in results for d in r)
+    assert len(config_dicts) == 1
+    # Each config file was read once, and the cached dicts are the ones used.
+    assert num_reads and all(n == 1 for n in num_reads.values())
+    for filename in num_reads:
+        dict_1 = config_file_handler.get_cached_config_dict(filename,
+                                        config_file_handler.get_mtime(filename))
+        dict_2 = config_file_handler.get_cached_config_dict(filename,
+                                        config_file_handler.get_mtime(filename))
+        assert dict_1 is dict_2
+    assert all(n == 1 for n in num_reads.values()) # Not read again.
+
+def test_concurrent_unindent(monkeypatch):
+    monkeypatch.setattr(pytest_helper_main, "UNINDENT_CACHE_MAX_CHARS", 2000)
+    monkeypatch.setattr(pytest_helper_main, "UNINDENT_CACHE_MAX_ENTRIES", 20)
+    pytest_helper_main.unindent_cache.clear()
+    pytest_helper_main.unindent_cache_chars[0] = 0
+    strings = ["\n    line {0}\n    next line\n".format(i) for i in range(10 * NUM_LOOPS)]
+    def target():
+        return [pytest_helper.unindent(4, s) for s in strings]
+    saved_interval = sys.getswitchinterval()
+    sys.setswitchinterval(1e-6) # Switch threads often, to expose races.
+    try:
+        results = run_in_threads(target)
+    finally:
+        sys.setswitchinterval(saved_interval)
+    assert all(r == results[0] for r in results)
+    # The char count matches the cached strings, and is within the limit.
+    cache = pytest_helper_main.unindent_cache
+    cached_chars = sum(len(key[1]) + len(value) for key, value in cache.items())
+    assert pytest_helper_main.unindent_cache_chars[0] == cached_chars <= 2000
+    assert len(cache) <= 20
+
+def test_concurrent_autoimport():
+    module_info_registry.discard(sys.modules[__name__])
+    # Also drop the info saved at collection, if pytest_helper.plugin is loaded.
+    globals().get(NAME_OF_PYTEST_HELPER_PER_MODULE_INFO_DICT, {}).pop("module_info", None)
+    def target():
+        for i in range(NUM_LOOPS):
+            pytest_helper.autoimport(noclobber=False)
+            pytest_helper_main.get_calling_module_info(level=1)
+        return module_info_registry.get_by_name(__name__)
+    results = run_in_threads(target)
+    assert all(r is results[0] for r in results)
+    assert unindent is pytest_helper.unindent